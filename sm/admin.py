@@ -6,6 +6,10 @@ import os
 
 from pymongo import MongoClient
 from sm.config import CONFIG, CONFIG_PATH
+from sm.managers.generic import HISTORY, SCHEDULER
+from sm.managers.so_manager import POOL
+from sm.metrics import REGISTRY, CONTENT_TYPE
+from sm.tracing import TRACER, MemoryExporter
 
 import sys
 sys.stdout = sys.stderr
@@ -124,6 +128,39 @@ def update(name):
         return 'not implemented', 500
 
 
+# curl -X GET $URL/stats/phases -> learned completion times of the lifecycle phases per service type
+@app.route('/stats/phases', methods=['GET'])
+def phase_stats():
+    return json.dumps(HISTORY.summary()), 200, {'Content-Type': 'application/json'}
+
+
+# curl -X GET $URL/stats/pool -> hit rate and refill latency of the warm pool of SO containers
+@app.route('/stats/pool', methods=['GET'])
+def pool_stats():
+    return json.dumps(POOL.stats()), 200, {'Content-Type': 'application/json'}
+
+
+# curl -X GET $URL/stats/tenants -> lifecycles in progress, queue waits and rejections per tenant
+@app.route('/stats/tenants', methods=['GET'])
+def tenant_stats():
+    return json.dumps(SCHEDULER.stats()), 200, {'Content-Type': 'application/json'}
+
+
+# curl -X GET $URL/metrics -> lifecycle phase durations, failures and time-to-provision for Prometheus
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return REGISTRY.exposition(), 200, {'Content-Type': CONTENT_TYPE}
+
+
+# curl -X GET $URL/traces/<trace id> -> finished spans of a trace, needs [tracing] exporter=memory
+@app.route('/traces', methods=['GET'])
+@app.route('/traces/<trace_id>', methods=['GET'])
+def traces(trace_id=None):
+    if not isinstance(TRACER.exporter, MemoryExporter):
+        return 'Spans are not kept in memory.', 404
+    return json.dumps(TRACER.exporter.spans(trace_id)), 200, {'Content-Type': 'application/json'}
+
+
 def server(host, port):
     all_ok = True
     if not cc_url:
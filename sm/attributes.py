@@ -0,0 +1,129 @@
+# Copyright 2014-2015 Zuercher Hochschule fuer Angewandte Wissenschaften
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Parsing and rendering of the X-OCCI-Attribute header of the OCCI text rendering:
+
+    X-OCCI-Attribute: occi.core.title="a title, with a comma", occi.compute.cores=2
+
+Values are either quoted strings, in which a quote or a backslash is escaped with a backslash, or unquoted
+numbers and booleans. Quoted values may contain commas and equal signs.
+"""
+
+import re
+
+__author__ = 'andy'
+
+# used for headers with escape sequences only
+ATTRIBUTE = re.compile(r'\s*([^\s=,][^=,]*?)\s*=\s*(?:"([^"\\]*(?:\\.[^"\\]*)*)"|([^,"]*?))\s*(?:,|$)')
+ESCAPE = re.compile(r'\\(.)')
+
+
+def text_value(text):
+    return text
+
+
+def typed_value(text):
+    # an unquoted value: a boolean, an integer or a float, otherwise the text itself
+    if text == 'true' or text == 'false':
+        return text == 'true'
+    try:
+        return int(text)
+    except ValueError:
+        try:
+            return float(text)
+        except ValueError:
+            return text
+
+
+def parse_attributes(header, typed=False):
+    """
+    :param header: the value of an X-OCCI-Attribute header, e.g. a="x, y", b=1
+    :param typed: if True, unquoted values are converted to booleans, integers or floats, otherwise all
+                  values are strings
+    :return: a dict of attribute name to value
+    :raises ValueError: if header is not a list of name=value pairs
+    """
+    convert = typed_value if typed else text_value
+    if '\\' in header:
+        return parse_escaped(header, convert)
+    # splitting at the quotes leaves the quoted values at the odd indexes, each preceded by the unquoted
+    # text ending with its name: [', a=', 'x, y', ', b=1, c=', 'z', '']
+    parts = header.split('"')
+    if len(parts) % 2 == 0:
+        raise ValueError('Unbalanced quotes in attributes: ' + header)
+    result = {}
+    for index, (segment, value) in enumerate(zip(parts[0::2], parts[1::2])):
+        head, comma, name = segment.rpartition(',')
+        if index > 0 and not comma:
+            raise ValueError('Expected a comma before ' + segment + ' in attributes: ' + header)
+        if head:
+            parse_unquoted(head, result, convert)
+        name = name.strip()
+        if name[-1:] != '=' or len(name) == 1:
+            raise ValueError('Expected name= before the quoted value "' + value + '" in attributes: ' + header)
+        result[name[:-1].rstrip()] = value
+    if parts[-1]:
+        tail = parts[-1].strip()
+        if len(parts) > 1:
+            if tail[:1] not in ('', ','):
+                raise ValueError('Expected a comma after a quoted value in attributes: ' + header)
+            tail = tail[1:]
+        parse_unquoted(tail, result, convert)
+    return result
+
+
+def parse_unquoted(text, result, convert):
+    for piece in text.split(','):
+        name, sep, value = piece.partition('=')
+        if sep:
+            name = name.strip()
+            if name == '':
+                raise ValueError('Missing attribute name in: ' + piece)
+            result[name] = convert(value.strip())
+        elif piece and not piece.isspace():
+            raise ValueError('Expected name=value instead of: ' + piece)
+
+
+def parse_escaped(header, convert):
+    result = {}
+    end = 0
+    for match in ATTRIBUTE.finditer(header):
+        if match.start() != end:
+            break
+        name, quoted, unquoted = match.groups()
+        result[name] = ESCAPE.sub(r'\1', quoted) if quoted is not None else convert(unquoted)
+        end = match.end()
+    if end != len(header):
+        raise ValueError('Invalid attributes: ' + header)
+    return result
+
+
+def render_value(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, long, float)):
+        return str(value)
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def render_attributes(attributes):
+    """
+    :param attributes: a dict or a list of (name, value) pairs; strings are quoted, numbers and booleans not
+    :return: the value of an X-OCCI-Attribute header
+    """
+    items = attributes.items() if hasattr(attributes, 'items') else attributes
+    return ', '.join(name + '=' + render_value(value) for name, value in items)
+
@@ -14,7 +14,12 @@
 #    under the License.
 
 
+from functools import partial
+import threading
+import time
+
 from occi.backend import KindBackend
+from occi.exceptions import HTTPError
 
 from sm.config import CONFIG
 manager = CONFIG.get('general', 'manager', default='so_manager')
@@ -22,6 +27,16 @@ manager = CONFIG.get('general', 'manager', default='so_manager')
 # generic manager stuff
 from sm.managers.generic import ServiceParameters
 from sm.managers.generic import AsychExe
+from sm.managers.generic import cancel
+from sm.managers.generic import ATTRIBUTES
+from sm.managers.generic import POLLER
+from sm.managers.generic import SCHEDULER
+from sm.managers.generic import TIME_TO_PROVISION
+from sm.managers.generic import CALLBACK_URL
+from sm.callbacks import new_token
+from sm.scheduler import QuotaExceeded
+from sm.watch import WATCHERS
+from sm.tracing import TRACER
 
 # depending on config, we import a different manager and ensure consistent names
 if manager == 'so_manager':
@@ -32,6 +47,8 @@ if manager == 'so_manager':
     from sm.managers.so_manager import RetrieveSO as Retrieve
     from sm.managers.so_manager import UpdateSO as Update
     from sm.managers.so_manager import DestroySO as Destroy
+    from sm.managers.so_manager import warm_up
+    from sm.managers.so_manager import prepare_batch
 elif manager == 'openbaton':
     from sm.managers.openbaton_manager import Init
     from sm.managers.openbaton_manager import Activate
@@ -40,10 +57,13 @@ elif manager == 'openbaton':
     from sm.managers.openbaton_manager import Retrieve
     from sm.managers.openbaton_manager import Update
     from sm.managers.openbaton_manager import Destroy
+    from sm.managers.openbaton_manager import warm_up
+    from sm.managers.openbaton_manager import prepare_batch
 
 __author__ = 'andy'
 
 # service state model:
+#  - queued (waiting for the tenant's turn, see sm.scheduler)
 #  - initialise
 #  - activate
 #  - deploy
@@ -54,6 +74,48 @@ __author__ = 'andy'
 #  - fail
 
 
+# the scheduler jobs of the instances whose lifecycle has not finished yet, by identifier
+JOBS = {}
+JOBS_LOCK = threading.Lock()
+
+
+def provisioned(service_type, started):
+    TIME_TO_PROVISION.observe(time.time() - started, service=service_type)
+
+
+def finished(identifier, job, span):
+    with JOBS_LOCK:
+        if JOBS.get(identifier) is job:
+            del JOBS[identifier]
+    job.release()
+    span.finish()
+
+
+def initialised(entity):
+    # True once Init has created the SO container of entity, see created()
+    return 'client_params' in (entity.extras or {})
+
+
+def created(entity, extras, params, trace):
+    # the SO container exists once Init has completed, the phases addressing it can be built now
+    trace.set_attribute('instance', entity.identifier)
+    entity.extras['client_params'] = params
+    if CALLBACK_URL != '':
+        # authenticates the callbacks of the SO of this instance, see sm.callbacks
+        entity.extras['callback_token'] = new_token()
+    return Activate(entity, extras)
+
+
+def client_params(entity):
+    # as supplied in the creation request of entity, see ServiceBackend.create
+    return (entity.extras or {}).get('client_params', {})
+
+
+def retrieved(entity, extras):
+    Retrieve(entity, extras).execute()
+    return entity.attributes
+
+
 class ServiceBackend(KindBackend):
     """
     Provides the basic functionality required to CRUD SOs
@@ -63,29 +125,79 @@ class ServiceBackend(KindBackend):
         # these are read from a location specified in sm,cfg, service_manager::service_params
         self.srv_prms = ServiceParameters()
 
+    def warm_up(self, kind):
+        # lets the manager prepare for instances of kind, e.g. pre-create SO containers
+        warm_up(kind)
+
+    def prepare_batch(self, extras):
+        # does the work common to a batch of instantiations once, see sm.bulk
+        prepare_batch(extras)
+
     def create(self, entity, extras):
         super(ServiceBackend, self).create(entity, extras)
-        extras['srv_prms'] = self.srv_prms
-        # create the SO container
-        Init(entity, extras).run()
-        # run background tasks
+        started = time.time()
+        params = dict(entity.attributes)
+        extras['srv_prms'] = self.srv_prms.for_instance(params)
+        # the instantiation counts against the tenant's quota until its lifecycle has finished
+        try:
+            job = SCHEDULER.admit(extras['tenant_name'])
+        except QuotaExceeded as e:
+            raise HTTPError(403, e.message)
+        # spans the whole lifecycle, the phases are its children
+        trace = TRACER.start_span('lifecycle', parent=extras.get('traceparent'),
+                                  attributes={'service': entity.kind.term, 'tenant': extras['tenant_name']})
+        extras['trace'] = trace
+        entity.attributes['mcn.service.state'] = 'queued'
+        # the registry shows an instance to its tenant only, also while it waits for its turn
+        entity.extras = {'tenant_name': extras['tenant_name']}
+        # run all phases once the tenant's turn has come, including the creation of the SO container, so that
+        # a tenant creating many instances at once takes no more than its share of the cloud controller
         # TODO this would be better using a workflow engine!
-        AsychExe([Activate(entity, extras), Deploy(entity, extras),
-                  Provision(entity, extras)], self.registry).start()
+        chain = AsychExe([Init(entity, extras), partial(created, entity, extras, params, trace),
+                          partial(Deploy, entity, extras), partial(Provision, entity, extras)], self.registry,
+                         on_finish=partial(finished, entity.identifier, job, trace),
+                         on_complete=partial(provisioned, entity.kind.term, started))
+        with JOBS_LOCK:
+            JOBS[entity.identifier] = job
+        job.run(chain.start)
 
     def retrieve(self, entity, extras):
         super(ServiceBackend, self).retrieve(entity, extras)
-        Retrieve(entity, extras).run()
+        if not initialised(entity):
+            # there is no SO to ask yet
+            return
+        # the SO is only asked once the cached attributes are outdated, or if the client asks for a fresh read
+        attributes = ATTRIBUTES.get(entity.identifier, partial(retrieved, entity, extras), submit=POLLER.submit,
+                                    fresh='no-cache' in extras.get('cache_control', ''))
+        entity.attributes.update(attributes)
+        WATCHERS.notify(entity.identifier)
 
     def delete(self, entity, extras):
         super(ServiceBackend, self).delete(entity, extras)
-        extras['srv_prms'] = self.srv_prms
+        if not initialised(entity):
+            # there is no SO container unless Init is creating it right now, otherwise the lifecycle is dropped
+            with JOBS_LOCK:
+                job = JOBS.get(entity.identifier)
+            if job is not None and not job.withdraw():
+                raise HTTPError(409, 'The SO of this instance is being created, it can be deleted once it is.')
+            cancel(entity.identifier)
+            ATTRIBUTES.discard(entity.identifier)
+            WATCHERS.notify(entity.identifier)
+            return
+        extras['srv_prms'] = self.srv_prms.for_instance(client_params(entity))
+        # stop a lifecycle still in progress before the SO goes away
+        cancel(entity.identifier)
+        ATTRIBUTES.discard(entity.identifier)
+        WATCHERS.notify(entity.identifier)
         AsychExe([Destroy(entity, extras)]).start()
 
     def update(self, old, new, extras):
         super(ServiceBackend, self).update(old, new, extras)
-        extras['srv_prms'] = self.srv_prms
-        Update(old, extras, new).run()
+        if not initialised(old):
+            raise HTTPError(409, 'The SO of this instance has not been created yet.')
+        extras['srv_prms'] = self.srv_prms.for_instance(client_params(old))
+        # the update is polled until the stack has completed it, like the phases of a create
+        AsychExe([Update(old, extras, new)], self.registry).start()
 
     def replace(self, old, new, extras):
         raise NotImplementedError()
@@ -0,0 +1,187 @@
+# Copyright 2014-2015 Zuercher Hochschule fuer Angewandte Wissenschaften
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+__author__ = 'andy'
+
+import Queue
+import threading
+import time
+
+from occi import workflow
+from occi.core_model import Resource
+from occi.exceptions import HTTPError
+
+from sm.config import CONFIG
+from sm.log import LOG
+from sm.poller import ReadinessPoller
+
+# requests to this path are handled as a batch, see MApplication.__call__
+BULK_PATH = '/bulk/'
+# marks a result that was not available in time
+MISSING = object()
+# the threads shared by all batches, see run_bounded
+WORKERS = ReadinessPoller(workers=int(CONFIG.get('bulk', 'workers', 16)))
+
+
+def run_bounded(func, items, parallelism, timeout=None):
+    """
+    Calls func for each of items, at most parallelism of them at the same time, on the WORKERS shared by all
+    batches. With a timeout, the results not available after timeout seconds are returned as MISSING; items
+    not started by then are not started anymore and calls still running carry on and keep their worker until
+    they return. Their results are dropped, whatever they have cached is there for the next request though,
+    e.g. the attributes retrieved from a SO, see ServiceBackend.retrieve.
+
+    :return: the results of func, in the order of items
+    """
+    deadline = time.time() + timeout if timeout is not None else None
+    results = [MISSING] * len(items)
+    pending = [len(items)]
+    cond = threading.Condition()
+    queue = Queue.Queue()
+    for index, item in enumerate(items):
+        queue.put((index, item))
+
+    def work():
+        while deadline is None or time.time() < deadline:
+            try:
+                index, item = queue.get_nowait()
+            except Queue.Empty:
+                return
+            result = MISSING
+            try:
+                result = func(item)
+            except Exception as e:
+                LOG.error('Could not handle an item of a batch: ' + e.__repr__())
+            finally:
+                with cond:
+                    results[index] = result
+                    pending[0] -= 1
+                    cond.notify_all()
+
+    for _ in range(min(parallelism, len(items))):
+        WORKERS.submit(work)
+    with cond:
+        while pending[0] > 0:
+            if deadline is None:
+                # waits in steps as a wait without a timeout cannot be interrupted
+                cond.wait(1)
+            elif deadline > time.time():
+                cond.wait(deadline - time.time())
+            else:
+                break
+        return list(results)
+
+
+class BulkHandler(object):
+    """
+    Creates, lists or deletes many service instances of kind in one request. The caller has authenticated
+    the request once for the whole batch, work which is common to all instances is done once by the
+    backend (see ServiceBackend.prepare_batch) and the instances are then handled by at most parallelism
+    of the WORKERS at a time. Creating an instance only queues its lifecycle, SO container included, with the
+    scheduler (see ServiceBackend.create), so a batch gets the same share of the cloud controller as single
+    creates and is subject to the tenant's quota: the instances beyond it are reported with status 403.
+
+    POST expects a JSON document listing the instances to create:
+      {"instances": [{"attributes": {"name": "value", ...}}, ...]}
+    DELETE removes all instances of the tenant. Both return the status of each instance:
+      {"instances": [{"status": 201, "location": "/kind/id"}, {"status": 500, "error": "..."}, ...]}
+    GET retrieves all instances of the tenant from their SOs within deadline seconds. An instance whose
+    SO did not answer in time, or failed to, is listed with the attributes last stored in the registry:
+      {"instances": [{"status": 200, "location": "/kind/id", "attributes": {...}, "stale": false}, ...]}
+    """
+
+    def __init__(self, registry, kind, extras, parallelism=8, max_items=500, deadline=10):
+        self.registry = registry
+        self.kind = kind
+        self.extras = extras
+        self.parallelism = parallelism
+        self.max_items = max_items
+        self.deadline = deadline
+
+    def create(self, doc):
+        specs = self.__specs(doc)
+        LOG.info('Creating ' + str(len(specs)) + ' instances of ' + self.kind.term + ' in one batch.')
+        self.__prepare()
+        return {'instances': run_bounded(self.__create, specs, self.parallelism)}
+
+    def retrieve(self):
+        entities = self.__entities()
+        results = run_bounded(self.__retrieve, entities, self.parallelism, timeout=self.deadline)
+        instances = []
+        for entity, result in zip(entities, results):
+            if result is MISSING:
+                LOG.warn('The SO of ' + entity.identifier + ' did not answer within ' + str(self.deadline) + 's.')
+                result = {'status': 200, 'location': entity.identifier, 'attributes': dict(entity.attributes),
+                          'stale': True}
+            instances.append(result)
+        return {'instances': instances}
+
+    def delete(self):
+        entities = self.__entities()
+        LOG.info('Deleting ' + str(len(entities)) + ' instances of ' + self.kind.term + ' of tenant ' +
+                 self.extras['tenant_name'] + ' in one batch.')
+        return {'instances': run_bounded(self.__delete, entities, self.parallelism)}
+
+    def __entities(self):
+        return [entity for entity in self.registry.get_resources(self.extras) if entity.kind == self.kind]
+
+    def __specs(self, doc):
+        specs = doc.get('instances') if isinstance(doc, dict) else None
+        if not isinstance(specs, list) or not all(isinstance(spec, dict) for spec in specs):
+            raise HTTPError(400, 'Expected a list of instance specifications under "instances".')
+        if len(specs) > self.max_items:
+            raise HTTPError(400, 'At most ' + str(self.max_items) + ' instances can be created in one batch.')
+        return specs
+
+    def __prepare(self):
+        backend = self.registry.get_backend(self.kind, self.extras)
+        if hasattr(backend, 'prepare_batch'):
+            try:
+                backend.prepare_batch(self.extras)
+            except Exception as e:
+                # not fatal, each instance then does the preparation itself
+                LOG.warn('Could not prepare the batch: ' + e.__repr__())
+
+    def __create(self, spec):
+        entity = Resource(None, self.kind, [])
+        for name, value in spec.get('attributes', {}).items():
+            entity.attributes[str(name)] = value if isinstance(value, basestring) else str(value)
+        try:
+            workflow.create_entity(workflow.create_id(self.kind), entity, self.registry, self.extras.copy())
+        except HTTPError as e:
+            return {'status': e.code, 'error': e.message}
+        except Exception as e:
+            LOG.error('Could not create instance in batch: ' + e.__repr__())
+            return {'status': 500, 'error': e.__repr__()}
+        return {'status': 201, 'location': entity.identifier}
+
+    def __retrieve(self, entity):
+        try:
+            workflow.retrieve_entity(entity, self.registry, self.extras.copy())
+        except Exception as e:
+            LOG.error('Could not retrieve ' + entity.identifier + ' in batch: ' + e.__repr__())
+            return {'status': 200, 'location': entity.identifier, 'attributes': dict(entity.attributes),
+                    'stale': True, 'error': e.__repr__()}
+        return {'status': 200, 'location': entity.identifier, 'attributes': dict(entity.attributes), 'stale': False}
+
+    def __delete(self, entity):
+        try:
+            workflow.delete_entity(entity, self.registry, self.extras.copy())
+        except HTTPError as e:
+            return {'status': e.code, 'location': entity.identifier, 'error': e.message}
+        except Exception as e:
+            LOG.error('Could not delete ' + entity.identifier + ' in batch: ' + e.__repr__())
+            return {'status': 500, 'location': entity.identifier, 'error': e.__repr__()}
+        return {'status': 200, 'location': entity.identifier}
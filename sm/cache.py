@@ -0,0 +1,132 @@
+# Copyright 2014-2015 Zuercher Hochschule fuer Angewandte Wissenschaften
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Cache of the attributes of service instances, as last retrieved from their SO.
+
+Attributes younger than ttl seconds are served as they are. Up to stale seconds beyond that they are still
+served, while one refresh per instance runs in the background (stale-while-revalidate); older attributes are
+retrieved before being served. Each invalidation increments the generation of the instance, so that a refresh
+started before the invalidation cannot store attributes of the previous generation.
+"""
+
+import logging
+import threading
+import time
+
+__author__ = 'andy'
+
+LOG = logging.getLogger(__name__)
+
+
+class Entry(object):
+
+    def __init__(self, attributes, generation):
+        self.attributes = attributes
+        self.generation = generation
+        self.fetched = time.time()
+        self.refreshing = False
+
+
+class AttributeCache(object):
+    """
+    Attributes by instance key. A ttl of 0 disables the cache, every get() then loads the attributes.
+    """
+
+    def __init__(self, ttl=0, stale=0):
+        self.ttl = ttl
+        self.stale = stale
+        self.entries = {}
+        self.generations = {}
+        self.lock = threading.Lock()
+
+    def get(self, key, load, submit=None, fresh=False):
+        """
+        :param load: callable returning the current attributes of key, e.g. by asking the SO
+        :param submit: submit(func, *args) runs func in the background, refreshes are run inline if None
+        :param fresh: if True, cached attributes are not served but replaced
+        :return: a copy of the attributes of key
+        """
+        if self.ttl <= 0:
+            return load()
+        with self.lock:
+            entry = self.entries.get(key)
+            generation = self.generations.get(key, 0)
+            age = time.time() - entry.fetched if entry is not None else None
+            if not fresh and entry is not None and entry.generation == generation:
+                if age <= self.ttl:
+                    return dict(entry.attributes)
+                if age <= self.ttl + self.stale:
+                    revalidate = not entry.refreshing
+                    entry.refreshing = True
+                    attributes = dict(entry.attributes)
+                else:
+                    attributes = None
+            else:
+                attributes = None
+        if attributes is None:
+            return self.__load(key, load, generation)
+        if revalidate:
+            if submit is None:
+                self.__refresh(key, load, generation)
+            else:
+                submit(self.__refresh, key, load, generation)
+        return attributes
+
+    def peek(self, key):
+        """
+        :return: a copy of the attributes of key if they may still be served, None otherwise; never loads nor
+        refreshes them
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry.generation != self.generations.get(key, 0):
+                return None
+            if time.time() - entry.fetched > self.ttl + self.stale:
+                return None
+            return dict(entry.attributes)
+
+    def invalidate(self, key):
+        # e.g. on a lifecycle transition, the attributes cached for key are not served anymore
+        with self.lock:
+            self.generations[key] = self.generations.get(key, 0) + 1
+            self.entries.pop(key, None)
+
+    def discard(self, key):
+        # once the instance is gone
+        with self.lock:
+            self.generations.pop(key, None)
+            self.entries.pop(key, None)
+
+    def size(self):
+        with self.lock:
+            return len(self.entries)
+
+    def __load(self, key, load, generation):
+        attributes = load()
+        with self.lock:
+            if self.generations.get(key, 0) == generation:
+                self.entries[key] = Entry(dict(attributes), generation)
+        return dict(attributes)
+
+    def __refresh(self, key, load, generation):
+        try:
+            self.__load(key, load, generation)
+        except Exception as e:
+            LOG.error('Could not refresh the attributes of ' + key + ': ' + e.__repr__())
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is not None:
+                    entry.refreshing = False
@@ -0,0 +1,128 @@
+# Copyright 2014-2015 Zuercher Hochschule fuer Angewandte Wissenschaften
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Callbacks from service orchestrators to the SM.
+
+The SM passes the SO of an instance a callback URL and a token of that instance in the X-OCCI-Attribute header
+of the activate phase (mcn.sm.callback, mcn.sm.callback.token). Once a phase has completed, the SO reports it:
+
+    POST /callback/<instance path>
+    X-Callback-Token: <token>
+    X-OCCI-Attribute: mcn.sm.phase="deploy", occi.mcn.stack.state="CREATE_COMPLETE"
+
+The SM then issues the pending readiness checks of the instance right away instead of at their due time. The
+checks still decide whether a phase has completed, so a callback only shortens the wait; polling goes on at a
+slow pace in case a callback is lost.
+"""
+
+import hmac
+import logging
+import os
+import urllib2
+
+from sm.attributes import parse_attributes, render_attributes
+
+__author__ = 'andy'
+
+LOG = logging.getLogger(__name__)
+
+CALLBACK_PATH = '/callback'
+TOKEN_HEADER = 'X-Callback-Token'
+# the attributes sent to the SO
+URL = 'mcn.sm.callback'
+TOKEN = 'mcn.sm.callback.token'
+# the attribute naming the completed phase in a callback
+PHASE = 'mcn.sm.phase'
+
+
+def new_token():
+    return os.urandom(16).encode('hex')
+
+
+def callback_url(base, identifier):
+    """
+    :param base: the URL at which SOs reach the SM, e.g. http://sm.example.com:8888
+    :param identifier: the path of the instance, e.g. /epc/1234
+    """
+    return base.rstrip('/') + CALLBACK_PATH + identifier
+
+
+def authentic(expected, token):
+    # compared in constant time, an instance without a token accepts no callbacks
+    if not expected or not token:
+        return False
+    return hmac.compare_digest(str(expected), str(token))
+
+
+def parse_callback(header):
+    """
+    :param header: the X-OCCI-Attribute header of a callback
+    :return: (phase, attributes)
+    :raises ValueError: if header is malformed or names no phase
+    """
+    attributes = parse_attributes(header)
+    phase = attributes.pop(PHASE, '')
+    if phase == '':
+        raise ValueError('No ' + PHASE + ' attribute in the callback.')
+    return phase, attributes
+
+
+class Callback(object):
+    """
+    The callback of one instance, as seen by its SO.
+    """
+
+    def __init__(self, url, token, timeout=5):
+        self.url = url
+        self.token = token
+        self.timeout = timeout
+
+    def attributes(self):
+        # as sent to the SO
+        return {URL: self.url, TOKEN: self.token}
+
+    def emit(self, phase, attributes=None):
+        """
+        Reports the completion of phase to the SM. A callback that cannot be delivered is only logged as the SM
+        polls for the state anyway.
+
+        :param attributes: further attributes, e.g. occi.mcn.stack.state
+        :return: True if the SM accepted the callback
+        """
+        attributes = dict(attributes or {})
+        attributes[PHASE] = phase
+        request = urllib2.Request(self.url, data='', headers={
+            TOKEN_HEADER: self.token,
+            'Content-Type': 'text/occi',
+            'X-OCCI-Attribute': render_attributes(attributes)})
+        try:
+            urllib2.urlopen(request, timeout=self.timeout).close()
+            return True
+        except Exception as e:
+            LOG.warn('Could not deliver the ' + phase + ' callback to ' + self.url + ': ' + e.__repr__())
+            return False
+
+
+def from_attributes(attributes):
+    """
+    :param attributes: the attributes received by the SO in the activate phase
+    :return: the Callback the SM offered, None if it offered none
+    """
+    url = attributes.get(URL, '')
+    token = attributes.get(TOKEN, '')
+    if url == '' or token == '':
+        return None
+    return Callback(url, token)
@@ -26,7 +26,7 @@ class DefaultConfigParser(ConfigParser.ConfigParser):
     def get(self, section, option, default='', raw=False, vars=None):
         try:
             value = ConfigParser.ConfigParser.get(self, section, option, raw, vars)
-        except ConfigParser.NoOptionError:
+        except (ConfigParser.NoOptionError, ConfigParser.NoSectionError):
             value = default
         return value
 
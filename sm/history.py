@@ -0,0 +1,88 @@
+# Copyright 2014-2015 Zuercher Hochschule fuer Angewandte Wissenschaften
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Historical completion times of lifecycle phases, per service type.
+
+These are used to issue the first readiness check of a phase close to the time the phase usually needs to
+complete, instead of polling from the start. A check only tells that a phase completed at some time since the
+previous check, so a sample is the middle of that interval; a phase found complete by the first check completed
+between the start and that check, which lets the expected time come down when a phase gets faster.
+"""
+
+from collections import deque
+import threading
+
+__author__ = 'andy'
+
+
+class PhaseHistory(object):
+    """
+    Keeps the last `size` completion times (in seconds) for each (service type, phase) pair.
+    """
+
+    def __init__(self, size=100, quantile=0.5):
+        self.size = size
+        self.quantile = quantile
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def record(self, service_type, phase, seconds):
+        with self.lock:
+            key = (service_type, phase)
+            if key not in self.samples:
+                self.samples[key] = deque(maxlen=self.size)
+            self.samples[key].append(seconds)
+
+    def record_between(self, service_type, phase, earliest, latest):
+        """
+        Records a phase known to have completed between earliest and latest seconds after its start, e.g. the
+        last check that found it incomplete and the one that found it complete.
+        """
+        self.record(service_type, phase, (earliest + latest) / 2.0)
+
+    def expected(self, service_type, phase):
+        """
+        :return: the expected completion time of the phase, 0 if nothing has been recorded yet
+        """
+        with self.lock:
+            samples = sorted(self.samples.get((service_type, phase), []))
+        if len(samples) == 0:
+            return 0
+        return percentile(samples, self.quantile)
+
+    def summary(self):
+        """
+        :return: the learned distributions, as {service type: {phase: {count, mean, min, p50, p90, max}}}
+        """
+        with self.lock:
+            items = [(key, sorted(samples)) for key, samples in self.samples.items()]
+        result = {}
+        for (service_type, phase), samples in items:
+            result.setdefault(service_type, {})[phase] = {
+                'count': len(samples),
+                'mean': sum(samples) / len(samples),
+                'min': samples[0],
+                'p50': percentile(samples, 0.5),
+                'p90': percentile(samples, 0.9),
+                'max': samples[-1],
+                'expected': percentile(samples, self.quantile)
+            }
+        return result
+
+
+def percentile(samples, quantile):
+    # samples must be sorted and non-empty
+    return samples[min(len(samples) - 1, int(quantile * len(samples)))]
@@ -0,0 +1,122 @@
+# Copyright 2014-2015 Zuercher Hochschule fuer Angewandte Wissenschaften
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Links from a composed service instance to the instances of the services it is composed of.
+
+A link is identified by its source and the endpoint of its target instance, so that linking the same
+instances again, e.g. on every retrieve, reuses the link instead of adding another one.
+"""
+
+import uuid
+
+from occi.core_model import Link, Resource
+
+__author__ = 'andy'
+
+ENDPOINT = 'mcn.sm.endpoint'
+
+
+def link_key(source, endpoint):
+    name = source.identifier + ' ' + endpoint
+    return '/link/' + str(uuid.uuid5(uuid.NAMESPACE_URL, name.encode('utf-8')))
+
+
+def endpoint_of(link):
+    target = link.target
+    if isinstance(target, Resource):
+        return target.attributes.get(ENDPOINT, target.identifier)
+    return target
+
+
+def link_instances(registry, source, endpoints):
+    """
+    Links source to the service instances at endpoints (e.g. http://host:port/epc/<id>), adding to the
+    registry only the targets and links which do not exist yet. Links to instances no longer listed in
+    endpoints are removed, along with their target unless another link still points to it.
+
+    :return: the number of links added
+    """
+    existing = set(link.identifier for link in source.links)
+    keys = set()
+    added = 0
+    for endpoint in endpoints:
+        key = link_key(source, endpoint)
+        keys.add(key)
+        if key in existing:
+            continue
+        compos = endpoint.split('/')
+        target_key = '/' + compos[3] + '/' + compos[4]
+        target = Resource(target_key, Resource.kind, [])
+        target.attributes[ENDPOINT] = endpoint
+        registry.add_resource(target_key, target, None)
+
+        link = Link(key, Link.kind, [], source, target)
+        registry.add_resource(key, link, None)
+        source.links.append(link)
+        existing.add(key)
+        added += 1
+    unlink(registry, source, [link for link in source.links if link.identifier not in keys])
+    return added
+
+
+def unlink(registry, source, links):
+    # only the links added by link_instances are removed, and their targets once nothing links to them anymore
+    for link in links:
+        endpoint = endpoint_of(link)
+        if not isinstance(link, Link) or not isinstance(endpoint, basestring) or \
+                link.identifier != link_key(source, endpoint):
+            continue
+        source.links.remove(link)
+        if link.identifier in registry.resources:
+            registry.delete_resource(link.identifier, None)
+        target = registry.resources.get(getattr(link.target, 'identifier', None))
+        if target is None or target.attributes.get(ENDPOINT) != endpoint:
+            continue
+        if not any(isinstance(item, Link) and endpoint_of(item) == endpoint for item in registry.resources.values()):
+            registry.delete_resource(target.identifier, None)
+
+
+def compact(resources):
+    """
+    Removes duplicate links, i.e. links with the same source and target endpoint, from resources (a dict of
+    identifier to entity) and from the links of their source. The remaining links are stored under their
+    key, see link_key().
+
+    :return: the number of links removed
+    """
+    removed = 0
+    for source in resources.values():
+        if not isinstance(source, Resource) or len(source.links) == 0:
+            continue
+        links = []
+        keys = set()
+        for link in source.links:
+            endpoint = endpoint_of(link)
+            if not isinstance(link, Link) or not isinstance(endpoint, basestring):
+                links.append(link)
+                continue
+            key = link_key(source, endpoint)
+            if isinstance(resources.get(link.identifier), Link):
+                del resources[link.identifier]
+            if key in keys:
+                removed += 1
+                continue
+            keys.add(key)
+            link.identifier = key
+            resources[key] = link
+            links.append(link)
+        source.links = links
+    return removed
@@ -17,72 +17,140 @@ __author__ = 'merne'
 
 from sm.log import LOG
 import json
+from functools import partial
+import threading
+import time
+from sm.attributes import render_attributes, render_value
+from sm.cache import AttributeCache
+from sm.callbacks import Callback, callback_url
 from sm.config import CONFIG
-from threading import Thread
+from sm.history import PhaseHistory
+from sm.metrics import REGISTRY
+from sm.poller import ReadinessPoller
+from sm.scheduler import FairScheduler
+from sm.tracing import TRACER, exporter
+from sm.watch import WATCHERS
 
+# all readiness checks of all instances share this poller, see sm.poller
+POLLER = ReadinessPoller(workers=int(CONFIG.get('lifecycle', 'poll_workers', 4)))
+# completion times of the lifecycle phases, used to schedule the first readiness check
+HISTORY = PhaseHistory(size=int(CONFIG.get('lifecycle', 'history_size', 100)),
+                       quantile=float(CONFIG.get('lifecycle', 'first_check_quantile', 0.5)))
+BACKOFF = float(CONFIG.get('lifecycle', 'poll_backoff', 2))
+MAX_INTERVAL = float(CONFIG.get('lifecycle', 'max_poll_interval', 60))
+# attributes of the instances as last retrieved from their SOs, invalidated as phases begin and end
+ATTRIBUTES = AttributeCache(ttl=float(CONFIG.get('retrieve_cache', 'ttl', 0)),
+                            stale=float(CONFIG.get('retrieve_cache', 'stale', 0)))
+# the URL at which SOs reach this SM to report completed phases, see sm.callbacks; empty if not offered
+CALLBACK_URL = CONFIG.get('callbacks', 'url', '')
+# polling only covers for lost callbacks of the phases that are reported
+FALLBACK_INTERVAL = float(CONFIG.get('callbacks', 'fallback_interval', 60))
+# identifier -> time at which its SO last reported a completed phase, the completion time of the phase waited for
+REPORTED = {}
 
 
-class ServiceParameters:
-    def __init__(self):
-        self.service_params = {}
-        service_params_file_path = CONFIG.get('service_manager', 'service_params', '')
-        if len(service_params_file_path) > 0:
-            try:
-                with open(service_params_file_path) as svc_params_content:
-                    self.service_params = json.load(svc_params_content)
-                    svc_params_content.close()
-            except ValueError:  # as e:
-                LOG.error("Invalid JSON sent as service config file")
-            except IOError:  # as e:
-                LOG.error('Cannot find the specified parameters file: ' + service_params_file_path)
-        else:
-            LOG.warn("No service parameters file found in config file, setting internal params to empty.")
+def tenant_overrides():
+    # options of [tenants] named <limit>.<tenant>, e.g. weight.acme=2, set a limit for one tenant
+    overrides = {}
+    if CONFIG.has_section('tenants'):
+        for option, value in CONFIG.items('tenants'):
+            name, _, tenant = option.partition('.')
+            if tenant != '' and name in ('weight', 'max_concurrent', 'max_pending'):
+                overrides.setdefault(tenant, {})[name] = float(value) if name == 'weight' else int(value)
+    return overrides
+
+# admits the lifecycles of new instances fairly across tenants, see sm.scheduler
+SCHEDULER = FairScheduler(slots=int(CONFIG.get('tenants', 'slots', 0)),
+                          weight=float(CONFIG.get('tenants', 'weight', 1)),
+                          max_concurrent=int(CONFIG.get('tenants', 'max_concurrent', 0)),
+                          max_pending=int(CONFIG.get('tenants', 'max_pending', 0)),
+                          overrides=tenant_overrides())
+
+# fed by Task and AsychExe, exported by the admin app on /metrics
+PHASE_DURATION = REGISTRY.histogram('sm_phase_duration_seconds', 'Time from the start of a lifecycle phase until '
+                                    'it has completed.', ['service', 'phase'])
+PHASE_FAILURES = REGISTRY.counter('sm_phase_failures_total', 'Lifecycle phases that failed.', ['service', 'phase'])
+PHASES_IN_FLIGHT = REGISTRY.gauge('sm_phases_in_flight', 'Lifecycle phases started and not yet completed.',
+                                  ['service', 'phase'])
+PHASE_WAIT = REGISTRY.histogram('sm_phase_wait_seconds', 'Time waited for a lifecycle phase to become ready or '
+                                'done.', ['service', 'phase', 'stage'])
+TIME_TO_PROVISION = REGISTRY.histogram('sm_time_to_provision_seconds', 'Time from the creation request of an '
+                                       'instance until it is provisioned.', ['service'])
+# finished spans of the lifecycles are kept in memory, written to a file or dropped, see sm.tracing
+TRACER.exporter = exporter(CONFIG.get('tracing', 'exporter', 'none'), CONFIG.get('tracing', 'file', 'sm_traces.json'))
+
+# running AsychExe chains by the identifier of their entity
+CHAINS = {}
+CHAINS_LOCK = threading.Lock()
+
+
+def parameter_fragment(param):
+    # name=value as sent in the X-OCCI-Attribute header, string values are quoted
+    if param['type'] == 'string':
+        return param['name'] + '=' + render_value(param['value'])
+    return param['name'] + '=' + str(param['value'])
+
+
+def client_fragments(params):
+    # user supplied parameters of the instantiation request of a service, quoted values are strings
+    fragments = []
+    for k, v in params.items():
+        param_type = 'number'
+        if (v.startswith('"') or v.startswith('\'')) and (v.endswith('"') or v.endswith('\'')):
+            param_type = 'string'
+            v = v[1:-1]
+        fragments.append(parameter_fragment({'name': k, 'value': v, 'type': param_type}))
+    return tuple(fragments)
+
+
+class InstanceParameters:
+    """
+    The parameters sent to the SO of one instance: the internal parameters of each lifecycle phase followed by
+    the client supplied parameters of this instance. Both are compiled to header fragments once and not
+    changed afterwards, so a header is a join of the two.
+    """
+    def __init__(self, phases, client=()):
+        self.phases = phases
+        self.client = client
 
     def service_parameters(self, state='', content_type='text/occi'):
         # takes the internal parameters defined for the lifecycle phase...
         #       and combines them with the client supplied parameters
         if content_type == 'text/occi':
-            params = []
-            # get the state specific internal parameters
-            try:
-                params = self.service_params[state]
-            except KeyError:  # as err:
+            if state not in self.phases:
                 LOG.warn('The requested states parameters are not available: "' + state + '"')
-
-            # get the client supplied parameters if any
-            try:
-                for param in self.service_params['client_params']:
-                    params.append(param)
-            except KeyError:  # as err:
-                LOG.info('No client params')
-
-            header = ''
-            for param in params:
-                if param['type'] == 'string':
-                    value = '"' + param['value'] + '"'
-                else:
-                    value = str(param['value'])
-
-                header = header + param['name'] + '=' + value + ', '
-
-            return header[0:-2]
+            return ', '.join(self.phases.get(state, ()) + self.client)
         else:
             LOG.error('Content type not supported: ' + content_type)
 
-    def add_client_params(self, params={}):
-        # adds user supplied parameters from the instantiation request of a service
-        client_params = []
 
-        for k, v in params.items():
-            param_type = 'number'
-            if (v.startswith('"') or v.startswith('\'')) and (v.endswith('"') or v.endswith('\'')):
-                param_type = 'string'
-                v = v[1:-1]
-            param = {'name': k, 'value': v, 'type': param_type}
-
-            client_params.append(param)
+class ServiceParameters(InstanceParameters):
+    """
+    The internal parameters of the service, read from the file set in service_manager::service_params.
+    """
+    def __init__(self, path=None):
+        service_params = {}
+        service_params_file_path = CONFIG.get('service_manager', 'service_params', '') if path is None else path
+        if len(service_params_file_path) > 0:
+            try:
+                with open(service_params_file_path) as svc_params_content:
+                    service_params = json.load(svc_params_content)
+                    svc_params_content.close()
+            except ValueError:  # as e:
+                LOG.error("Invalid JSON sent as service config file")
+            except IOError:  # as e:
+                LOG.error('Cannot find the specified parameters file: ' + service_params_file_path)
+        else:
+            LOG.warn("No service parameters file found in config file, setting internal params to empty.")
+        InstanceParameters.__init__(self, dict((state, tuple(parameter_fragment(param) for param in params))
+                                               for state, params in service_params.items()))
 
-        self.service_params['client_params'] = client_params
+    def for_instance(self, params=None):
+        """
+        :param params: the client supplied parameters of an instance, as in the attributes of its creation request
+        :return: the parameters to send to the SO of that instance
+        """
+        return InstanceParameters(self.phases, client_fragments(params or {}))
 
 
 if __name__ == '__main__':
@@ -91,39 +159,271 @@ if __name__ == '__main__':
         'test': '1',
         'test.test': '"astring"'
     }
-    sp.add_client_params(cp)
 
-    p = sp.service_parameters('initialise')
+    p = sp.for_instance(cp).service_parameters('initialise')
     print p
 
 
-class AsychExe(Thread):
+def callback_attributes(entity):
+    """
+    :return: the X-OCCI-Attribute fragment passing the callback of entity to its SO, empty if it has none
+    """
+    token = (entity.extras or {}).get('callback_token', '')
+    if CALLBACK_URL == '' or token == '':
+        return ''
+    return render_attributes(Callback(callback_url(CALLBACK_URL, entity.identifier), token).attributes())
+
+
+def reported(identifier):
+    """
+    The SO of the instance reported a completed phase: its pending checks are issued now.
+
+    :return: the number of checks issued
     """
-    Only purpose of this thread is to execute a list of tasks sequentially
-    as a background "thread".
+    ATTRIBUTES.invalidate(identifier)
+    REPORTED[identifier] = time.time()
+    return POLLER.poke(identifier)
+
+
+class AsychExe(object):
     """
-    def __init__(self, tasks, registry=None):
-        super(AsychExe, self).__init__()
+    Only purpose of this object is to execute a list of tasks sequentially
+    in the "background". Waiting for a task to become ready or complete is
+    handed to the shared POLLER so no thread is blocked while doing so.
+
+    A task can also be given as a callable returning it, which is called once the tasks before it have
+    completed, e.g. for a task addressing the SO container that the first task creates.
+
+    A chain can be cancelled by the identifier its entity had when the chain was built, also before it is
+    started, see cancel(); the entity is registered under that identifier as its tasks complete.
+    on_complete is called once all tasks have completed, on_finish once the chain has completed, failed
+    or was cancelled.
+    """
+    def __init__(self, tasks, registry=None, on_finish=None, on_complete=None):
         self.registry = registry
         self.tasks = tasks
+        self.on_finish = on_finish
+        self.on_complete = on_complete
+        self.key = tasks[0].entity.identifier if len(tasks) > 0 else None
+        self.cancelled = False
+        self.finished = False
+        self.lock = threading.Lock()
+        with CHAINS_LOCK:
+            CHAINS[self.key] = self
 
-    def run(self):
-        super(AsychExe, self).run()
-        LOG.debug('Starting AsychExe thread')
+    def start(self):
+        LOG.debug('Starting AsychExe chain')
+        POLLER.submit(self.__next, 0)
 
+    def cancel(self):
+        # pending phases are not started anymore, a phase already running finishes but is not waited for
+        with self.lock:
+            self.cancelled = True
+        POLLER.cancel(self.key)
         for task in self.tasks:
-            entity, extras = task.run()
+            if isinstance(task, Task):
+                task.end('cancelled')
+        self.__finish()
+
+    def __next(self, index):
+        if index >= len(self.tasks):
+            if self.on_complete is not None:
+                self.on_complete()
+            self.__finish()
+            return
+        if not isinstance(self.tasks[index], Task):
+            try:
+                self.tasks[index] = self.tasks[index]()
+            except Exception as e:
+                LOG.error('Could not build task ' + str(index) + ' of ' + self.key + ': ' + e.__repr__())
+                self.__finish()
+                return
+        task = self.tasks[index]
+        with self.lock:
+            # checks are registered under the lock so that cancel() cannot miss them
+            if self.cancelled:
+                return
+            task.wait('ready', task.ready, on_ready=partial(self.__run, index),
+                      on_error=partial(self.__fail, index))
+
+    def __run(self, index):
+        task = self.tasks[index]
+        with self.lock:
+            if self.cancelled:
+                return
+            task.begin()
+        try:
+            with TRACER.activate(task.span):
+                entity, extras = task.run()
+        except Exception as e:
+            self.__fail(index, e)
+            return
+        with self.lock:
+            if self.cancelled:
+                return
+            task.wait('done', task.done, on_ready=partial(self.__complete, index, entity, extras),
+                      on_error=partial(self.__fail, index))
+
+    def __complete(self, index, entity, extras):
+        with self.lock:
+            if self.cancelled:
+                return
+            self.tasks[index].end()
             if self.registry:
                 LOG.debug('Updating entity in registry')
-                self.registry.add_resource(key=entity.identifier, resource=entity, extras=extras)
+                self.registry.add_resource(key=self.key, resource=entity, extras=extras)
+        self.__next(index + 1)
+
+    def __fail(self, index, error):
+        task = self.tasks[index]
+        LOG.error('Task ' + task.state + ' of ' + task.entity.identifier + ' failed: ' + error.__repr__())
+        task.end('failed')
+        self.__finish()
+
+    def __finish(self):
+        with CHAINS_LOCK:
+            if CHAINS.get(self.key) is self:
+                del CHAINS[self.key]
+        with self.lock:
+            if self.finished:
+                return
+            self.finished = True
+        if self.on_finish is not None:
+            self.on_finish()
+
+
+def cancel(identifier):
+    """
+    Cancels the chain running for the entity identifier, if any, and all readiness checks of the entity.
+
+    :return: True if a chain was cancelled
+    """
+    with CHAINS_LOCK:
+        chain = CHAINS.pop(identifier, None)
+    if chain is None:
+        POLLER.cancel(identifier)
+        return False
+    LOG.debug('Cancelling the AsychExe chain of ' + identifier)
+    chain.cancel()
+    return True
+
 
 class Task:
+    # seconds between two readiness checks issued by the POLLER
+    interval = 3
+    # True if the SO reports the completion of this phase through its callback, see callback_attributes
+    reported = False
 
     def __init__(self, entity, extras, state):
         self.entity = entity
         self.extras = extras
         self.state = state
         self.start_time = ''
+        self.running = False
+        self.span = None
+        self.waiting = None
+
+    def ready(self):
+        # polled before run(), returns True once the task can be run
+        return True
 
     def run(self):
-        raise NotImplemented()
\ No newline at end of file
+        raise NotImplemented()
+
+    def done(self):
+        # polled after run(), returns True once the task has completed
+        return True
+
+    def execute(self):
+        # runs a task which has completed once run() returns, accounting for it like AsychExe does
+        self.begin()
+        try:
+            with TRACER.activate(self.span):
+                result = self.run()
+        except Exception:
+            self.end('failed')
+            raise
+        self.end()
+        return result
+
+    def begin(self):
+        self.start_time = time.time()
+        self.running = True
+        self.transition()
+        PHASES_IN_FLIGHT.inc(service=self.entity.kind.term, phase=self.state)
+        # a child of the instance's lifecycle span or of the client's trace
+        self.span = TRACER.start_span(self.state, parent=self.extras.get('trace') or self.extras.get('traceparent'),
+                                      attributes={'service': self.entity.kind.term,
+                                                  'instance': self.entity.identifier})
+
+    def end(self, outcome='done'):
+        # outcome is one of done, failed or cancelled; only the first call after begin() is accounted
+        if self.waiting is not None and outcome != 'done':
+            self.waiting.finish(outcome)
+        if self.running:
+            self.running = False
+            PHASES_IN_FLIGHT.dec(service=self.entity.kind.term, phase=self.state)
+            if outcome == 'done':
+                PHASE_DURATION.observe(time.time() - self.start_time, service=self.entity.kind.term,
+                                       phase=self.state)
+            self.span.finish('ok' if outcome == 'done' else outcome)
+        if outcome == 'failed':
+            PHASE_FAILURES.inc(service=self.entity.kind.term, phase=self.state)
+        self.transition()
+
+    def transition(self):
+        # the attributes retrieved before or during a lifecycle transition are outdated once it is done, and
+        # those watching the instance are told about it, see sm.watch
+        if self.state != 'retrieve':
+            ATTRIBUTES.invalidate(self.entity.identifier)
+            WATCHERS.notify(self.entity.identifier)
+
+    def wait(self, stage, check, on_ready=None, on_error=None):
+        """
+        Hands check to the POLLER. The first check is issued when this phase usually completes for this
+        service type, following checks back off exponentially from self.interval up to MAX_INTERVAL. Should the
+        SO report the completion of this phase, checks are issued once it does and otherwise FALLBACK_INTERVAL
+        apart at least.
+        """
+        service_type = self.entity.kind.term
+        phase = self.state + '.' + stage
+        started = time.time()
+        # the requests issued by the checks are children of this span
+        span = TRACER.start_span(phase, parent=self.span if self.running else
+                                 self.extras.get('trace') or self.extras.get('traceparent'))
+        self.waiting = span
+
+        missed = [started]  # the time of the last check finding the phase incomplete
+
+        def traced():
+            checked = time.time()
+            with TRACER.activate(span):
+                ready = check()
+            if not ready:
+                missed[0] = checked
+            return ready
+
+        def completed():
+            # the phase completed once the SO reported it or else between the last two checks
+            reported_at = REPORTED.pop(self.entity.identifier, None)
+            if reported_at is not None and reported_at > missed[0]:
+                HISTORY.record(service_type, phase, reported_at - started)
+            else:
+                HISTORY.record_between(service_type, phase, missed[0] - started, time.time() - started)
+            PHASE_WAIT.observe(time.time() - started, service=service_type, phase=self.state, stage=stage)
+            span.finish()
+            if on_ready is not None:
+                on_ready()
+
+        def failed(error):
+            span.set_attribute('error', error.__repr__())
+            span.finish('error')
+            if on_error is not None:
+                on_error(error)
+
+        interval, max_interval = self.interval, MAX_INTERVAL
+        if self.reported and callback_attributes(self.entity) != '':
+            interval, max_interval = max(interval, FALLBACK_INTERVAL), max(max_interval, FALLBACK_INTERVAL)
+        return POLLER.watch(traced, on_ready=completed, on_error=failed, interval=interval,
+                            delay=HISTORY.expected(service_type, phase), key=self.entity.identifier,
+                            backoff=BACKOFF, max_interval=max_interval)
@@ -14,12 +14,11 @@
 #    under the License.
 
 
+from sm.attributes import parse_attributes
 from sm.managers.generic import Task
 from sm.config import CONFIG
 from sm.log import LOG
 from sm.retry_http import http_retriable_request
-import time
-import json
 
 __author__ = 'merne and pku'
 
@@ -28,34 +27,28 @@ obapi_port = CONFIG.get('openbaton', 'port', None)
 HTTP = 'http://' + obapi_addr + ':' + obapi_port
 
 
+def warm_up(kind):
+    # nothing to prepare, no SO containers are created by this manager
+    pass
+
+
+def prepare_batch(extras):
+    # nothing shared between the instantiations of a batch
+    pass
+
+
 class Init(Task):
 
     def __init__(self, entity, extras):
         Task.__init__(self, entity, extras, state='initialise')
 
     def run(self):
-        self.start_time = time.time()
-        infodict = {
-                    'sm_name': self.entity.kind.term,
-                    'phase': 'init',
-                    'phase_event': 'start',
-                    'response_time': 0,
-                    }
-        LOG.debug(json.dumps(infodict))
         self.entity.attributes['mcn.service.state'] = 'initialise'
 
         # Do init work here
         self.entity.extras = {'loc': 'foobar',
                               'tenant_name': self.extras['tenant_name']}
 
-        elapsed_time = time.time() - self.start_time
-        infodict = {
-                    'sm_name': self.entity.kind.term,
-                    'phase': 'init',
-                    'phase_event': 'done',
-                    'response_time': elapsed_time,
-                    }
-        LOG.debug(json.dumps(infodict))
         return self.entity, self.extras
 
 
@@ -64,14 +57,6 @@ class Activate(Task):
         Task.__init__(self, entity, extras, state='activate')
 
     def run(self):
-        self.start_time = time.time()
-        infodict = {
-                    'sm_name': self.entity.kind.term,
-                    'phase': 'activate',
-                    'phase_event': 'start',
-                    'response_time': 0,
-                    }
-        LOG.debug(json.dumps(infodict))
         self.entity.attributes['mcn.service.state'] = 'activate'
 
         # Do activate work here
@@ -96,30 +81,16 @@ class Activate(Task):
         LOG.info('Sending headers: ' + heads.__repr__())
         http_retriable_request('PUT', url, headers=heads)
 
-        elapsed_time = time.time() - self.start_time
-        infodict = {
-                    'sm_name': self.entity.kind.term,
-                    'phase': 'activate',
-                    'phase_event': 'done',
-                    'response_time': elapsed_time,
-                    }
-        LOG.debug(json.dumps(infodict))
         return self.entity, self.extras
 
 
 class Deploy(Task):
+    interval = 7
+
     def __init__(self, entity, extras):
         Task.__init__(self, entity, extras, state='deploy')
 
     def run(self):
-        self.start_time = time.time()
-        infodict = {
-                    'sm_name': self.entity.kind.term,
-                    'phase': 'deploy',
-                    'phase_event': 'start',
-                    'response_time': 0,
-                    }
-        LOG.debug(json.dumps(infodict))
         self.entity.attributes['mcn.service.state'] = 'deploy'
 
         # Do deploy work here
@@ -142,23 +113,17 @@ class Deploy(Task):
         LOG.debug('Deploying SO with: ' + url)
         LOG.info('Sending headers: ' + heads.__repr__())
         http_retriable_request('POST', url, headers=heads, params=params)
+        return self.entity, self.extras
 
-        # also sleep here to keep phases consistent during greenfield
-        while not self.deploy_complete(url):
-                    time.sleep(7)
+    def done(self):
+        # also wait here to keep phases consistent during greenfield
+        if not self.deploy_complete(HTTP + '/api/v1/occi/default'):
+            return False
 
         self.entity.attributes['mcn.service.state'] = 'deploy'
         LOG.debug('SO Deployed ')
 
-        elapsed_time = time.time() - self.start_time
-        infodict = {
-                    'sm_name': self.entity.kind.term,
-                    'phase': 'deploy',
-                    'phase_event': 'done',
-                    'response_time': elapsed_time,
-                    }
-        LOG.debug(json.dumps(infodict))
-        return self.entity, self.extras
+        return True
 
     def deploy_complete(self, url):
         heads = {
@@ -173,18 +138,16 @@ class Deploy(Task):
         LOG.info('sending headers: ' + heads.__repr__())
 
         r = http_retriable_request('GET', url, headers=heads)
-        rheaders = r.headers.get("x-occi-attribute").split(',')
+        stack_state = parse_attributes(r.headers.get("x-occi-attribute")).get('occi.stack.state')
 
-        for entry in rheaders:
-            if 'occi.stack.state' in entry:
-                stack_state = entry.split('"')[1]
-                if 'CREATE_COMPLETE' in entry or 'UPDATE_COMPLETE' in entry:
-                    LOG.info('Stack is ready')
-                    return True
-                else:
-                    LOG.info('Stack is not ready. Current state state: ' +
-                             stack_state)
-                    return False
+        if stack_state is not None:
+            if stack_state in ('CREATE_COMPLETE', 'UPDATE_COMPLETE'):
+                LOG.info('Stack is ready')
+                return True
+            else:
+                LOG.info('Stack is not ready. Current state state: ' +
+                         stack_state)
+                return False
 
 
 class Provision(Task):
@@ -192,26 +155,10 @@ class Provision(Task):
         Task.__init__(self, entity, extras, state='provision')
 
     def run(self):
-        self.start_time = time.time()
-        infodict = {
-                    'sm_name': self.entity.kind.term,
-                    'phase': 'provision',
-                    'phase_event': 'start',
-                    'response_time': 0,
-                    }
-        LOG.debug(json.dumps(infodict))
         self.entity.attributes['mcn.service.state'] = 'provision'
 
         # Do provision work here
 
-        elapsed_time = time.time() - self.start_time
-        infodict = {
-                    'sm_name': self.entity.kind.term,
-                    'phase': 'provision',
-                    'phase_event': 'done',
-                    'response_time': elapsed_time,
-                    }
-        LOG.debug(json.dumps(infodict))
         return self.entity, self.extras
 
 
@@ -221,15 +168,6 @@ class Retrieve(Task):
         Task.__init__(self, entity, extras, 'retrieve')
 
     def run(self):
-        self.start_time = time.time()
-        infodict = {
-                    'sm_name': self.entity.kind.term,
-                    'phase': 'retrieve',
-                    'phase_event': 'start',
-                    'response_time': 0,
-                    }
-        LOG.debug(json.dumps(infodict))
-
         # Do retrieve work here
         if self.entity.attributes['mcn.service.state'] in ['activate',
                                                            'deploy',
@@ -248,27 +186,15 @@ class Retrieve(Task):
             r = http_retriable_request('GET', HTTP +
                                        '/api/v1/occi/default', headers=heads)
 
-            attrs = r.headers['x-occi-attribute'].split(', ')
-            for attr in attrs:
-                kv = attr.split('=')
-                if kv[0] != 'occi.core.id':
-                    if kv[1].startswith('"') and kv[1].endswith('"'):
-                        kv[1] = kv[1][1:-1]  # scrub off quotes
-                    self.entity.attributes[kv[0]] = kv[1]
-                    LOG.debug('OCCI Attribute: ' + kv[0] + ' --> ' + kv[1])
+            attrs = parse_attributes(r.headers['x-occi-attribute'])
+            attrs.pop('occi.core.id', None)
+            self.entity.attributes.update(attrs)
+            LOG.debug('OCCI Attributes: ' + attrs.__repr__())
 
         else:
             LOG.debug('Cannot GET entity as it is not in the activated, '
                       'deployed or provisioned, updated state')
 
-        elapsed_time = time.time() - self.start_time
-        infodict = {
-                    'sm_name': self.entity.kind.term,
-                    'phase': 'retrieve',
-                    'phase_event': 'done',
-                    'response_time': elapsed_time,
-                    }
-        LOG.debug(json.dumps(infodict))
         return self.entity, self.extras
 
 
@@ -279,26 +205,10 @@ class Update(Task):
         self.new = updated_entity
 
     def run(self):
-        self.start_time = time.time()
-        infodict = {
-                    'sm_name': self.entity.kind.term,
-                    'phase': 'update',
-                    'phase_event': 'start',
-                    'response_time': 0,
-                    }
-        LOG.debug(json.dumps(infodict))
         self.entity.attributes['mcn.service.state'] = 'update'
 
         # Do update work here
 
-        elapsed_time = time.time() - self.start_time
-        infodict = {
-                    'sm_name': self.entity.kind.term,
-                    'phase': 'update',
-                    'phase_event': 'done',
-                    'response_time': elapsed_time,
-                    }
-        LOG.debug(json.dumps(infodict))
         return self.entity, self.extras
 
 
@@ -307,14 +217,6 @@ class Destroy(Task):
         Task.__init__(self, entity, extras, state='destroy')
 
     def run(self):
-        self.start_time = time.time()
-        infodict = {
-                    'sm_name': self.entity.kind.term,
-                    'phase': 'destroy',
-                    'phase_event': 'start',
-                    'response_time': 0,
-                    }
-        LOG.debug(json.dumps(infodict))
         self.entity.attributes['mcn.service.state'] = 'destroy'
 
         # Do destroy work here
@@ -333,12 +235,4 @@ class Destroy(Task):
 
         http_retriable_request('DELETE', url, headers=heads)
 
-        elapsed_time = time.time() - self.start_time
-        infodict = {
-                    'sm_name': self.entity.kind.term,
-                    'phase': 'destroy',
-                    'phase_event': 'done',
-                    'response_time': elapsed_time,
-                    }
-        LOG.debug(json.dumps(infodict))
         return self.entity, self.extras
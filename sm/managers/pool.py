@@ -0,0 +1,219 @@
+# Copyright 2014-2015 Zuercher Hochschule fuer Angewandte Wissenschaften
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+__author__ = 'andy'
+
+from collections import deque
+from functools import partial
+import threading
+import time
+
+from sm.log import LOG
+from sm.managers.generic import POLLER
+from sm.metrics import REGISTRY
+
+# exported by the admin app on /metrics along with the lifecycle metrics, see sm.managers.generic
+POOL_HITS = REGISTRY.counter('sm_warm_pool_hits_total', 'Instances given an SO container of the warm pool.',
+                             ['bundle'])
+POOL_MISSES = REGISTRY.counter('sm_warm_pool_misses_total', 'Instances for which the warm pool had no ready SO '
+                               'container.', ['bundle'])
+POOL_STALE = REGISTRY.counter('sm_warm_pool_stale_total', 'SO containers of the warm pool found unusable when they '
+                              'were to be handed out.', ['bundle'])
+POOL_REFILL = REGISTRY.histogram('sm_warm_pool_refill_seconds', 'Time from the creation of an SO container for the '
+                                 'warm pool until it is ready.', ['bundle'])
+POOL_READY = REGISTRY.gauge('sm_warm_pool_ready', 'Ready SO containers in the warm pool.', ['bundle'])
+POOL_PENDING = REGISTRY.gauge('sm_warm_pool_pending', 'SO containers of the warm pool being created.', ['bundle'])
+
+
+class WarmPool(object):
+    """
+    Keeps a number of ready-to-use SO containers per bundle so that the creation of a container and the wait
+    for it to become active are taken off the request path. Containers are created and awaited in the
+    background; a container handed out is replaced asynchronously.
+
+    The pool itself is agnostic of the cloud controller, it is given these callables:
+      - create(bundle, prefix): creates a container, returns a dict describing it
+      - ready(container): True once the container can be used
+      - destroy(container): disposes of the container
+      - tag(container, tenant): optional, assigns the container to the tenant it is handed out to
+    """
+
+    def __init__(self, create, ready, destroy, size=0, max_size=0, idle_expiry=0, interval=3, tag=None):
+        self.create = create
+        self.ready = ready
+        self.destroy = destroy
+        self.tag = tag
+        self.size = min(size, max_size) if max_size > 0 else size
+        self.max_size = max_size
+        self.idle_expiry = idle_expiry
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.bundles = {}  # bundle -> {'prefix', 'ready': deque of (ready since, container), 'pending'}
+        self.hits = 0
+        self.misses = 0
+        self.refills = 0
+        self.refill_time = 0.0
+        self.last_refill_time = 0.0
+
+    def enabled(self):
+        return self.size > 0
+
+    def start(self, bundle, prefix):
+        """
+        Starts keeping containers ready for bundle. prefix is used to name the containers.
+        """
+        if not self.enabled():
+            return
+        with self.lock:
+            if bundle in self.bundles:
+                return
+            self.bundles[bundle] = {'prefix': prefix, 'ready': deque(), 'pending': 0}
+        LOG.info('Keeping ' + str(self.size) + ' SO containers ready for: ' + bundle)
+        if self.idle_expiry > 0:
+            POLLER.watch(partial(self.__expire, bundle), interval=self.idle_expiry, delay=self.idle_expiry)
+        self.refill(bundle)
+
+    def acquire(self, bundle, tenant=None):
+        """
+        A container may have gone away while it was idle, so it is checked once more before it is handed out;
+        containers that are not ready any more are disposed of.
+
+        :return: a ready container of bundle, tagged with tenant if given, None if there is none
+        """
+        if not self.enabled():
+            return None
+        container = None
+        with self.lock:
+            pool = self.bundles.get(bundle)
+        while pool is not None and container is None:
+            with self.lock:
+                if len(pool['ready']) == 0:
+                    break
+                _, container = pool['ready'].popleft()
+                self.__gauges(bundle)
+            if not self.__usable(container, tenant):
+                POOL_STALE.inc(bundle=bundle)
+                POLLER.submit(self.__destroy, container)
+                container = None
+        with self.lock:
+            if container is None:
+                self.misses += 1
+                POOL_MISSES.inc(bundle=bundle)
+            else:
+                self.hits += 1
+                POOL_HITS.inc(bundle=bundle)
+        if pool is not None:
+            self.refill(bundle)
+        return container
+
+    def __usable(self, container, tenant):
+        try:
+            if not self.ready(container):
+                LOG.warn('SO container of the warm pool is not ready any more: ' + container.__repr__())
+                return False
+            if self.tag is not None and tenant is not None:
+                self.tag(container, tenant)
+        except Exception as e:
+            LOG.warn('SO container of the warm pool cannot be handed out: ' + e.__repr__())
+            return False
+        return True
+
+    def refill(self, bundle):
+        with self.lock:
+            pool = self.bundles[bundle]
+            missing = self.size - len(pool['ready']) - pool['pending']
+            if self.max_size > 0:
+                missing = min(missing, self.max_size - len(pool['ready']) - pool['pending'])
+            missing = max(missing, 0)
+            pool['pending'] += missing
+            self.__gauges(bundle)
+        for _ in range(missing):
+            POLLER.submit(self.__fill, bundle)
+
+    def stats(self):
+        with self.lock:
+            requests = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': float(self.hits) / requests if requests > 0 else 0.0,
+                'refills': self.refills,
+                'refill_latency_avg': self.refill_time / self.refills if self.refills > 0 else 0.0,
+                'refill_latency_last': self.last_refill_time,
+                'ready': dict((bundle, len(pool['ready'])) for bundle, pool in self.bundles.items()),
+                'pending': dict((bundle, pool['pending']) for bundle, pool in self.bundles.items())
+            }
+
+    def __fill(self, bundle):
+        started = time.time()
+        try:
+            container = self.create(bundle, self.bundles[bundle]['prefix'])
+        except Exception as e:
+            LOG.error('Could not create SO container for the warm pool: ' + e.__repr__())
+            self.__failed(bundle)
+            return
+        POLLER.watch(partial(self.ready, container), interval=self.interval,
+                     on_ready=partial(self.__filled, bundle, container, started),
+                     on_error=partial(self.__fill_error, bundle, container))
+
+    def __filled(self, bundle, container, started):
+        elapsed = time.time() - started
+        with self.lock:
+            pool = self.bundles[bundle]
+            pool['pending'] -= 1
+            pool['ready'].append((time.time(), container))
+            self.refills += 1
+            self.refill_time += elapsed
+            self.last_refill_time = elapsed
+            self.__gauges(bundle)
+        POOL_REFILL.observe(elapsed, bundle=bundle)
+        LOG.debug('SO container ready in warm pool after ' + str(elapsed) + 's: ' + container.__repr__())
+
+    def __fill_error(self, bundle, container, error):
+        LOG.error('SO container for the warm pool did not become ready: ' + error.__repr__())
+        self.__failed(bundle)
+        self.__destroy(container)
+
+    def __failed(self, bundle):
+        with self.lock:
+            self.bundles[bundle]['pending'] -= 1
+            self.__gauges(bundle)
+
+    def __expire(self, bundle):
+        # periodically disposes of containers that were idle for too long and replaces them
+        expired = []
+        with self.lock:
+            pool = self.bundles[bundle]
+            while len(pool['ready']) > 0 and time.time() - pool['ready'][0][0] > self.idle_expiry:
+                expired.append(pool['ready'].popleft()[1])
+            self.__gauges(bundle)
+        for container in expired:
+            LOG.debug('SO container idle for too long, disposing: ' + container.__repr__())
+            self.__destroy(container)
+        if len(expired) > 0:
+            self.refill(bundle)
+        return False  # keeps this check scheduled
+
+    def __gauges(self, bundle):
+        # called with the lock held
+        pool = self.bundles[bundle]
+        POOL_READY.set(len(pool['ready']), bundle=bundle)
+        POOL_PENDING.set(pool['pending'], bundle=bundle)
+
+    def __destroy(self, container):
+        try:
+            self.destroy(container)
+        except Exception as e:
+            LOG.error('Could not dispose of SO container: ' + e.__repr__())
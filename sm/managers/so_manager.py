@@ -21,16 +21,15 @@ import os
 import random
 import shutil
 import tempfile
-import time
-from threading import Thread
 from urlparse import urlparse
-import uuid
 
-from occi.core_model import Resource, Link
+from sm.attributes import parse_attributes, render_attributes
 from sm.config import CONFIG
+from sm.links import link_instances
 from sm.log import LOG
 from sm.retry_http import http_retriable_request
-from sm.managers.generic import Task
+from sm.managers.generic import Task, callback_attributes, client_fragments
+from sm.managers.pool import WarmPool
 
 
 __author__ = 'andy'
@@ -40,67 +39,210 @@ WAIT = int(CONFIG.get('cloud_controller', 'wait_time', 2000))
 ATTEMPTS = int(CONFIG.get('cloud_controller', 'max_attempts', 5))
 
 
+def nb_api():
+    nburl = os.environ.get('CC_URL', False)
+    if not nburl:
+        nburl = CONFIG.get('cloud_controller', 'nb_api', '')
+    if nburl[-1] == '/':
+        nburl = nburl[0:-1]
+    return nburl
+
+
+def bundle_location():
+    # for OpSv3 bundle location is the repo id of the container image
+    bundle_loc = os.environ.get('BUNDLE_LOC', False)
+    if not bundle_loc:
+        bundle_loc = CONFIG.get('service_manager', 'bundle_location', '')
+    return bundle_loc
+
+
+def detect_ops_version(nburl):
+    # make a call to the cloud controller and based on the app kind, heuristically select version
+    version = 'v2'
+    heads = {
+        'Content-Type': 'text/occi',
+        'Accept': 'text/occi'
+        }
+    url = nburl + '/-/'
+    LOG.debug('Requesting CC Query Interface: ' + url)
+    LOG.info('Sending headers: ' + heads.__repr__())
+    r = http_retriable_request('GET', url, headers=heads, authenticate=True)
+    if r.headers['category'].find('occi.app.image') > -1 and r.headers['category'].find('occi.app.env') > -1:
+        LOG.info('Found occi.app.image and occi.app.env - this is OpenShift V3')
+        version = 'v3'
+    else:
+        LOG.info('This is OpenShift V2')
+    return version
+
+
+def app_name(prefix):
+    # will generate an appname 24 chars long - compatible with v2 and v3
+    # e.g. soandycd009b39c28790f3
+    return 'so' + prefix[0:4] + ''.join(random.choice('0123456789abcdef') for _ in range(16))
+
+
+def app_url(nburl, app_uri_path):
+    # returns the URL of the SO container (v3) or the git repository to push the bundle to (v2)
+    url = nburl + app_uri_path
+    headers = {'Accept': 'text/occi'}
+    LOG.debug('Requesting container\'s URL ' + url)
+    LOG.info('Sending headers: ' + headers.__repr__())
+    r = http_retriable_request('GET', url, headers=headers, authenticate=True)
+
+    attrs = r.headers.get('X-OCCI-Attribute', '')
+    if attrs == '':
+        raise AttributeError("No occi attributes found in request")
+
+    attrs = parse_attributes(attrs)
+    repo_uri = attrs.get('occi.app.repo', attrs.get('occi.app.url', ''))
+    if repo_uri == '':
+        raise AttributeError("No occi.app.repo or occi.app.url attribute found in request")
+
+    LOG.debug('SO container URL: ' + repo_uri)
+
+    return repo_uri
+
+
+def app_ready(url, heads):
+    # checks if the app at url (on the CC) is active and its SO answers
+    LOG.info('Checking app state at: ' + url)
+    LOG.info('Sending headers: ' + heads.__repr__())
+
+    r = http_retriable_request('GET', url, headers=heads, authenticate=True)
+    attrs = json.loads(r.content)
+
+    if len(attrs['attributes']) > 0:
+        attr_hash = attrs['attributes']
+        app_state = ''
+        try:
+            app_state = attr_hash['occi.app.state']
+        except KeyError:
+            pass
+
+        LOG.info('Current service state: ' + str(app_state))
+        if app_state == 'active':
+            # check if it returns something valid instead of 503
+            try:
+                tmpUrl = 'http://' + attr_hash['occi.app.url']
+            except KeyError:
+                LOG.info(('App is not ready. app url is not yet set.'))
+                return False
+            r = http_retriable_request('GET', tmpUrl, headers=heads, authenticate=True)
+            if r.status_code == 200:
+                LOG.info('App is ready')
+                return True
+            else:
+                LOG.info('App is not ready. app url returned: ' + str(r.status_code))
+        else:
+            LOG.info('App is not ready. Current state state: ' + app_state)
+    return False
+
+
+def v3_app_headers(name, bundle_loc, design_uri):
+    # TODO provide a means to provide additional docker env params
+    attrs = 'occi.app.name="' + name + '", ' + \
+            'occi.app.image="' + bundle_loc + '", ' + \
+            'occi.app.env="DESIGN_URI=' + design_uri + '"'
+    return {'category': 'app; scheme="http://schemas.ogf.org/occi/platform#"',
+            'X-OCCI-Attribute': str(attrs)}
+
+
+# OpSv3 containers kept ready for new instances, see sm.managers.pool
+def create_pooled_app(bundle_loc, prefix):
+    nburl = nb_api()
+    heads = {'Content-Type': 'text/occi'}
+    heads.update(v3_app_headers(app_name(prefix), bundle_loc, CONFIG.get('service_manager', 'design_uri', '')))
+    LOG.debug('Requesting container for the warm pool: ' + nburl + '/app/')
+    r = http_retriable_request('POST', nburl + '/app/', headers=heads, authenticate=True)
+    loc = r.headers.get('Location', '')
+    if loc == '':
+        raise AttributeError("No OCCI Location attribute found in request")
+    return {'loc': loc, 'host': app_url(nburl, urlparse(loc).path)}
+
+
+def pooled_app_ready(container):
+    return app_ready(container['loc'], {'Content-type': 'text/occi', 'Accept': 'application/occi+json'})
+
+
+def destroy_pooled_app(container):
+    http_retriable_request('DELETE', nb_api() + urlparse(container['loc']).path,
+                           headers={'Content-Type': 'text/occi'}, authenticate=True)
+
+
+def tag_pooled_app(container, tenant):
+    # the app was created before its tenant was known, it is assigned to the tenant on the CC once handed out
+    heads = {'Content-Type': 'text/occi', 'X-OCCI-Attribute': render_attributes({'mcn.sm.tenant': tenant})}
+    LOG.debug('Tagging SO container of the warm pool with tenant ' + tenant + ': ' + container['loc'])
+    http_retriable_request('POST', nb_api() + urlparse(container['loc']).path, headers=heads, authenticate=True)
+
+
+POOL = WarmPool(create_pooled_app, pooled_app_ready, destroy_pooled_app,
+                size=int(CONFIG.get('warm_pool', 'size', 0)),
+                max_size=int(CONFIG.get('warm_pool', 'max_size', 0)),
+                idle_expiry=int(CONFIG.get('warm_pool', 'idle_expiry', 0)),
+                tag=tag_pooled_app)
+
+
+def warm_up(kind):
+    # starts filling the warm pool, if enabled - only supported with OpSv3
+    if not POOL.enabled():
+        return
+    if detect_ops_version(nb_api()) != 'v3':
+        LOG.warn('The warm pool of SO containers is only supported with OpenShift V3.')
+        return
+    POOL.start(bundle_location(), kind.term)
+
+
+def prepare_batch(extras):
+    # the CC version is detected once for all instances of a batch, see InitSO.run
+    extras['ops_version'] = detect_ops_version(nb_api())
+
+
 # instantiate container
 class InitSO(Task):
 
     def __init__(self, entity, extras):
         Task.__init__(self, entity, extras, state='initialise')
-        self.nburl = os.environ.get('CC_URL', False)
-        if not self.nburl:
-            self.nburl = CONFIG.get('cloud_controller', 'nb_api', '')
-        if self.nburl[-1] == '/':
-            self.nburl = self.nburl[0:-1]
+        self.nburl = nb_api()
         LOG.info('CloudController Northbound API: ' + self.nburl)
         if len(entity.attributes) > 0:
             LOG.info('Client supplied parameters: ' + entity.attributes.__repr__())
             # XXX check that these parameters are valid according to the kind specification
-            self.extras['srv_prms'].add_client_params(entity.attributes)
+            # they are sent to the SO along with the internal parameters, see ServiceBackend.create
         else:
             LOG.warn('No client supplied parameters.')
 
     def run(self):
         #LOG.debug('INIT SO START')
-        self.start_time = time.time()
-        self.extras['occi.init.starttime'] = self.start_time
         if not self.entity.extras:
             self.entity.extras = {}
-        ops_version = self.__detect_ops_version()
-        self.entity.extras['ops_version'] = ops_version
 
         self.entity.attributes['mcn.service.state'] = 'initialise'
 
-        # create an app for the new SO instance
-        LOG.debug('Creating SO container...')
-        self.__create_app()
+        container = POOL.acquire(bundle_location(), self.extras['tenant_name'])
+        if container is not None:
+            # a ready OpSv3 container is taken from the warm pool, checked and tagged with the tenant on the way
+            LOG.debug('Using SO container from the warm pool: ' + container['loc'])
+            self.entity.extras['ops_version'] = 'v3'
+            self.entity.extras['warm'] = True
+            self.__use_app(container['loc'])
+            self.entity.extras['loc'] = container['host']
+        else:
+            ops_version = self.extras.get('ops_version')
+            if ops_version is None:
+                ops_version = detect_ops_version(self.nburl)
+            self.entity.extras['ops_version'] = ops_version
+
+            # create an app for the new SO instance
+            LOG.debug('Creating SO container...')
+            self.__create_app()
 
         # adding tenant to entity.extras for future checks later when retrieving resource
         self.entity.extras['tenant_name'] = self.extras['tenant_name']
         return self.entity, self.extras
 
-    def __detect_ops_version(self):
-        # make a call to the cloud controller and based on the app kind, heuristically select version
-        version = 'v2'
-        heads = {
-            'Content-Type': 'text/occi',
-            'Accept': 'text/occi'
-            }
-        url = self.nburl + '/-/'
-        LOG.debug('Requesting CC Query Interface: ' + url)
-        LOG.info('Sending headers: ' + heads.__repr__())
-        r = http_retriable_request('GET', url, headers=heads, authenticate=True)
-        if r.headers['category'].find('occi.app.image') > -1 and r.headers['category'].find('occi.app.env') > -1:
-            LOG.info('Found occi.app.image and occi.app.env - this is OpenShift V3')
-            version = 'v3'
-        else:
-            LOG.info('This is OpenShift V2')
-        return version
-
     def __create_app(self):
-
-        # will generate an appname 24 chars long - compatible with v2 and v3
-        # e.g. soandycd009b39c28790f3
-        app_name = 'so' + self.entity.kind.term[0:4] + \
-                   ''.join(random.choice('0123456789abcdef') for _ in range(16))
+        name = app_name(self.entity.kind.term)
         heads = {'Content-Type': 'text/occi'}
 
         url = self.nburl + '/app/'
@@ -109,15 +251,11 @@ class InitSO(Task):
             heads['category'] = 'app; scheme="http://schemas.ogf.org/occi/platform#", ' \
                                 'python-2.7; scheme="http://schemas.openshift.com/template/app#", ' \
                                 'small; scheme="http://schemas.openshift.com/template/app#"'
-            heads['X-OCCI-Attribute'] = str('occi.app.name=' + app_name)
+            heads['X-OCCI-Attribute'] = str('occi.app.name=' + name)
             LOG.debug('Ensuring SM SSH Key...')
             self.__ensure_ssh_key()
         elif self.entity.extras['ops_version'] == 'v3':
-
-            # for OpSv3 bundle location is the repo id of the container image
-            bundle_loc = os.environ.get('BUNDLE_LOC', False)
-            if not bundle_loc:
-                bundle_loc = CONFIG.get('service_manager', 'bundle_location', '')
+            bundle_loc = bundle_location()
             if bundle_loc == '':
                 LOG.error('No bundle_location parameter supplied in sm.cfg')
                 raise Exception('No bundle_location parameter supplied in sm.cfg')
@@ -130,12 +268,7 @@ class InitSO(Task):
                 raise Exception('No design_uri parameter supplied in sm.cfg')
             LOG.debug('Design URI: ' + design_uri)
 
-            heads['category'] = 'app; scheme="http://schemas.ogf.org/occi/platform#"'
-            # TODO provide a means to provide additional docker env params
-            attrs = 'occi.app.name="' + app_name + '", ' + \
-                    'occi.app.image="' + bundle_loc + '", ' + \
-                    'occi.app.env="DESIGN_URI=' + design_uri + '"'
-            heads['X-OCCI-Attribute'] = str(attrs)
+            heads.update(v3_app_headers(name, bundle_loc, design_uri))
         else:
             LOG.error('Unknown OpenShift version. ops_version: ' + self.entity.extras['ops_version'])
             raise Exception('Unknown OpenShift version. ops_version: ' + self.entity.extras['ops_version'])
@@ -149,64 +282,28 @@ class InitSO(Task):
             LOG.error("No OCCI Location attribute found in request")
             raise AttributeError("No OCCI Location attribute found in request")
 
-        self.entity.attributes['occi.so.url'] = loc
-
-        app_uri_path = urlparse(loc).path
-        LOG.debug('SO container created: ' + app_uri_path)
-
-        LOG.debug('Updating OCCI entity.identifier from: ' + self.entity.identifier + ' to: ' +
-                  app_uri_path.replace('/app/', self.entity.kind.location))
-        self.entity.identifier = app_uri_path.replace('/app/', self.entity.kind.location)
-
-        LOG.debug('Setting occi.core.id to: ' + app_uri_path.replace('/app/', ''))
-        self.entity.attributes['occi.core.id'] = app_uri_path.replace('/app/', '')
-
-        # its a bit wrong to put this here, but we do not have the required information before.
-        # this keeps things consistent as the timing is done right
-        infoDict = {
-                    'so_id': self.entity.attributes['occi.core.id'].split('/'),
-                    'sm_name': self.entity.kind.term,
-                    'so_phase': 'init',
-                    'phase_event': 'start',
-                    'response_time': 0,
-                    'tenant': self.extras['tenant_name']
-                    }
-        tmpJSON = json.dumps(infoDict)
-        LOG.debug(tmpJSON)
+        app_uri_path = self.__use_app(loc)
 
         # OpSv2 only: get git uri. this is where our bundle is pushed to
         # XXX this is fugly
         # TODO use the same name for the app URI
         if self.entity.extras['ops_version'] == 'v2':
-            self.entity.extras['repo_uri'] = self.__git_uri(app_uri_path)
+            self.entity.extras['repo_uri'] = app_url(self.nburl, app_uri_path)
         elif self.entity.extras['ops_version'] == 'v3':
-            self.entity.extras['loc'] = self.__git_uri(app_uri_path)
-
-    def __git_uri(self, app_uri_path):
-        url = self.nburl + app_uri_path
-        headers = {'Accept': 'text/occi'}
-        LOG.debug('Requesting container\'s URL ' + url)
-        LOG.info('Sending headers: ' + headers.__repr__())
-        r = http_retriable_request('GET', url, headers=headers, authenticate=True)
-
-        attrs = r.headers.get('X-OCCI-Attribute', '')
-        if attrs == '':
-            raise AttributeError("No occi attributes found in request")
-
-        repo_uri = ''
-        for attr in attrs.split(', '):
-            if attr.find('occi.app.repo') != -1:
-                repo_uri = attr.split('=')[1][1:-1]  # scrubs trailing wrapped quotes
-                break
-            elif attr.find('occi.app.url') != -1:
-                repo_uri = attr.split('=')[1][1:-1]  # scrubs trailing wrapped quotes
-                break
-        if repo_uri == '':
-            raise AttributeError("No occi.app.repo or occi.app.url attribute found in request")
-
-        LOG.debug('SO container URL: ' + repo_uri)
-
-        return repo_uri
+            self.entity.extras['loc'] = app_url(self.nburl, app_uri_path)
+
+    def __use_app(self, loc):
+        # binds the app (container) at loc to this instance
+        self.entity.attributes['occi.so.url'] = loc
+
+        app_uri_path = urlparse(loc).path
+        LOG.debug('SO container created: ' + app_uri_path)
+
+        # the instance keeps the identifier its client was given, under which it is registered and its lifecycle
+        # is run; the path of the app on the CC is kept along with it
+        LOG.debug('SO container of ' + self.entity.identifier + ': ' + app_uri_path)
+        self.entity.extras['app_path'] = app_uri_path
+        return app_uri_path
 
     def __ensure_ssh_key(self):
         url = self.nburl + '/public_key/'
@@ -263,7 +360,6 @@ class ActivateSO(Task):
             self.host = self.entity.extras['loc']
 
     def __is_complete(self, url):
-        # XXX copy/paste code - merge the two places!
         heads = {
                 'Content-type': 'text/occi',
                 'Accept': 'application/occi+json',
@@ -271,75 +367,20 @@ class ActivateSO(Task):
                 'X-Tenant-Name': self.extras['tenant_name'],
             }
 
-        LOG.info('Checking app state at: ' + url)
-        LOG.info('Sending headers: ' + heads.__repr__())
-
-        r = http_retriable_request('GET', url, headers=heads, authenticate=True)
-        attrs = json.loads(r.content)
-
-        if len(attrs['attributes']) > 0:
-            attr_hash = attrs['attributes']
-            app_state = ''
-            try:
-                app_state = attr_hash['occi.app.state']
-            except KeyError:
-                pass
-
-            LOG.info('Current service state: ' + str(app_state))
-            if app_state == 'active':
-                # check if it returns something valid instead of 503
-                try:
-                    tmpUrl = 'http://' + attr_hash['occi.app.url']
-                except KeyError:
-                    LOG.info(('App is not ready. app url is not yet set.'))
-                    return False
-                r = http_retriable_request('GET', tmpUrl, headers=heads, authenticate=True)
-                if r.status_code == 200:
-                    LOG.info('App is ready')
-                    elapsed_time = time.time() - self.extras['occi.init.starttime']
-                    del self.extras['occi.init.starttime']
-
-                    infoDict = {
-                                'so_id': self.entity.attributes['occi.core.id'],
-                                'sm_name': self.entity.kind.term,
-                                'so_phase': 'init',
-                                'phase_event': 'done',
-                                'response_time': elapsed_time,
-                                'tenant': self.extras['tenant_name']
-                                }
-                    tmpJSON = json.dumps(infoDict)
-                    LOG.debug(tmpJSON)
-                    return True
-                else:
-                    LOG.info('App is not ready. app url returned: ' + r.status_code)
-            else:
-                LOG.info('App is not ready. Current state state: ' + app_state)
-                return False
-
-
-
-    def run(self):
+        return app_ready(url, heads)
 
+    def ready(self):
         # this is wrong but required...
+        if self.entity.extras.get('warm', False):
+            # containers from the warm pool were found ready as they were handed out, see WarmPool.acquire
+            return True
         if self.entity.extras['ops_version'] == 'v3':
-            url = self.entity.attributes['occi.so.url']
-            while not self.__is_complete(url):
-                time.sleep(3)
-
+            return self.__is_complete(self.entity.attributes['occi.so.url'])
+        return True
 
+    def run(self):
         LOG.debug('ACTIVATE SO START')
 
-        self.start_time = time.time()
-        infoDict = {
-                    'so_id': self.entity.attributes['occi.core.id'],
-                    'sm_name': self.entity.kind.term,
-                    'so_phase': 'activate',
-                    'phase_event': 'start',
-                    'response_time': 0,
-                    'tenant': self.extras['tenant_name']
-                    }
-        tmpJSON = json.dumps(infoDict)
-        LOG.debug(tmpJSON)
         if self.entity.extras['ops_version'] == 'v2':
             # get the code of the bundle and push it to the git facilities
             # offered by OpenShift
@@ -424,7 +465,9 @@ class ActivateSO(Task):
             'X-Tenant-Name': self.extras['tenant_name'],
         }
 
-        occi_attrs = self.extras['srv_prms'].service_parameters(self.state)
+        # the SO reports completed phases to the callback, if one is offered
+        occi_attrs = ', '.join(attrs for attrs in (self.extras['srv_prms'].service_parameters(self.state),
+                                                   callback_attributes(self.entity)) if len(attrs) > 0)
         if len(occi_attrs) > 0:
             LOG.info('Adding service-specific parameters to call... X-OCCI-Attribute: ' + occi_attrs)
             heads['X-OCCI-Attribute'] = occi_attrs
@@ -432,21 +475,12 @@ class ActivateSO(Task):
         LOG.debug('Initialising SO with: ' + url)
         LOG.info('Sending headers: ' + heads.__repr__())
         http_retriable_request('PUT', url, headers=heads)
-        elapsed_time = time.time() - self.start_time
-        infoDict = {
-                    'so_id': self.entity.attributes['occi.core.id'],
-                    'sm_name': self.entity.kind.term,
-                    'so_phase': 'activate',
-                    'phase_event': 'done',
-                    'response_time': elapsed_time,
-                    'tenant': self.extras['tenant_name']
-                    }
-        tmpJSON = json.dumps(infoDict)
-        LOG.debug(tmpJSON)
-        #LOG.debug('ACTIVATE SO DONE, elapsed: %f' % elapsed_time)
 
 
 class DeploySO(Task):
+    interval = 7
+    reported = True
+
     def __init__(self, entity, extras):
         Task.__init__(self, entity, extras, state='deploy')
         if self.entity.extras['ops_version'] == 'v2':
@@ -466,18 +500,6 @@ class DeploySO(Task):
         # otherwise we won't be able to hand back a working service!
         #LOG.debug('DEPLOY SO START')
 
-        self.start_time = time.time()
-        infoDict = {
-                    'so_id': self.entity.attributes['occi.core.id'],
-                    'sm_name': self.entity.kind.term,
-                    'so_phase': 'deploy',
-                    'phase_event': 'start',
-                    'response_time': 0,
-                    'tenant': self.extras['tenant_name']
-                    }
-        tmpJSON = json.dumps(infoDict)
-        LOG.debug(tmpJSON)
-
         #LOG.debug('Deploying the SO bundle...')
         url = HTTP + self.host + '/orchestrator/default'
         params = {'action': 'deploy'}
@@ -493,60 +515,22 @@ class DeploySO(Task):
         LOG.debug('Deploying SO with: ' + url)
         LOG.info('Sending headers: ' + heads.__repr__())
         http_retriable_request('POST', url, headers=heads, params=params)
+        return self.entity, self.extras
 
-        # also sleep here to keep phases consistent during greenfield
-        while not self.deploy_complete(url):
-                    time.sleep(7)
+    def done(self):
+        # also wait here to keep phases consistent during greenfield
+        if not deploy_complete(HTTP + self.host + '/orchestrator/default', self.extras):
+            return False
 
         self.entity.attributes['mcn.service.state'] = 'deploy'
         LOG.debug('SO Deployed ')
-        elapsed_time = time.time() - self.start_time
-        infoDict = {
-                    'so_id': self.entity.attributes['occi.core.id'],
-                    'sm_name': self.entity.kind.term,
-                    'so_phase': 'deploy',
-                    'phase_event': 'done',
-                    'response_time': elapsed_time,
-                    'tenant': self.extras['tenant_name']
-                    }
-        tmpJSON = json.dumps(infoDict)
-        LOG.debug(tmpJSON)
-        #LOG.debug('DEPLOY SO DONE, elapsed: %f' % elapsed_time)
-        return self.entity, self.extras
-
-    def deploy_complete(self, url):
-        # XXX fugly - code copied from Resolver
-        heads = {
-            'Content-type': 'text/occi',
-            'Accept': 'application/occi+json',
-            'X-Auth-Token': self.extras['token'],
-            'X-Tenant-Name': self.extras['tenant_name'],
-        }
-
-        LOG.info('checking service state at: ' + url)
-        LOG.info('sending headers: ' + heads.__repr__())
-
-        r = http_retriable_request('GET', url, headers=heads)
-        attrs = json.loads(r.content)
-
-        if len(attrs['attributes']) > 0:
-            attr_hash = attrs['attributes']
-            stack_state = ''
-            try:
-                stack_state = attr_hash['occi.mcn.stack.state']
-            except KeyError:
-                pass
-
-            LOG.info('Current service state: ' + str(stack_state))
-            if stack_state == 'CREATE_COMPLETE' or stack_state == 'UPDATE_COMPLETE':
-                LOG.info('Stack is ready')
-                return True
-            else:
-                LOG.info('Stack is not ready. Current state state: ' + stack_state)
-                return False
+        return True
 
 
 class ProvisionSO(Task):
+    interval = 13
+    reported = True
+
     def __init__(self, entity, extras):
         Task.__init__(self, entity, extras, state='provision')
         if self.entity.extras['ops_version'] == 'v2':
@@ -555,29 +539,15 @@ class ProvisionSO(Task):
         elif self.entity.extras['ops_version'] == 'v3':
             self.host = self.entity.extras['loc']
 
+    def ready(self):
+        # this can only run once the deployment has completed!
+        # with stuff like this, we need to have a callback mechanism...
+        return deploy_complete(HTTP + self.host + '/orchestrator/default', self.extras)
+
     def run(self):
-        # this can only run until the deployment has complete!
-        # this will block until run() returns
         #LOG.debug('PROVISION SO START')
 
-        self.start_time = time.time()
-        infoDict = {
-                    'so_id': self.entity.attributes['occi.core.id'],
-                    'sm_name': self.entity.kind.term,
-                    'so_phase': 'provision',
-                    'phase_event': 'start',
-                    'response_time': 0,
-                    'tenant': self.extras['tenant_name']
-                    }
-        tmpJSON = json.dumps(infoDict)
-        LOG.debug(tmpJSON)
-
         url = HTTP + self.host + '/orchestrator/default'
-
-        # with stuff like this, we need to have a callback mechanism... this will block otherwise
-        while not self.deploy_complete(url):
-            time.sleep(13)
-
         params = {'action': 'provision'}
         heads = {
             'Category': 'provision; scheme="http://schemas.mobile-cloud-networking.eu/occi/service#"',
@@ -592,54 +562,9 @@ class ProvisionSO(Task):
         LOG.info('Sending headers: ' + heads.__repr__())
         http_retriable_request('POST', url, headers=heads, params=params)
 
-        elapsed_time = time.time() - self.start_time
-        infoDict = {
-                    'so_id': self.entity.attributes['occi.core.id'],
-                    'sm_name': self.entity.kind.term,
-                    'so_phase': 'provision',
-                    'phase_event': 'done',
-                    'response_time': elapsed_time,
-                    'tenant': self.extras['tenant_name']
-                    }
-        tmpJSON = json.dumps(infoDict)
-        LOG.debug(tmpJSON)
-        #LOG.debug('PROVISION SO DONE, elapsed: %f' % elapsed_time)
         self.entity.attributes['mcn.service.state'] = 'provision'
         return self.entity, self.extras
 
-    def deploy_complete(self, url):
-        # XXX fugly - code copied from Resolver
-        heads = {
-            'Content-type': 'text/occi',
-            'Accept': 'application/occi+json',
-            'X-Auth-Token': self.extras['token'],
-            'X-Tenant-Name': self.extras['tenant_name'],
-        }
-
-        LOG.info('checking service state at: ' + url)
-        LOG.info('sending headers: ' + heads.__repr__())
-
-        r = http_retriable_request('GET', url, headers=heads)
-        attrs = json.loads(r.content)
-
-        if len(attrs['attributes']) > 0:
-            attr_hash = attrs['attributes']
-            stack_state = ''
-            try:
-                stack_state = attr_hash['occi.mcn.stack.state']
-            except KeyError:
-                pass
-
-            LOG.info('Current service state: ' + str(stack_state))
-            if stack_state == 'CREATE_COMPLETE' or stack_state == 'UPDATE_COMPLETE':
-                LOG.info('Stack is ready')
-                return True
-            elif stack_state == 'CREATE_FAILED':
-                raise RuntimeError('Heat stack creation failed.')
-            else:
-                LOG.info('Stack is not ready. Current state state: ' + stack_state)
-                return False
-
 
 class RetrieveSO(Task):
 
@@ -658,18 +583,6 @@ class RetrieveSO(Task):
         #   -H 'X-Auth-Token: '$KID \
         #   -H 'X-Tenant-Name: '$TENANT
 
-        self.start_time = time.time()
-        infoDict = {
-                    'so_id': self.entity.attributes['occi.core.id'],
-                    'sm_name': self.entity.kind.term,
-                    'so_phase': 'retrieve',
-                    'phase_event': 'start',
-                    'response_time': 0,
-                    'tenant': self.extras['tenant_name']
-                    }
-        tmpJSON = json.dumps(infoDict)
-        LOG.debug(tmpJSON)
-
         if self.entity.attributes['mcn.service.state'] in ['activate', 'deploy', 'provision', 'update']:
             heads = {
                 'Content-Type': 'text/occi',
@@ -680,17 +593,13 @@ class RetrieveSO(Task):
             LOG.info('Sending headers: ' + heads.__repr__())
             r = http_retriable_request('GET', HTTP + self.host + '/orchestrator/default', headers=heads)
 
-            attrs = r.headers['x-occi-attribute'].split(', ')
-            for attr in attrs:
-                kv = attr.split('=')
-                if kv[0] != 'occi.core.id':
-                    if kv[1].startswith('"') and kv[1].endswith('"'):
-                        kv[1] = kv[1][1:-1]  # scrub off quotes
-                    self.entity.attributes[kv[0]] = kv[1]
-                    LOG.debug('OCCI Attribute: ' + kv[0] + ' --> ' + kv[1])
+            attrs = parse_attributes(r.headers['x-occi-attribute'])
+            attrs.pop('occi.core.id', None)
+            self.entity.attributes.update(attrs)
+            LOG.debug('OCCI Attributes: ' + attrs.__repr__())
 
             # Assemble the SIG
-            svcinsts = ''
+            svcinsts = None
             try:
                 svcinsts = self.entity.attributes['mcn.so.svcinsts']
                 del self.entity.attributes['mcn.so.svcinsts']  # remove this, not be be used anywhere else
@@ -701,36 +610,14 @@ class RetrieveSO(Task):
             if self.registry is None:
                 LOG.error('No registry!')
 
-            if len(svcinsts) > 0:
-                svcinsts = svcinsts.split()  # all instance EPs
-                for svc_loc in svcinsts:
-                    # TODO get the service instance resource representation
-                    # source resource is self.entity
-                    compos = svc_loc.split('/')
-                    key = '/' + compos[3] + '/' + compos[4]
-                    target = Resource(key, Resource.kind, [])  # target resource
-                    target.attributes['mcn.sm.endpoint'] = svc_loc
-                    self.registry.add_resource(key, target, None)
-
-                    key = '/link/'+str(uuid.uuid4())
-                    link = Link(key, Link.kind, [], self.entity, target)
-                    self.registry.add_resource(key, link, None)
-                    self.entity.links.append(link)
+            if svcinsts is not None:
+                # TODO get the service instance resource representation
+                # links already in place from a previous retrieve are kept as they are, those to instances no
+                # longer listed are removed
+                link_instances(self.registry, self.entity, svcinsts.split())
         else:
             LOG.debug('Cannot GET entity as it is not in the activated, deployed or provisioned, updated state')
 
-        elapsed_time = time.time() - self.start_time
-        infoDict = {
-                    'so_id': self.entity.attributes['occi.core.id'],
-                    'sm_name': self.entity.kind.term,
-                    'so_phase': 'retrieve',
-                    'phase_event': 'done',
-                    'response_time': elapsed_time,
-                    'tenant': self.extras['tenant_name']
-                    }
-        tmpJSON = json.dumps(infoDict)
-        LOG.debug(tmpJSON)
-
         return self.entity, self.extras
 
 
@@ -755,35 +642,22 @@ class UpdateSO(Task):
         #       -H 'X-Tenant-Name: '$TENANT \
         #       -H 'X-OCCI-Attribute: occi.epc.attr_1="foo"'
 
-        self.start_time = time.time()
-        infoDict = {
-                    'so_id': self.entity.attributes['occi.core.id'],
-                    'sm_name': self.entity.kind.term,
-                    'so_phase': 'update',
-                    'phase_event': 'start',
-                    'response_time': 0,
-                    'tenant': self.extras['tenant_name']
-                    }
-        tmpJSON = json.dumps(infoDict)
-        LOG.debug(tmpJSON)
-
         url = HTTP + self.host + '/orchestrator/default'
         heads = {
             'Content-Type': 'text/occi',
             'X-Auth-Token': self.extras['token'],
             'X-Tenant-Name': self.extras['tenant_name']}
 
-        occi_attrs = self.extras['srv_prms'].service_parameters(self.state)
-
-        if len(occi_attrs) > 0:
-            LOG.info('Adding service-specific parameters to call... X-OCCI-Attribute:' + occi_attrs)
-            heads['X-OCCI-Attribute'] = occi_attrs
-
         if len(self.new.attributes) > 0:
             LOG.info('Adding updated parameters... X-OCCI-Attribute: ' + self.new.attributes.__repr__())
-            for k, v in self.new.attributes.items():
-                occi_attrs = occi_attrs + ', ' + k + '=' + v
-                self.entity.attributes[k] = v
+            self.entity.attributes.update(self.new.attributes)
+        # the updated values are sent as the client wrote them, strings quoted and numbers not, like the client
+        # supplied parameters of the instance
+        occi_attrs = ', '.join(attrs for attrs in (self.extras['srv_prms'].service_parameters(self.state),
+                                                   ', '.join(client_fragments(self.new.attributes)))
+                               if len(attrs) > 0)
+        if len(occi_attrs) > 0:
+            LOG.info('Adding service-specific parameters to call... X-OCCI-Attribute: ' + occi_attrs)
             heads['X-OCCI-Attribute'] = occi_attrs
 
         LOG.debug('Updating (Provisioning) SO with: ' + url)
@@ -792,60 +666,48 @@ class UpdateSO(Task):
         http_retriable_request('POST', url, headers=heads)
 
         self.entity.attributes['mcn.service.state'] = 'update'
-
-        #start thread here
-        thread = Thread(target = deploy_complete, args = (url, self.start_time, self.extras, self.entity ))
-        thread.start()
-
         return self.entity, self.extras
 
-
-def deploy_complete(url, start_time, extras, entity):
-
-    done = False
-
-    while done == False:
-        # XXX fugly - code copied from Resolver
-        heads = {
-            'Content-type': 'text/occi',
-            'Accept': 'application/occi+json',
-            'X-Auth-Token': extras['token'],
-            'X-Tenant-Name': extras['tenant_name'],
-        }
-
-        LOG.info('checking service state at: ' + url)
-        LOG.info('sending headers: ' + heads.__repr__())
-
-        r = http_retriable_request('GET', url, headers=heads)
-        attrs = json.loads(r.content)
-
-        if len(attrs['attributes']) > 0:
-            attr_hash = attrs['attributes']
-            stack_state = ''
-            try:
-                stack_state = attr_hash['occi.mcn.stack.state']
-            except KeyError:
-                pass
-
-            LOG.info('Current service state: ' + str(stack_state))
-            if stack_state == 'CREATE_COMPLETE' or stack_state == 'UPDATE_COMPLETE':
-                LOG.info('Stack is ready')
-                elapsed_time = time.time() - start_time
-                infoDict = {
-                    'so_id': entity.attributes['occi.core.id'],
-                    'sm_name': entity.kind.term,
-                    'so_phase': 'update',
-                    'phase_event': 'done',
-                    'response_time': elapsed_time,
-                    'tenant': extras['tenant_name']
-                    }
-                tmpJSON = json.dumps(infoDict)
-                LOG.debug(tmpJSON)
-                done = True
-            else:
-                LOG.info('Stack is not ready. Current state state: ' + stack_state)
-                done = False
-                time.sleep(3)
+    def done(self):
+        # the update has completed once the stack has
+        return deploy_complete(HTTP + self.host + '/orchestrator/default', self.extras)
+
+
+def deploy_complete(url, extras):
+    # the check of the deploy, provision and update phases; a stack which failed fails the phase
+    # XXX fugly - code copied from Resolver
+    heads = {
+        'Content-type': 'text/occi',
+        'Accept': 'application/occi+json',
+        'X-Auth-Token': extras['token'],
+        'X-Tenant-Name': extras['tenant_name'],
+    }
+
+    LOG.info('checking service state at: ' + url)
+    LOG.info('sending headers: ' + heads.__repr__())
+
+    r = http_retriable_request('GET', url, headers=heads)
+    attrs = json.loads(r.content)
+
+    if len(attrs['attributes']) > 0:
+        attr_hash = attrs['attributes']
+        stack_state = ''
+        try:
+            stack_state = attr_hash['occi.mcn.stack.state']
+        except KeyError:
+            pass
+
+        LOG.info('Current service state: ' + str(stack_state))
+        if stack_state == 'CREATE_COMPLETE' or stack_state == 'UPDATE_COMPLETE':
+            LOG.info('Stack is ready')
+            return True
+        elif stack_state == 'CREATE_FAILED':
+            raise RuntimeError('Heat stack creation failed.')
+        elif stack_state == 'UPDATE_FAILED':
+            raise RuntimeError('Heat stack update failed.')
+        else:
+            LOG.info('Stack is not ready. Current state state: ' + stack_state)
+    return False
 
 
 class DestroySO(Task):
@@ -868,18 +730,6 @@ class DestroySO(Task):
         #   -H 'X-Auth-Token: '$KID \
         #   -H 'X-Tenant-Name: '$TENANT
 
-        self.start_time = time.time()
-        infoDict = {
-                    'so_id': self.entity.attributes['occi.core.id'],
-                    'sm_name': self.entity.kind.term,
-                    'so_phase': 'destroy',
-                    'phase_event': 'start',
-                    'response_time': 0,
-                    'tenant': self.extras['tenant_name']
-                    }
-        tmpJSON = json.dumps(infoDict)
-        LOG.debug(tmpJSON)
-
         url = HTTP + self.host + '/orchestrator/default'
         heads = {'X-Auth-Token': self.extras['token'],
                  'X-Tenant-Name': self.extras['tenant_name']}
@@ -892,7 +742,10 @@ class DestroySO(Task):
 
         http_retriable_request('DELETE', url, headers=heads)
 
-        url = self.nburl + self.entity.identifier.replace('/' + self.entity.kind.term + '/', '/app/')
+        # instances created before the app path was kept are named after their app
+        app_path = self.entity.extras.get('app_path',
+                                          self.entity.identifier.replace('/' + self.entity.kind.term + '/', '/app/'))
+        url = self.nburl + app_path
         heads = {'Content-Type': 'text/occi',
                  'X-Auth-Token': self.extras['token'],
                  'X-Tenant-Name': self.extras['tenant_name']}
@@ -900,16 +753,4 @@ class DestroySO(Task):
         LOG.info('Sending headers: ' + heads.__repr__())
         http_retriable_request('DELETE', url, headers=heads, authenticate=True)
 
-        elapsed_time = time.time() - self.start_time
-        infoDict = {
-                    'so_id': self.entity.attributes['occi.core.id'],
-                    'sm_name': self.entity.kind.term,
-                    'so_phase': 'destroy',
-                    'phase_event': 'done',
-                    'response_time': elapsed_time,
-                    'tenant': self.extras['tenant_name']
-                    }
-        tmpJSON = json.dumps(infoDict)
-        LOG.debug(tmpJSON)
-
         return self.entity, self.extras
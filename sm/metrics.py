@@ -0,0 +1,187 @@
+# Copyright 2014-2015 Zuercher Hochschule fuer Angewandte Wissenschaften
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Counters, gauges and histograms kept in memory and rendered in the Prometheus text exposition format.
+
+Each metric has a fixed list of label names; values are kept per combination of label values:
+
+    PHASES = REGISTRY.counter('sm_phases_total', 'Phases run.', ['phase'])
+    PHASES.inc(phase='deploy')
+"""
+
+from bisect import bisect_left
+import threading
+
+__author__ = 'andy'
+
+# in seconds, lifecycle phases take from milliseconds to tens of minutes
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def render_labels(names, values, extra=None):
+    pairs = ['%s="%s"' % (name, escape(value)) for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append('%s="%s"' % extra)
+    return '{' + ','.join(pairs) + '}' if len(pairs) > 0 else ''
+
+
+def render_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class Metric(object):
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def key(self, labels):
+        try:
+            return tuple(str(labels[name]) for name in self.labels)
+        except KeyError as e:
+            raise ValueError('Missing label ' + str(e) + ' for metric ' + self.name)
+
+    def get(self, **labels):
+        with self.lock:
+            return self.values.get(self.key(labels), 0)
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.documentation), '# TYPE %s %s' % (self.name, self.kind)]
+        with self.lock:
+            for key in sorted(self.values):
+                lines.extend(self.samples(key, self.values[key]))
+        return lines
+
+    def samples(self, key, value):
+        return ['%s%s %s' % (self.name, render_labels(self.labels, key), render_value(value))]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            if key not in self.values:
+                # per bucket counts (not cumulative), sum of the observations
+                self.values[key] = [[0] * len(self.buckets), 0.0]
+            counts = self.values[key]
+            counts[0][bisect_left(self.buckets, value)] += 1
+            counts[1] += value
+
+    def get(self, **labels):
+        """
+        :return: (number of observations, sum of the observations)
+        """
+        with self.lock:
+            counts = self.values.get(self.key(labels))
+            return (sum(counts[0]), counts[1]) if counts is not None else (0, 0.0)
+
+    def samples(self, key, value):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, value[0]):
+            cumulative += count
+            lines.append('%s_bucket%s %d' % (self.name, render_labels(self.labels, key, ('le', render_value(bound))),
+                                              cumulative))
+        lines.append('%s_sum%s %s' % (self.name, render_labels(self.labels, key), render_value(value[1])))
+        lines.append('%s_count%s %d' % (self.name, render_labels(self.labels, key), cumulative))
+        return lines
+
+
+class MetricsRegistry(object):
+    """
+    Creates metrics and renders all of them. Asking twice for a metric of the same name returns the
+    same metric.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def counter(self, name, documentation, labels=()):
+        return self.__register(Counter, name, documentation, labels)
+
+    def gauge(self, name, documentation, labels=()):
+        return self.__register(Gauge, name, documentation, labels)
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.__register(Histogram, name, documentation, labels, buckets=buckets)
+
+    def exposition(self):
+        """
+        :return: all metrics in the Prometheus text format (version 0.0.4)
+        """
+        with self.lock:
+            metrics = [self.metrics[name] for name in sorted(self.metrics)]
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def __register(self, cls, name, documentation, labels, **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = cls(name, documentation, labels, **kwargs)
+                self.metrics[name] = metric
+            elif not isinstance(metric, cls) or metric.labels != tuple(labels):
+                raise ValueError('Metric ' + name + ' is already registered differently')
+            return metric
+
+
+REGISTRY = MetricsRegistry()
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
@@ -0,0 +1,228 @@
+# Copyright 2014-2015 Zuercher Hochschule fuer Angewandte Wissenschaften
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Central scheduler for readiness checks.
+
+Rather than having one thread per service instance sleeping in its own polling loop, all pending checks are
+kept on a single heap ordered by their due time. One timer thread pops the checks that are due and hands them
+to a small, fixed pool of worker threads that issue the (HTTP) calls. When a check passes, the callback that
+continues the waiting lifecycle step is executed on the same worker.
+"""
+
+import heapq
+import itertools
+import logging
+from Queue import Queue
+import threading
+import time
+
+__author__ = 'andy'
+
+LOG = logging.getLogger(__name__)
+
+
+class Watch(object):
+    """
+    A pending readiness check.
+    """
+
+    def __init__(self, check, on_ready, on_error, interval, key, backoff=1, max_interval=None):
+        self.check = check
+        self.on_ready = on_ready
+        self.on_error = on_error
+        self.interval = interval
+        self.key = key
+        self.backoff = backoff
+        self.max_interval = max_interval
+        self.created = time.time()
+        self.cancelled = False
+        self.checks = 0
+        self.due = None  # sequence number of the pending heap entry, older entries are ignored
+        self.in_flight = False  # handed to a worker
+        self.poked = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def next_interval(self):
+        # the interval to use now, backing off for the following check
+        interval = self.interval
+        self.interval = interval * self.backoff
+        if self.max_interval is not None:
+            self.interval = min(self.interval, self.max_interval)
+        return interval
+
+
+class ReadinessPoller(object):
+    """
+    Owns all pending readiness checks. Checks are issued on a timer heap and executed through a bounded pool of
+    worker threads, so the number of threads is independent of the number of instances being waited upon.
+    """
+
+    def __init__(self, workers=4):
+        self.workers = workers
+        self.heap = []
+        self.seq = itertools.count()
+        self.cond = threading.Condition()
+        self.jobs = Queue()
+        self.watches = {}  # key -> set of pending watches, used for cancellation
+        self.threads = []
+
+    def start(self):
+        with self.cond:
+            if len(self.threads) > 0:
+                return
+            timer = threading.Thread(target=self.__timer, name='poller-timer')
+            timer.setDaemon(True)
+            self.threads.append(timer)
+            for i in range(self.workers):
+                worker = threading.Thread(target=self.__worker, name='poller-worker-' + str(i))
+                worker.setDaemon(True)
+                self.threads.append(worker)
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, func, *args):
+        """
+        Executes func(*args) on one of the worker threads.
+        """
+        self.start()
+        self.jobs.put((func, args))
+
+    def watch(self, check, on_ready=None, on_error=None, interval=3, delay=0, key=None, backoff=1,
+              max_interval=None):
+        """
+        Polls check() every interval seconds, starting after delay seconds, until it returns a true value.
+        on_ready() is then called. Should check() raise, on_error(exception) is called and polling stops.
+        With a backoff greater than 1 the interval grows exponentially after each failed check, up to
+        max_interval.
+
+        :param check: callable returning True when the awaited condition is met
+        :param on_ready: callable executed once the condition is met
+        :param on_error: callable receiving the exception raised by check
+        :param interval: seconds between two checks
+        :param delay: seconds before the first check is issued
+        :param key: optional identifier (e.g. the entity identifier) used to cancel pending checks
+        :param backoff: factor applied to the interval after each failed check
+        :param max_interval: upper bound of the interval
+        :return: the Watch
+        """
+        watch = Watch(check, on_ready, on_error, interval, key, backoff, max_interval)
+        if key is not None:
+            with self.cond:
+                self.watches.setdefault(key, set()).add(watch)
+        self.__schedule(watch, delay)
+        return watch
+
+    def cancel(self, key):
+        """
+        Cancels all pending checks registered under key.
+
+        :return: the number of cancelled checks
+        """
+        with self.cond:
+            watches = self.watches.pop(key, set())
+        for watch in watches:
+            watch.cancel()
+        return len(watches)
+
+    def poke(self, key):
+        """
+        Issues the pending checks registered under key right away, e.g. because the awaited condition was
+        reported to be met, rather than at their due time. A check already being issued is repeated right away
+        should it fail.
+
+        :return: the number of checks poked
+        """
+        with self.cond:
+            watches = list(self.watches.get(key, ()))
+            for watch in watches:
+                if watch.in_flight:
+                    watch.poked = True
+                else:
+                    self.__schedule(watch, 0)
+        return len(watches)
+
+    def pending(self):
+        with self.cond:
+            return len([entry for entry in self.heap if not entry[2].cancelled and entry[2].due == entry[1]])
+
+    def __schedule(self, watch, delay):
+        self.start()
+        with self.cond:
+            watch.due = next(self.seq)
+            heapq.heappush(self.heap, (time.time() + delay, watch.due, watch))
+            self.cond.notify()
+
+    def __forget(self, watch):
+        if watch.key is None:
+            return
+        with self.cond:
+            watches = self.watches.get(watch.key)
+            if watches is not None:
+                watches.discard(watch)
+                if len(watches) == 0:
+                    del self.watches[watch.key]
+
+    def __timer(self):
+        while True:
+            with self.cond:
+                while len(self.heap) == 0:
+                    self.cond.wait()
+                due, seq, watch = self.heap[0]
+                now = time.time()
+                if due > now:
+                    self.cond.wait(due - now)
+                    continue
+                heapq.heappop(self.heap)
+                # a poked watch has a later entry as well
+                if watch.cancelled or watch.due != seq:
+                    continue
+                watch.in_flight = True
+                watch.poked = False
+            self.jobs.put((self.__poll, (watch,)))
+
+    def __worker(self):
+        while True:
+            func, args = self.jobs.get()
+            try:
+                func(*args)
+            except Exception as e:
+                LOG.exception('Background job failed: ' + e.__repr__())
+
+    def __poll(self, watch):
+        if watch.cancelled:
+            return
+        watch.checks += 1
+        try:
+            ready = watch.check()
+        except Exception as e:
+            self.__forget(watch)
+            if watch.on_error is None:
+                raise
+            watch.on_error(e)
+            return
+
+        if watch.cancelled:
+            return
+        if ready:
+            self.__forget(watch)
+            if watch.on_ready is not None:
+                watch.on_ready()
+        else:
+            with self.cond:
+                watch.in_flight = False
+                self.__schedule(watch, 0 if watch.poked else watch.next_interval())
@@ -20,6 +20,7 @@ import os
 
 from config import CONFIG
 from log import LOG
+from tracing import TRACER
 
 
 __author__ = 'andy'
@@ -61,6 +62,16 @@ def http_retriable_request(verb, url, headers={}, authenticate=False, params={})
                     e.g. CC requests
     :return: result of the request
     """
+    # each attempt is a child span of the active span, its context is passed on to the called service
+    with TRACER.span('HTTP ' + verb, attributes={'http.method': verb, 'http.url': url}) as span:
+        headers = TRACER.inject(headers)
+        r = send_request(verb, url, headers, authenticate, params)
+        if r is not None:
+            span.set_attribute('http.status_code', r.status_code)
+        return r
+
+
+def send_request(verb, url, headers, authenticate, params):
     LOG.debug(verb + ' on ' + url + ' with headers ' + headers.__repr__())
 
     auth = ()
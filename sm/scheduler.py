@@ -0,0 +1,204 @@
+# Copyright 2014-2015 Zuercher Hochschule fuer Angewandte Wissenschaften
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Admission of lifecycle work (one instantiation) across tenants.
+
+Work is admitted by weighted fair queueing: each tenant has a queue and every job gets a virtual finish
+tag of max(virtual time, tag of the tenant's previous job) + 1 / weight. The job with the lowest tag among
+the tenants that are below their concurrency limit is started next, as long as a slot is free. A tenant
+submitting many jobs at once therefore does not delay the jobs of other tenants by more than its share.
+"""
+
+from collections import deque
+import logging
+import threading
+import time
+
+__author__ = 'andy'
+
+LOG = logging.getLogger(__name__)
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+class Job(object):
+    """
+    A unit of work of a tenant, see FairScheduler.admit(). release() must be called once the work has
+    finished, or if it is not going to be run.
+    """
+
+    def __init__(self, scheduler, tenant):
+        self.scheduler = scheduler
+        self.tenant = tenant
+        self.start = None
+        self.tag = (0.0, 0)
+        self.queued = 0.0
+        self.running = False
+        self.released = False
+
+    def run(self, start):
+        # start() is called without arguments once the job is admitted
+        self.scheduler.enqueue(self, start)
+
+    def release(self):
+        self.scheduler.release(self)
+
+    def withdraw(self):
+        """
+        Releases the job unless it has been started and is still running.
+
+        :return: False if the job is running
+        """
+        return self.scheduler.withdraw(self)
+
+
+class FairScheduler(object):
+    """
+    slots is the number of jobs running at the same time over all tenants. Per tenant, max_concurrent
+    limits the running jobs and max_pending the jobs running or waiting; a job beyond max_pending is
+    rejected. 0 means no limit. weight, max_concurrent and max_pending can be set per tenant with
+    overrides: {tenant: {'weight': 2, 'max_concurrent': 5, 'max_pending': 50}}; tenant names are matched
+    case-insensitively.
+    """
+
+    def __init__(self, slots=0, weight=1, max_concurrent=0, max_pending=0, overrides=None):
+        self.slots = slots
+        self.defaults = {'weight': weight, 'max_concurrent': max_concurrent, 'max_pending': max_pending}
+        self.overrides = dict((tenant.lower(), limits) for tenant, limits in (overrides or {}).items())
+        self.lock = threading.Lock()
+        self.vtime = 0.0
+        self.seq = 0
+        self.running = 0
+        self.tenants = {}
+
+    def limit(self, tenant, name):
+        return self.overrides.get(tenant.lower(), {}).get(name, self.defaults[name])
+
+    def admit(self, tenant):
+        """
+        :return: a Job of tenant, counted against its quota
+        :raises QuotaExceeded: if tenant already has max_pending jobs running or waiting
+        """
+        max_pending = self.limit(tenant, 'max_pending')
+        with self.lock:
+            state = self.__tenant(tenant)
+            if 0 < max_pending <= state['pending']:
+                state['rejected'] += 1
+                raise QuotaExceeded('Tenant ' + tenant + ' has reached its quota of ' + str(max_pending) +
+                                    ' instantiations in progress.')
+            state['pending'] += 1
+        return Job(self, tenant)
+
+    def enqueue(self, job, start):
+        with self.lock:
+            if job.released:
+                return
+            state = self.__tenant(job.tenant)
+            job.start = start
+            job.queued = time.time()
+            state['tag'] = max(self.vtime, state['tag']) + 1.0 / self.limit(job.tenant, 'weight')
+            # equal tags are served in the order of submission
+            self.seq += 1
+            job.tag = (state['tag'], self.seq)
+            state['queue'].append(job)
+        self.__dispatch()
+
+    def release(self, job):
+        self.__release(job, running=True)
+
+    def withdraw(self, job):
+        return self.__release(job, running=False)
+
+    def __release(self, job, running):
+        # a job that is running is only released with running, returns False if it is not
+        with self.lock:
+            if job.released:
+                return True
+            if job.running and not running:
+                return False
+            job.released = True
+            state = self.tenants[job.tenant]
+            state['pending'] -= 1
+            if job.running:
+                state['running'] -= 1
+                self.running -= 1
+            elif job in state['queue']:
+                state['queue'].remove(job)
+            if state['pending'] == 0:
+                # nothing of the tenant runs or waits, its next job is tagged from the virtual time anyway
+                del self.tenants[job.tenant]
+        self.__dispatch()
+        return True
+
+    def stats(self):
+        """
+        :return: {tenant: {pending, running, queued, admitted, rejected, wait_avg, wait_max}} of the tenants with
+                 jobs pending; the counts of a tenant start over once all its jobs were released
+        """
+        with self.lock:
+            return dict((tenant, {
+                'pending': state['pending'],
+                'running': state['running'],
+                'queued': len(state['queue']),
+                'admitted': state['admitted'],
+                'rejected': state['rejected'],
+                'wait_avg': state['wait'] / state['admitted'] if state['admitted'] > 0 else 0.0,
+                'wait_max': state['wait_max']
+            }) for tenant, state in self.tenants.items())
+
+    def __tenant(self, tenant):
+        if tenant not in self.tenants:
+            self.tenants[tenant] = {'queue': deque(), 'tag': 0.0, 'pending': 0, 'running': 0, 'admitted': 0,
+                                    'rejected': 0, 'wait': 0.0, 'wait_max': 0.0}
+        return self.tenants[tenant]
+
+    def __next(self):
+        # the eligible job with the lowest virtual finish tag, None if there is none
+        if 0 < self.slots <= self.running:
+            return None
+        best = None
+        for tenant, state in self.tenants.items():
+            if len(state['queue']) == 0:
+                continue
+            if 0 < self.limit(tenant, 'max_concurrent') <= state['running']:
+                continue
+            if best is None or state['queue'][0].tag < best.tag:
+                best = state['queue'][0]
+        return best
+
+    def __dispatch(self):
+        while True:
+            with self.lock:
+                job = self.__next()
+                if job is None:
+                    return
+                state = self.tenants[job.tenant]
+                state['queue'].popleft()
+                state['running'] += 1
+                self.running += 1
+                job.running = True
+                self.vtime = job.tag[0]
+                waited = time.time() - job.queued
+                state['admitted'] += 1
+                state['wait'] += waited
+                state['wait_max'] = max(state['wait_max'], waited)
+            try:
+                job.start()
+            except Exception as e:
+                LOG.error('Could not start job of tenant ' + job.tenant + ': ' + e.__repr__())
+                job.release()
@@ -19,6 +19,7 @@ import os
 import requests
 import sys
 import signal
+import threading
 from urlparse import urlparse
 
 from keystoneclient.v2_0 import client
@@ -26,15 +27,19 @@ from occi.backend import KindBackend
 from occi.core_model import Link, Kind, Resource
 from occi.exceptions import HTTPError
 from occi.registry import NonePersistentRegistry
-from occi.wsgi import Application
+from occi.wsgi import Application, RETURN_CODES
 from tornado import httpserver
 from tornado import ioloop
+from tornado import web
 from tornado import wsgi
 from wsgiref.simple_server import make_server
 
 from sm.backends import ServiceBackend
+from sm.bulk import BULK_PATH, BulkHandler
+from sm.callbacks import CALLBACK_PATH, authentic, parse_callback
 from sm.config import CONFIG, CONFIG_PATH
 from sm.log import LOG
+from sm import sharing
 from sdk.mcn import util
 from sdk.mcn.security import KeyStoneAuthService
 
@@ -42,6 +47,10 @@ import jsonpickle
 from pymongo import MongoClient
 from bson.objectid import ObjectId
 from sm.mongo_key_replacer import KeyTransform
+from sm.links import compact
+from sm.managers.generic import ATTRIBUTES, reported
+from sm.versions import ResourceVersions, matches
+from sm.watch import WATCH_PATH, WatchHandler
 from ConfigParser import NoSectionError
 
 __author__ = 'andy'
@@ -84,6 +93,11 @@ class MongoRegistry(NonePersistentRegistry):
             if resources is not None:
                 self.o_id = resources.pop('_id')
                 self.resources = jsonpickle.decode(json.dumps(resources))
+                # registries saved by earlier versions hold a new link per retrieve of a composed instance
+                removed = compact(self.resources)
+                if removed > 0:
+                    LOG.info('Removed ' + str(removed) + ' duplicate links from the registry.')
+                    self.save_resources_registry()
         else:
             raise AttributeError('No mongo address provided')
 
@@ -168,20 +182,24 @@ class MApplication(Application):
             reg = SMMongoRegistry(mongo_addr)
         super(MApplication, self).__init__(reg)
 
+        # the kind of the service offered, instances of it can be created in batches
+        self.service_kind = None
         self.register_backend(Link.kind, KindBackend())
+        # ETags of the resources, see _call_get
+        self.versions = ResourceVersions()
+        # serialises the creates and deletes of shared instances, see sm.sharing
+        self.sharing = threading.Lock()
 
     def register_backend(self, category, backend):
+        if isinstance(backend, ServiceBackend):
+            self.service_kind = category
         return super(MApplication, self).register_backend(category, backend)
 
-    def __call__(self, environ, response):
-        token = environ.get('HTTP_X_AUTH_TOKEN', '')
-
+    def authenticate(self, token, tenant):
         if token == '':
             LOG.error('No X-Auth-Token header supplied.')
             raise HTTPError(400, 'No X-Auth-Token header supplied.')
 
-        tenant = environ.get('HTTP_X_TENANT_NAME', '')
-
         if tenant == '':
             LOG.error('No X-Tenant-Name header supplied.')
             raise HTTPError(400, 'No X-Tenant-Name header supplied.')
@@ -195,7 +213,162 @@ class MApplication(Application):
         if not auth.verify(token=token, tenant_name=tenant):
             raise HTTPError(401, 'Token is not valid. You likely need an updated token.')
 
-        return self._call_occi(environ, response, token=token, tenant_name=tenant, registry=self.registry)
+    def __call__(self, environ, response):
+        if environ['PATH_INFO'].startswith(CALLBACK_PATH + '/'):
+            # SOs authenticate with the token of their instance rather than with keystone
+            return self._call_callback(environ, response)
+
+        token = environ.get('HTTP_X_AUTH_TOKEN', '')
+        tenant = environ.get('HTTP_X_TENANT_NAME', '')
+        self.authenticate(token, tenant)
+
+        # the trace of the client, if any, is continued by the lifecycle of the instance
+        traceparent = environ.get('HTTP_TRACEPARENT', '')
+        # Cache-Control: no-cache forces attributes to be retrieved from the SO
+        cache_control = environ.get('HTTP_CACHE_CONTROL', '') + ' ' + environ.get('HTTP_PRAGMA', '')
+
+        if environ['PATH_INFO'] == BULK_PATH:
+            return self._call_bulk(environ, response, token=token, tenant_name=tenant, registry=self.registry,
+                                   traceparent=traceparent, cache_control=cache_control.lower())
+
+        path = environ['PATH_INFO']
+        if any(sharing.environ_key(header) in environ for header in (sharing.KEY_HEADER, sharing.CONSUMER_HEADER)):
+            return self._call_shared(environ, response, token=token, tenant_name=tenant, registry=self.registry,
+                                     traceparent=traceparent, cache_control=cache_control.lower())
+        if environ['REQUEST_METHOD'] == 'GET' and not path.endswith('/'):
+            return self._call_get(environ, response, token=token, tenant_name=tenant, registry=self.registry,
+                                  traceparent=traceparent, cache_control=cache_control.lower())
+        if environ['REQUEST_METHOD'] == 'DELETE':
+            self.versions.forget(path)
+
+        return self._call_occi(environ, response, token=token, tenant_name=tenant, registry=self.registry,
+                               traceparent=traceparent, cache_control=cache_control.lower())
+
+    def _call_get(self, environ, response, **kwargs):
+        # the version of a resource is sent as its ETag, a resource still matching If-None-Match is not rendered
+        key = environ['PATH_INFO']
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH', '')
+        if if_none_match != '' and 'no-cache' not in kwargs['cache_control']:
+            entity = self.registry.get_resource(key, kwargs)
+            if entity is not None:
+                try:
+                    # the SO is never asked to answer with 304, only attributes retrieved already are compared
+                    cached = ATTRIBUTES.peek(entity.identifier)
+                    if cached is not None:
+                        entity.attributes.update(cached)
+                    etag = self.versions.etag(key, entity)
+                except Exception as e:
+                    LOG.warn('Could not check the version of ' + key + ': ' + e.__repr__())
+                    etag = None
+                if etag is not None and matches(if_none_match, etag):
+                    response('304 Not Modified', [('ETag', etag)])
+                    return []
+
+        def respond(status, headers):
+            if status.startswith('200'):
+                entity = self.registry.get_resource(key, kwargs)
+                if entity is not None:
+                    headers = headers + [('ETag', self.versions.etag(key, entity))]
+            return response(status, headers)
+
+        return self._call_occi(environ, respond, **kwargs)
+
+    def _call_shared(self, environ, response, **kwargs):
+        # a create reuses the instance of the tenant created under the same key, a delete removes a consumer
+        path = environ['PATH_INFO']
+        mtd = environ['REQUEST_METHOD']
+        key = environ.get(sharing.environ_key(sharing.KEY_HEADER), '')
+        consumer = environ.get(sharing.environ_key(sharing.CONSUMER_HEADER), '')
+        with self.sharing:
+            if mtd == 'POST' and path.endswith('/') and key != '':
+                entity = sharing.find([entity for entity in self.registry.get_resources(kwargs)
+                                       if entity.kind.location == path], key)
+                if entity is not None:
+                    sharing.share(entity, key, consumer)
+                    self.registry.add_resource(entity.identifier, entity, kwargs)
+                    LOG.info('Sharing ' + entity.identifier + ' with ' + consumer)
+                    host = 'http://' + environ['HTTP_HOST'] if 'HTTP_HOST' in environ else self.registry.get_hostname()
+                    response('200 OK', [('Location', host + entity.identifier), ('Content-Type', 'text/plain'),
+                                        ('Content-Length', '0')])
+                    return ['']
+
+                def created(status, headers):
+                    location = dict(headers).get('Location', '')
+                    if status.startswith('201') and location != '':
+                        entity = self.registry.get_resource(location[len(self.registry.get_hostname()):], kwargs)
+                        if entity is not None:
+                            sharing.share(entity, key, consumer)
+                            self.registry.add_resource(entity.identifier, entity, kwargs)
+                    return response(status, headers)
+
+                return self._call_occi(environ, created, **kwargs)
+
+            if mtd == 'DELETE' and consumer != '':
+                entity = self.registry.get_resource(path, kwargs)
+                remaining = sharing.release(entity, consumer) if entity is not None else 0
+                if remaining > 0:
+                    self.registry.add_resource(entity.identifier, entity, kwargs)
+                    LOG.info(path + ' is still used by ' + str(remaining) + ' compositions')
+                    response('200 OK', [(sharing.CONSUMERS_HEADER, str(remaining)), ('Content-Type', 'text/plain'),
+                                        ('Content-Length', '0')])
+                    return ['']
+                self.versions.forget(path)
+            return self._call_occi(environ, response, **kwargs)
+
+    def _call_callback(self, environ, response):
+        key = environ['PATH_INFO'][len(CALLBACK_PATH):]
+        try:
+            if environ['REQUEST_METHOD'] != 'POST':
+                raise HTTPError(405, 'Only POST is supported on ' + CALLBACK_PATH)
+            entity = self.registry.resources.get(key)
+            if entity is None:
+                raise HTTPError(404, 'No resource ' + key)
+            if not authentic((entity.extras or {}).get('callback_token'), environ.get('HTTP_X_CALLBACK_TOKEN')):
+                raise HTTPError(403, 'The callback token is not valid for ' + key)
+            try:
+                phase, attributes = parse_callback(environ.get('HTTP_X_OCCI_ATTRIBUTE', ''))
+            except ValueError as e:
+                raise HTTPError(400, e.message)
+            LOG.debug('The SO of ' + key + ' reported ' + phase + ': ' + attributes.__repr__())
+            # the pending checks confirm the state with the SO
+            status, body = '200 OK', str(reported(key))
+        except HTTPError as err:
+            LOG.error(err.message)
+            status, body = RETURN_CODES[err.code], err.message
+
+        response(status, [('Content-Type', 'text/plain'), ('Content-Length', str(len(body)))])
+        return [body]
+
+    def _call_bulk(self, environ, response, **kwargs):
+        # the token was verified once above, for all instances of the batch
+        handler = BulkHandler(self.registry, self.service_kind, kwargs.copy(),
+                              parallelism=int(CONFIG.get('bulk', 'parallelism', 8)),
+                              max_items=int(CONFIG.get('bulk', 'max_items', 500)),
+                              deadline=float(CONFIG.get('bulk', 'deadline', 10)))
+        mtd = environ['REQUEST_METHOD']
+        try:
+            if self.service_kind is None:
+                raise HTTPError(404, 'No service registered.')
+            if mtd == 'POST':
+                try:
+                    length = int(environ.get('CONTENT_LENGTH') or 0)
+                    doc = json.loads(environ['wsgi.input'].read(length))
+                except ValueError:
+                    raise HTTPError(400, 'Invalid JSON sent as bulk request.')
+                status, body = '200 OK', json.dumps(handler.create(doc))
+            elif mtd == 'GET':
+                status, body = '200 OK', json.dumps(handler.retrieve())
+            elif mtd == 'DELETE':
+                status, body = '200 OK', json.dumps(handler.delete())
+            else:
+                raise HTTPError(405, 'Only GET, POST and DELETE are supported on ' + BULK_PATH)
+            content_type = 'application/json'
+        except HTTPError as err:
+            LOG.error(err.message)
+            status, body, content_type = RETURN_CODES[err.code], err.message, 'text/plain'
+
+        response(status, [('Content-Type', content_type), ('Content-Length', str(len(body)))])
+        return [body]
 
 
 class Service:
@@ -305,6 +478,7 @@ class Service:
 
     def run(self):
         self.app.register_backend(self.srv_type, self.service_backend)
+        self.service_backend.warm_up(self.srv_type)
 
         if self.reg_srv:
             self.register_service()
@@ -320,13 +494,19 @@ class Service:
                      'Service port number (' + str(up.port) + ') is taken from the service manifest')
 
         if self.DEBUG:
+            # watches are not available
             LOG.debug('Using WSGI reference implementation, listening on 0.0.0.0:%s' % str(up.port))
             httpd = make_server('0.0.0.0', int(up.port), self.app)
             httpd.serve_forever()
         else:
             LOG.debug('Using tornado implementation, listening on 0.0.0.0:%s' % str(up.port))
             container = wsgi.WSGIContainer(self.app)
-            http_server = httpserver.HTTPServer(container)
+            # watches wait on the IOLoop, everything else is handled by the WSGI application
+            application = web.Application([
+                (WATCH_PATH + '(/.*)', WatchHandler, {'app': self.app,
+                                                      'max_wait': float(CONFIG.get('watch', 'max_wait', 300))}),
+                ('.*', web.FallbackHandler, {'fallback': container})])
+            http_server = httpserver.HTTPServer(application)
             http_server.listen(int(up.port))
             ioloop.IOLoop.instance().start()
 
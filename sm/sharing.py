@@ -0,0 +1,74 @@
+# Copyright 2014-2015 Zuercher Hochschule fuer Angewandte Wissenschaften
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Instances shared by the compositions of a tenant, counted by the SM of their service type.
+
+An SO creating a dependency marked "shared" in its service manifest sends the name of the instance in the
+X-Shared-Key header and its composition in X-Shared-Consumer. The SM answers with the usable instance of the
+tenant created under that key, if there is one, and creates it otherwise. A delete with X-Shared-Consumer
+only removes that composition from the consumers of the instance; the instance is deleted along with its last
+consumer, otherwise the number of the remaining ones is answered in X-Shared-Consumers. All SOs of the tenant
+ask the same SM, which records the key and the consumers in the attributes of the instance.
+"""
+
+__author__ = 'andy'
+
+KEY_HEADER = 'X-Shared-Key'
+CONSUMER_HEADER = 'X-Shared-Consumer'
+CONSUMERS_HEADER = 'X-Shared-Consumers'
+
+KEY = 'mcn.shared.key'
+CONSUMERS = 'mcn.shared.consumers'
+
+# an instance in this stack state is not handed out again
+FAILED = ('CREATE_FAILED', 'UPDATE_FAILED', 'DELETE_IN_PROGRESS', 'DELETE_COMPLETE')
+
+
+def environ_key(header):
+    # the name of header in a WSGI environ
+    return 'HTTP_' + header.upper().replace('-', '_')
+
+
+def consumers(entity):
+    return entity.attributes.get(CONSUMERS, '').split()
+
+
+def find(entities, key):
+    """
+    :return: the entity created under key that can still be used, None if there is none
+    """
+    for entity in entities:
+        if entity.attributes.get(KEY) == key and entity.attributes.get('occi.mcn.stack.state') not in FAILED:
+            return entity
+    return None
+
+
+def share(entity, key, consumer):
+    # records consumer as using the instance of entity, created under key
+    entity.attributes[KEY] = key
+    current = consumers(entity)
+    if consumer not in current:
+        current.append(consumer)
+    entity.attributes[CONSUMERS] = ' '.join(current)
+
+
+def release(entity, consumer):
+    """
+    :return: the number of compositions still using the instance once consumer is not, 0 if it is to be deleted
+    """
+    remaining = [other for other in consumers(entity) if other != consumer]
+    entity.attributes[CONSUMERS] = ' '.join(remaining)
+    return len(remaining)
@@ -13,4 +13,12 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+"""
+The library used by service orchestrators to deploy and provision the dependencies of a composition.
+
+SOs run in their own containers without the configuration of the SM, so this package and the modules of the
+SM it uses (sm.attributes, sm.callbacks, sm.poller, sm.sharing and sm.tracing) must not import sm.config, sm.log
+or any other module reading it, nor depend on packages the SO bundles do not install.
+"""
+
 __author__ = 'andy'
@@ -0,0 +1,132 @@
+#   Copyright 2014-2015 Zuercher Hochschule fuer Angewandte Wissenschaften
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+The instances of a composition and their attributes as last seen by the SO.
+
+The check that finds an instance deployed or provisioned already returns its attributes, so they are recorded
+here and the inputs of a consumer are read from them. A service is marked stale while it is being provisioned,
+as that changes its attributes; only the instances that are stale or lack an attribute asked for are fetched
+again, concurrently and once for all consumers waiting for them.
+"""
+
+from functools import partial
+import logging
+import threading
+
+__author__ = 'andy'
+
+LOG = logging.getLogger(__name__)
+
+
+class CompositionState(object):
+
+    def __init__(self):
+        self.locations = {}  # service type -> location of its instance
+        self.attributes = {}  # service type -> attributes of its instance
+        self.stale = set()  # service types whose attributes may have changed since they were recorded
+        self.fetching = {}  # service type -> callbacks waiting for its attributes being fetched
+        self.lock = threading.Lock()
+
+    def record(self, svc_type, location, attributes):
+        """
+        :param attributes: the attributes of the instance, None if they are not known
+        """
+        with self.lock:
+            self.locations[svc_type] = location
+            if attributes:
+                self.attributes[svc_type] = dict(attributes)
+                self.stale.discard(svc_type)
+            else:
+                self.stale.add(svc_type)
+
+    def invalidate(self, svc_type):
+        with self.lock:
+            self.stale.add(svc_type)
+
+    def forget(self, svc_type):
+        with self.lock:
+            self.locations.pop(svc_type, None)
+            self.attributes.pop(svc_type, None)
+            self.stale.discard(svc_type)
+
+    def location(self, svc_type):
+        with self.lock:
+            return self.locations[svc_type]
+
+    def gather(self, wanted, fetch, done, submit=None):
+        """
+        Calls done(attributes, None) with a dict of service type to the attributes of its instance once they are
+        known, or done(None, exception) with the first exception raised by fetch once all fetches have finished.
+        Returns at once if the instances are fetched in the background.
+
+        :param wanted: dict of service type to the names of the attributes needed from it
+        :param fetch: callable returning the current attributes of the instance at a location
+        :param submit: submit(func, *args) running func(*args) in the background, e.g. ReadinessPoller.submit;
+                       the instances to fetch are fetched through it concurrently, without it one after the other
+        """
+        known = {}
+        fetches = []
+        pending = [0]
+        errors = []
+
+        def got(svc_type, attributes, error):
+            with self.lock:
+                if error is not None:
+                    errors.append(error)
+                else:
+                    known[svc_type] = attributes
+                pending[0] -= 1
+                last = pending[0] == 0
+            if last:
+                if len(errors) > 0:
+                    done(None, errors[0])
+                else:
+                    done(known, None)
+
+        with self.lock:
+            for svc_type, names in wanted.items():
+                attributes = self.attributes.get(svc_type)
+                if svc_type not in self.stale and attributes is not None and set(names) <= set(attributes):
+                    known[svc_type] = attributes
+                    continue
+                pending[0] += 1
+                # an instance already being fetched for another consumer is not fetched twice
+                if svc_type not in self.fetching:
+                    self.fetching[svc_type] = []
+                    fetches.append((svc_type, self.locations[svc_type]))
+                self.fetching[svc_type].append(partial(got, svc_type))
+        if pending[0] == 0:
+            done(known, None)
+            return
+
+        for svc_type, location in fetches:
+            LOG.debug('Fetching the attributes of ' + svc_type + ' at ' + location)
+            if submit is None:
+                self.__fetch(svc_type, location, fetch)
+            else:
+                submit(self.__fetch, svc_type, location, fetch)
+
+    def __fetch(self, svc_type, location, fetch):
+        try:
+            attributes = fetch(location)
+            error = None
+            self.record(svc_type, location, attributes)
+        except Exception as e:
+            attributes = None
+            error = e
+        with self.lock:
+            waiting = self.fetching.pop(svc_type)
+        for got in waiting:
+            got(attributes, error)
@@ -0,0 +1,125 @@
+#   Copyright 2014-2015 Zuercher Hochschule fuer Angewandte Wissenschaften
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+The endpoints of the service types a composition depends upon, as looked up in keystone by the Resolver.
+
+Endpoints hardly ever change, so they are kept for ttl seconds. With a path they are also kept in a JSON file
+({service type: [endpoint, time resolved]}) so that a restarted SO or a redeploy does not ask keystone again.
+The endpoints missing are looked up concurrently.
+"""
+
+import json
+import logging
+import os
+from Queue import Queue
+import threading
+import time
+
+__author__ = 'andy'
+
+LOG = logging.getLogger(__name__)
+
+
+class EndpointCatalogue(object):
+
+    def __init__(self, ttl=300, path=''):
+        self.ttl = ttl
+        self.path = path
+        self.entries = {}  # service type -> (endpoint, time resolved)
+        self.lock = threading.Lock()
+        if path != '' and os.path.exists(path):
+            try:
+                with open(path) as stored:
+                    self.entries = dict((svc_type, tuple(entry)) for svc_type, entry in json.load(stored).items())
+            except (IOError, ValueError) as e:
+                LOG.warn('Could not read the endpoint catalogue ' + path + ': ' + e.__repr__())
+
+    def get(self, svc_type):
+        """
+        :return: the endpoint of svc_type, None if it is not known or outdated
+        """
+        with self.lock:
+            entry = self.entries.get(svc_type)
+        if entry is None or time.time() - entry[1] > self.ttl:
+            return None
+        return entry[0]
+
+    def update(self, endpoints):
+        # endpoints: {service type: endpoint}, written to the file at once
+        if len(endpoints) == 0:
+            return
+        now = time.time()
+        with self.lock:
+            for svc_type, endpoint in endpoints.items():
+                self.entries[svc_type] = (endpoint, now)
+            if self.path != '':
+                self.__save()
+
+    def forget(self, svc_type):
+        with self.lock:
+            self.entries.pop(svc_type, None)
+
+    def resolve(self, svc_types, lookup, submit=None):
+        """
+        :param svc_types: the service types to resolve
+        :param lookup: callable returning the endpoint of a service type, None if there is none
+        :param submit: submit(func, *args) running func(*args) in the background, e.g. ReadinessPoller.submit;
+                       the service types not in the catalogue are looked up through it concurrently, without it
+                       one after the other
+        :return: dict of service type to endpoint, None for those that could not be resolved
+        :raises: the first exception raised by lookup, once all lookups have finished
+        """
+        endpoints = {}
+        missing = []
+        for svc_type in set(svc_types):
+            endpoints[svc_type] = self.get(svc_type)
+            if endpoints[svc_type] is None:
+                missing.append(svc_type)
+        if len(missing) == 0:
+            return endpoints
+
+        done = Queue()
+
+        def look_up(svc_type):
+            try:
+                done.put((svc_type, lookup(svc_type), None))
+            except Exception as e:
+                done.put((svc_type, None, e))
+
+        for svc_type in missing:
+            if submit is None:
+                look_up(svc_type)
+            else:
+                submit(look_up, svc_type)
+        errors = []
+        for _ in missing:
+            svc_type, endpoint, error = done.get()
+            endpoints[svc_type] = endpoint
+            if error is not None:
+                errors.append(error)
+        self.update(dict((svc_type, endpoints[svc_type]) for svc_type in missing if endpoints[svc_type] is not None))
+        if len(errors) > 0:
+            raise errors[0]
+        return endpoints
+
+    def __save(self):
+        # replaced at once so that a concurrently starting SO never reads half a file
+        tmp = self.path + '.' + str(os.getpid()) + '.tmp'
+        try:
+            with open(tmp, 'w') as stored:
+                json.dump(self.entries, stored)
+            os.rename(tmp, self.path)
+        except (IOError, OSError) as e:
+            LOG.warn('Could not write the endpoint catalogue ' + self.path + ': ' + e.__repr__())
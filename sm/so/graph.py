@@ -0,0 +1,297 @@
+#   Copyright 2014-2015 Zuercher Hochschule fuer Angewandte Wissenschaften
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+The services of a composition as a graph of the services each one takes its inputs from.
+
+An input of a service in the depends_on list of the service manifest names the service producing it and one
+of its attributes: <scheme>#<term>#<attribute>, e.g.
+
+    {"http://schemas.mobile-cloud-networking.eu/occi/sm#ran": {
+        "inputs": ["http://schemas.mobile-cloud-networking.eu/occi/sm#maas#mcn.endpoint.maas"]}}
+
+A composition may hold several instances of a service type, either by listing the type more than once, each
+entry with its own inputs, or by the number of instances of an entry:
+
+    {"http://schemas.mobile-cloud-networking.eu/occi/sm#dnsaas": {"inputs": [...], "instances": 3}}
+
+The instances of such a type are counted across its entries and named <service type>[<index>], except for the
+first one, which is named by its service type and so keeps its name when instances are added. An input naming
+the producer by its service type is taken from instance k mod n of the producer for instance k of the consumer,
+so that n producers each serve their share of the consumers; <scheme>#<term>[<index>]#<attribute> names one
+instance.
+
+A service without inputs marked "shared": true is shared with the other compositions of the tenant, see
+sm.sharing.
+
+run_graph() deploys all services at once and provisions a service with inputs as soon as it is deployed and
+the services producing its inputs are ready, so independent branches of the composition, as well as the
+instances of a service type, do not wait for each other.
+"""
+
+import logging
+from Queue import Queue
+import re
+
+__author__ = 'andy'
+
+LOG = logging.getLogger(__name__)
+
+INSTANCE = re.compile(r'^(.*)\[(\d+)\]$')
+
+
+class CycleError(ValueError):
+    pass
+
+
+def parse_input(reference):
+    """
+    :param reference: <scheme>#<term>#<attribute> or <scheme>#<term>[<index>]#<attribute>
+    :return: (service type of the producer, with the index if given, attribute)
+    """
+    parts = reference.split('#')
+    if len(parts) != 3:
+        raise ValueError('Input ' + reference + ' is not of the form <scheme>#<term>#<attribute>.')
+    return parts[0] + '#' + parts[1], parts[2]
+
+
+def instance_name(svc_type, index):
+    if index == 0:
+        return svc_type
+    return svc_type + '[' + str(index) + ']'
+
+
+def split_instance(name):
+    """
+    :return: (service type, index of the instance or None if name is a service type)
+    """
+    match = INSTANCE.match(name)
+    if match is None:
+        return name, None
+    return match.group(1), int(match.group(2))
+
+
+class ServiceGraph(object):
+    """
+    Compiled from the depends_on list of a service manifest and not changed afterwards. The nodes of the graph
+    are the instances of the composition, the first one of a service type named by the type. Raises a
+    ValueError if an input refers to a service not in the list or two inputs of an instance name the same
+    attribute, a CycleError if services depend upon each other.
+    """
+
+    def __init__(self, depends_on):
+        entries = []  # (service type, input references, shared) of each instance
+        for dependency in depends_on:
+            svc_type = dependency.keys()[0]
+            spec = dependency[svc_type]
+            instances = spec.get('instances', 1)
+            shared = spec.get('shared', False) is True
+            if isinstance(instances, list):
+                entries.extend((svc_type, instance.get('inputs', spec.get('inputs', [])), shared)
+                               for instance in instances)
+            elif isinstance(instances, int) and instances > 0:
+                entries.extend([(svc_type, spec.get('inputs', []), shared)] * instances)
+            else:
+                raise ValueError('The instances of ' + svc_type + ' are neither a number nor a list.')
+        counts = {}
+        service_types = []
+        for svc_type, _, _ in entries:
+            if svc_type not in counts:
+                service_types.append(svc_type)
+            counts[svc_type] = counts.get(svc_type, 0) + 1
+
+        services = []
+        inputs = {}
+        indices = {}
+        shared = set()
+        self.types = {}  # instance -> service type
+        self.bindings = {}  # (consumer, attribute) -> (producer, attribute)
+        for svc_type, references, is_shared in entries:
+            index = indices.get(svc_type, 0)
+            indices[svc_type] = index + 1
+            name = instance_name(svc_type, index)
+            services.append(name)
+            self.types[name] = svc_type
+            inputs[name] = []
+            if is_shared:
+                if len(references) > 0:
+                    raise ValueError(name + ' takes inputs and so cannot be shared with other compositions.')
+                shared.add(name)
+            for reference in references:
+                producer, attribute = parse_input(reference)
+                binding = (self.__producer(name, producer, index, counts), attribute)
+                bound = self.bindings.setdefault((name, attribute), binding)
+                if bound != binding:
+                    raise ValueError(name + ' takes ' + attribute + ' from both ' + bound[0] + ' and ' +
+                                     binding[0] + '.')
+                elif bound is binding:
+                    inputs[name].append(binding)
+        self.services = tuple(services)
+        self.shared = frozenset(shared)  # instances shared with the other compositions of the tenant
+        self.service_types = tuple(service_types)
+        self.inputs = dict((name, tuple(bindings)) for name, bindings in inputs.items())  # without duplicates
+        self.producers = {}  # instance -> frozenset of instances
+        consumers = dict((name, set()) for name in self.services)
+        for name in self.services:
+            self.producers[name] = frozenset(producer for producer, _ in self.inputs[name])
+            for producer in self.producers[name]:
+                consumers[producer].add(name)
+        self.consumers = dict((name, frozenset(names)) for name, names in consumers.items())
+        self.levels = self.__levels()
+
+    @staticmethod
+    def __producer(consumer, producer, index, counts):
+        # the instance producing an input of instance index of consumer
+        svc_type, chosen = split_instance(producer)
+        if svc_type not in counts:
+            raise ValueError(consumer + ' takes inputs from ' + producer + ', which is not part of the '
+                             'composition.')
+        if chosen is None:
+            chosen = index % counts[svc_type]
+        elif chosen >= counts[svc_type]:
+            raise ValueError(consumer + ' takes inputs from ' + producer + ', but there are only ' +
+                             str(counts[svc_type]) + ' instances of ' + svc_type + '.')
+        return instance_name(svc_type, chosen)
+
+    def __levels(self):
+        # Kahn's algorithm: the services of a level only depend upon those of the levels before
+        levels = []
+        waiting = dict((svc_type, len(self.producers[svc_type])) for svc_type in self.services)
+        level = [svc_type for svc_type in self.services if waiting[svc_type] == 0]
+        while len(level) > 0:
+            levels.append(tuple(level))
+            following = []
+            for svc_type in level:
+                for consumer in self.consumers[svc_type]:
+                    waiting[consumer] -= 1
+                    if waiting[consumer] == 0:
+                        following.append(consumer)
+            level = sorted(following, key=self.services.index)
+        cyclic = [svc_type for svc_type in self.services if waiting[svc_type] > 0]
+        if len(cyclic) > 0:
+            raise CycleError('The inputs of these services depend upon each other: ' + ', '.join(cyclic))
+        return tuple(levels)
+
+
+def in_background(func, submit):
+    """
+    :param func: blocking func(service type)
+    :param submit: submit(func, *args) running func(*args) in the background, e.g. ReadinessPoller.submit
+    :return: func as called by run_graph
+    """
+    def start(svc_type, done):
+        def call():
+            try:
+                func(svc_type)
+            except Exception as e:
+                done(e)
+                return
+            done()
+        submit(call)
+    return start
+
+
+def run_graph(graph, deploy, provision, deployed=()):
+    """
+    Calls deploy(service type, done) for all services of graph at once. provision(service type, done) is called
+    for each service with inputs once it is deployed and all services producing its inputs are ready. A service
+    is ready once it is deployed and, if it has inputs, provisioned. Returns when all services are ready.
+
+    deploy and provision must not block: they start the work and call done() from any thread once it has
+    finished, or done(exception) if it failed. See in_background() for blocking functions.
+
+    :param deployed: the services already deployed, e.g. when a composition is updated; they are provisioned
+                     again if they have inputs
+    :raises: the first exception deploy or provision failed with, once the work under way has finished; no
+             further work is started after a failure
+    """
+    finished = Queue()
+
+    def start(stage, func, svc_type):
+        def done(error=None):
+            finished.put((stage, svc_type, error))
+        try:
+            func(svc_type, done)
+        except Exception as e:
+            done(e)
+
+    deployed = set(deployed)
+    provisioning = set()
+    ready = set(svc_type for svc_type in deployed if len(graph.inputs[svc_type]) == 0)
+    errors = []
+    running = [0]
+
+    def advance(candidates):
+        for candidate in candidates:
+            if candidate in deployed and candidate not in provisioning and candidate not in ready and \
+                    graph.producers[candidate] <= ready:
+                provisioning.add(candidate)
+                running[0] += 1
+                start('provision', provision, candidate)
+
+    for svc_type in graph.services:
+        if svc_type not in deployed:
+            running[0] += 1
+            start('deploy', deploy, svc_type)
+    advance(graph.services)
+    while running[0] > 0:
+        stage, svc_type, error = finished.get()
+        running[0] -= 1
+        if error is not None:
+            LOG.error('Could not ' + stage + ' ' + svc_type + ': ' + error.__repr__())
+            errors.append(error)
+            continue
+        if stage == 'deploy':
+            deployed.add(svc_type)
+            candidates = [svc_type]
+        else:
+            candidates = []
+        if stage == 'provision' or len(graph.inputs[svc_type]) == 0:
+            ready.add(svc_type)
+            candidates.extend(graph.consumers[svc_type])
+        if len(errors) == 0:
+            advance(candidates)
+    if len(errors) > 0:
+        raise errors[0]
+
+
+def teardown(levels, destroy, submit):
+    """
+    Calls destroy(service type) for all services of levels, e.g. those of a ServiceGraph, the consumers before
+    their producers: the services of a level are destroyed concurrently once those of the levels after it have
+    been. A failure does not stop the teardown.
+
+    :param submit: submit(func, *args) running func(*args) in the background, e.g. ReadinessPoller.submit
+    :return: dict of service type to the exception destroy failed with
+    """
+    failures = {}
+    for level in reversed(levels):
+        finished = Queue()
+
+        def call(svc_type):
+            try:
+                destroy(svc_type)
+            except Exception as e:
+                finished.put((svc_type, e))
+                return
+            finished.put((svc_type, None))
+
+        for svc_type in level:
+            submit(call, svc_type)
+        for _ in level:
+            svc_type, error = finished.get()
+            if error is not None:
+                LOG.error('Could not destroy ' + svc_type + ': ' + error.__repr__())
+                failures[svc_type] = error
+    return failures
@@ -0,0 +1,111 @@
+#   Copyright 2014-2015 Zuercher Hochschule fuer Angewandte Wissenschaften
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+The service manifest of an SO compiled into the plan its Resolvers execute: the services of the composition,
+the table binding each input of a consumer to the attribute of its producer and the order the services can be
+provisioned in. A manifest is read, validated and compiled once; the Resolvers share the plan until the file
+changes.
+"""
+
+import copy
+import json
+import logging
+import os
+import threading
+
+from sm.so.graph import ServiceGraph
+
+__author__ = 'andy'
+
+LOG = logging.getLogger(__name__)
+
+
+class ExecutionPlan(object):
+    """
+    Compiled from a service manifest and not changed afterwards. Raises a ValueError if the manifest is not valid.
+    """
+
+    def __init__(self, manifest):
+        if not isinstance(manifest, dict) or 'service_type' not in manifest:
+            raise ValueError('The service manifest does not name a service_type.')
+        depends_on = manifest.get('depends_on', [])
+        if not isinstance(depends_on, list):
+            raise ValueError('depends_on of the service manifest is not a list.')
+        for dependency in depends_on:
+            if not isinstance(dependency, dict) or len(dependency) != 1 or \
+                    not isinstance(dependency.values()[0], dict):
+                raise ValueError('Service type schema is not as expected. It is: ' + dependency.__repr__())
+            if not isinstance(dependency.values()[0].get('inputs', []), list):
+                raise ValueError('The inputs of ' + dependency.keys()[0] + ' are not a list.')
+        self.manifest = copy.deepcopy(manifest)
+        self.service_type = manifest['service_type']
+        self.graph = ServiceGraph(depends_on)
+        self.services = self.graph.services  # the instances of the composition
+        self.service_types = self.graph.service_types
+        self.bindings = self.graph.bindings
+        self.levels = self.graph.levels
+
+    def binding(self, consumer, attribute):
+        """
+        :return: (producer, attribute of the producer) the input attribute of consumer is taken from
+        """
+        return self.bindings[(consumer, attribute)]
+
+    def inputs(self, consumer):
+        """
+        :return: the (producer, attribute) pairs the instance consumer takes its inputs from
+        """
+        return self.graph.inputs[consumer]
+
+    def type_of(self, instance):
+        return self.graph.types[instance]
+
+    def depends_on(self, endpoints):
+        """
+        :param endpoints: dict of service type to the endpoint of its SM
+        :return: the depends_on list of the manifest with the endpoint of each service type, as used by the
+                 Resolver
+        """
+        depends_on = copy.deepcopy(self.manifest.get('depends_on', []))
+        for dependency in depends_on:
+            dependency.values()[0]['endpoint'] = endpoints[dependency.keys()[0]]
+        return depends_on
+
+
+class PlanCache(object):
+    """
+    The plans of the manifests read, compiled again only once a file has been changed.
+    """
+
+    def __init__(self):
+        self.plans = {}  # path -> (modification time and size of the file, plan)
+        self.lock = threading.Lock()
+
+    def load(self, path):
+        """
+        :raises: IOError if path cannot be read, ValueError if it is not a valid service manifest
+        """
+        stat = os.stat(path)
+        version = (stat.st_mtime, stat.st_size)
+        with self.lock:
+            cached = self.plans.get(path)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+            with open(path) as stored:
+                plan = ExecutionPlan(json.load(stored))
+            LOG.info('Compiled the service manifest ' + path + ': ' + str(len(plan.services)) + ' instances in ' +
+                     str(len(plan.levels)) + ' levels')
+            self.plans[path] = (version, plan)
+            return plan
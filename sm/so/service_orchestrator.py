@@ -12,16 +12,24 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 
+from functools import partial
 import json
 import logging
 import os
 from Queue import Queue
-import time
 import threading
+import uuid
 
 import requests
 
-from sdk import services
+from sm.attributes import parse_attributes, render_attributes
+from sm.poller import ReadinessPoller
+from sm.sharing import CONSUMER_HEADER, CONSUMERS_HEADER, KEY_HEADER
+from sm.so.composition import CompositionState
+from sm.so.endpoints import EndpointCatalogue
+from sm.so.graph import ServiceGraph, run_graph, teardown
+from sm.so.plan import ExecutionPlan, PlanCache
+from sm.tracing import TRACER, exporter
 
 HERE = '.'
 if os.path.exists('/app'):
@@ -42,16 +50,53 @@ def config_logger(log_level=logging.DEBUG):
 
 LOG = config_logger()
 
+# spans continue the trace of the SM, see sm.tracing
+TRACER.exporter = exporter(os.environ.get('SO_TRACE_EXPORTER', 'none'),
+                           os.environ.get('SO_TRACE_FILE', 'so_traces.json'))
+
+# background work of all compositions of this SO is done by these workers, see sm.poller
+WORKERS = ReadinessPoller(workers=int(os.environ.get('SO_WORKERS', 8)))
+# seconds between two readiness checks of a service instance being deployed or provisioned
+POLL_INTERVAL = float(os.environ.get('SO_POLL_INTERVAL', 13))
+# seconds a request deleting a service instance may take
+DISPOSE_TIMEOUT = float(os.environ.get('SO_DISPOSE_TIMEOUT', 30))
+# endpoints of the service types depended upon, optionally kept in a file across restarts
+ENDPOINTS = EndpointCatalogue(ttl=float(os.environ.get('SO_ENDPOINT_TTL', 300)),
+                              path=os.environ.get('SO_ENDPOINT_CACHE', ''))
+# the compiled service manifests, shared by all Resolvers
+PLANS = PlanCache()
+
+
+def attr_string_to_dict(attrs_string):
+    attr_hash = {}
+    if len(attrs_string) <= 0:
+        LOG.warn('Attributes string is empty.')
+    else:
+        attr_hash = parse_attributes(attrs_string)
+
+    LOG.info('attributes extracted: ' + attr_hash.__repr__())
+    return attr_hash
+
+
+def traced_request(verb, url, headers, timeout=None):
+    # a child span of the active span, its context is passed on to the called service
+    with TRACER.span('HTTP ' + verb, attributes={'http.method': verb, 'http.url': url}) as span:
+        r = requests.request(verb, url, headers=TRACER.inject(headers), timeout=timeout)
+        span.set_attribute('http.status_code', r.status_code)
+        return r
+
 
 class Execution(object):
     """
     Interface to the CC methods. No decision is taken here on the service
     """
 
-    def __init__(self, token, tenant):
+    def __init__(self, token, tenant, traceparent=None, callback=None):
         self.token = token
         self.tenant = tenant
-        self.resolver = Resolver(token, tenant)
+        # completed phases are reported to the SM through callback, if given, see sm.callbacks.from_attributes
+        self.callback = callback
+        self.resolver = Resolver(token, tenant, traceparent, callback)
 
     def design(self):
         raise NotImplementedError()
@@ -91,11 +136,18 @@ class Decision(object):
 
 class Resolver:
 
-    def __init__(self, token, tenant):
+    def __init__(self, token, tenant, traceparent=None, callback=None):
         self.token = token
         self.tenant = tenant
+        # the traceparent header of the request from the SM, continued by the deploy and provision spans
+        self.traceparent = traceparent
+        self.callback = callback
+        self.consumer = uuid.uuid4().hex  # this composition, as a consumer of shared instances
         self.stg = []
+        self.plan = None  # the compiled service manifest, see sm.so.plan
+        self.graph = None  # the services of the composition and their inputs, see sm.so.graph
         self.service_inst_endpoints = []  # contains endpoint, type, attribs of instance
+        self.composition = CompositionState()  # the instances and their attributes as last seen
         self.di = None  # this is the deployment initialiser thread that begins the deployment tasks
         self.pi = None  # this is the provision initialiser thread that begins the provisioning tasks
         self.deploy_done_q = Queue()
@@ -106,67 +158,76 @@ class Resolver:
         """
         Do initial design steps here.
         """
-        with open(os.path.join(BUNDLE_DIR, 'data', STG_FILE)) as stg_content:
-            self.stg = json.load(stg_content)
-            stg_content.close()
-
-        try:
-            stg_deps = self.stg['depends_on']
-            # XXX Note this operation is a network-based operation and could take > 30 secs
-            self.stg['depends_on'] = self.__sm_stg_ops(stg_deps)
-        except KeyError:
+        # the manifest is compiled once and shared by all Resolvers until it changes
+        self.plan = PLANS.load(os.path.join(BUNDLE_DIR, 'data', STG_FILE))
+        self.stg = dict(self.plan.manifest)
+        if len(self.plan.services) == 0:
             LOG.info('No service dependencies found in service manifest.')
-            self.stg['depends_on'] = []
+        # endpoints are looked up in keystone concurrently and only if not resolved within SO_ENDPOINT_TTL
+        self.stg['depends_on'] = self.__sm_stg_ops(self.plan)
+        self.graph = self.plan.graph
 
-    def __sm_stg_ops(self, svc_list):
+    def __sm_stg_ops(self, plan):
         # purpose: take the stg and insert valid SM endpoints, maintain the input params of service
-        svc_type_endpoint = []
-
-        for svc_type in svc_list:
-            if isinstance(svc_type, dict):  # or isinstance(svc_type, unicode):
-                # XXX if there are more than two keys this will be a prob
-                # XXX note that currently all services must be RegionOne (default in heat)
-                region = 'RegionOne'
-                ep = services.get_service_endpoint(svc_type.keys()[0], self.token, tenant_name=self.tenant,
-                                                   region=region)
-                if ep is None:
-                    raise RuntimeError(svc_type.keys()[0] + ' endpoint could not be found - is the service registered?')
-                LOG.info('Service type: ' + svc_type.keys()[0].__repr__() + ' can be instantiated at: ' + ep)
-
-                inputs = svc_type[svc_type.keys()[0]]['inputs']
-                type_ep = {
-                    svc_type.keys()[0]: {
-                        'inputs': inputs,
-                        'endpoint': ep
-                    }
-                }
-                svc_type_endpoint.append(type_ep)
-            else:
-                LOG.error('Service type schema is now as expected. It is: ' + svc_type.__repr__())
-                raise RuntimeError('Service type schema is now as expected. It is: ' + svc_type.__repr__())
-
-        return svc_type_endpoint
-
-    def deploy(self):
+        # XXX note that currently all services must be RegionOne (default in heat)
+        region = 'RegionOne'
+
+        def lookup(type_name):
+            # the endpoints are registered in keystone, which is only reached through the sdk of the SO bundle
+            from sdk import services
+            return services.get_service_endpoint(type_name, self.token, tenant_name=self.tenant, region=region)
+
+        endpoints = ENDPOINTS.resolve(plan.service_types, lookup, submit=WORKERS.submit)
+        for svc_type in plan.service_types:
+            if endpoints[svc_type] is None:
+                raise RuntimeError(svc_type + ' endpoint could not be found - is the service registered?')
+            LOG.info('Service type: ' + svc_type.__repr__() + ' can be instantiated at: ' + endpoints[svc_type])
+        return plan.depends_on(endpoints)
+
+    def deploy(self, traceparent=None):
         self.di = DeployInitialiser(tenant=self.tenant, token=self.token, stg=self.stg,
                                     service_inst_endpoints=self.service_inst_endpoints,
-                                    deploy_done_q=self.deploy_done_q)
+                                    deploy_done_q=self.deploy_done_q, trace=traceparent or self.traceparent,
+                                    callback=self.callback, graph=self.graph, composition=self.composition,
+                                    consumer=self.consumer)
         self.di.setDaemon(True)
         self.di.start()
 
-    def provision(self):
+    def provision(self, traceparent=None):
         # TODO provide a set of parameters that can be overriden at runtime?
         # TODO pre and post operations should be supported for lifecycle
         self.pi = ProvisionInitialiser(tenant=self.tenant, token=self.token, stg=self.stg,
                                        service_inst_endpoints=self.service_inst_endpoints,
                                        deploy_done_q=self.deploy_done_q,
-                                       provision_done_q=self.provision_done_q)
+                                       provision_done_q=self.provision_done_q,
+                                       trace=traceparent or self.traceparent, callback=self.callback)
         self.pi.setDaemon(True)
         self.pi.start()
 
-    def update(self):
-        # TODO this is where service graph updates should be implemented
-        pass
+    def update(self, manifest=None, traceparent=None):
+        """
+        Brings the deployed composition in line with a changed service manifest: the dependencies added are
+        deployed, those removed are disposed of and the consumers kept are provisioned again only if the inputs
+        bound to them changed, by the manifest or as the attributes of their producers changed.
+
+        :param manifest: the new service manifest, by default the one of the bundle as it is now
+        :return: dict of 'added', 'removed' and 'reprovisioned' to the instances concerned
+        """
+        if self.di is None or self.di.is_alive():
+            raise RuntimeError('The composition must be deployed before it can be updated.')
+        if manifest is None:
+            plan = PLANS.load(os.path.join(BUNDLE_DIR, 'data', STG_FILE))
+        else:
+            plan = ExecutionPlan(manifest)
+        stg = dict(plan.manifest)
+        stg['depends_on'] = self.__sm_stg_ops(plan)
+        try:
+            return self.di.update(plan.graph, stg, trace=traceparent or self.traceparent)
+        finally:
+            # the added dependencies are part of the composition even if the update failed
+            self.plan = plan
+            self.stg = stg
+            self.graph = plan.graph
 
     def dispose(self):
         """
@@ -211,226 +272,376 @@ class Resolver:
 
 
 class DeployInitialiser(threading.Thread):
+    """
+    Deploys the services of the composition and provisions each one as soon as the services producing its inputs
+    are ready, see sm.so.graph.
+    """
 
-    def __init__(self, tenant, token, stg, service_inst_endpoints, deploy_done_q):
+    def __init__(self, tenant, token, stg, service_inst_endpoints, deploy_done_q, trace=None, callback=None,
+                 graph=None, composition=None, consumer=None):
         super(DeployInitialiser, self).__init__()
         self.tenant = tenant
         self.token = token
         self.stg = stg
         self.jobs = []
+        self.tasks = {}  # instance -> its DeployTask
         self.service_inst_endpoints = service_inst_endpoints
         self.deploy_done_q = deploy_done_q
+        self.trace = trace
+        self.callback = callback
+        self.graph = graph if graph is not None else ServiceGraph(stg['depends_on'])
+        self.specs = dict((dependent.keys()[0], dependent) for dependent in stg['depends_on'])
+        self.composition = composition if composition is not None else CompositionState()
+        self.consumer = consumer or uuid.uuid4().hex
+        self.provisioned = {}  # instance -> the inputs it was provisioned with
+        self.span = None
 
     def run(self):
         super(DeployInitialiser, self).run()
-        self.deploy()
+        try:
+            with TRACER.span('so.deploy', parent=self.trace) as span:
+                self.span = span
+                self.deploy()
+        except Exception as e:
+            LOG.error('Deployment of the service dependencies failed: ' + e.__repr__())
+            # the SM checks the state of the composition at once instead of at its next poll
+            if self.callback is not None:
+                self.callback.emit('deploy', {'occi.mcn.stack.state': 'CREATE_FAILED'})
+            return
+        if self.callback is not None:
+            self.callback.emit('deploy')
 
     def deploy(self):
         """
         deploy service graph and infrastructure graph
-            only send instantiation requests
-            wait until all are complete
-            when all complete, store attributes against service type
-            then return control back to provision
+            all instantiation requests are sent at once
+            a service is provisioned once it and the services producing its inputs are complete
+            independent branches of the graph and the instances of a service type do not wait for each other
+            when all are complete, control is handed to provision
         """
         LOG.info('============ DEPLOY ============')
 
-        results_q = Queue()
-
         # create dependent services
-        if len(self.stg['depends_on']) > 0:
-            LOG.info('Deploying service dependencies...')
+        if len(self.graph.services) > 0:
             LOG.info('Deploying required services for ' + self.stg['service_type'])
+            for level, svc_types in enumerate(self.graph.levels):
+                LOG.info('\t* level ' + str(level) + ': ' + ', '.join(svc_types))
 
-            for dependent in self.stg['depends_on']:
-                if isinstance(dependent, dict):
-                    LOG.info('\t* ' + dependent.keys()[0] + ' -> ' + dependent[dependent.keys()[0]]['endpoint'])
-                    svc_params = {}
-                    dt = DeployTask(dependent, results_q, self.tenant, self.token, svc_params)
-                    dt.setDaemon(True)
-                    self.jobs.append(dt)
-                else:  # TODO: re-enable serial deployments
-                    LOG.error('Something other than a dict was supplied. Support for serial deployments removed.')
-
-            LOG.info('dependant services deployment requests ready!')
-
-            # assumes that all creation requests mode (parallel|serial) are managed by DeployTask
-            for job in self.jobs:
-                job.start()
-
-            LOG.info('Dependant services deployment requests sent!')
-
-        # XXX this is a blocking operation
-        while len(self.jobs) != len(self.service_inst_endpoints):
-            result = results_q.get()
-            self.service_inst_endpoints.append(result)
-            LOG.debug('Number of deploy jobs to complete: ' + str(len(self.jobs)))
-            LOG.debug('Number of deploy jobs completed: ' + str(len(self.service_inst_endpoints)))
+        # the instances are polled on the WORKERS, this thread only waits for the graph to complete
+        deployed = False
+        try:
+            run_graph(self.graph, self.__deploy, self.__provision)
+            deployed = True
+        finally:
+            # Signal whether deployment is done, the provisioning waits for it either way
+            self.deploy_done_q.put(deployed)
 
         LOG.info('---> Creation of service dependencies is complete. Endpoints: ' +
                  self.service_inst_endpoints.__repr__())
-        LOG.info('---> All services are now deployed.')
-        # Signal that deployment is done
-        self.deploy_done_q.put(True)
+        LOG.info('---> All services are now deployed and provisioned.')
         LOG.info('============ DEPLOY ============')
 
+    def __deploy(self, instance, done):
+        # the instances of a service type are all created at the SM of the type
+        dependent = self.specs[self.graph.types[instance]]
+        LOG.info('\t* ' + instance + ' -> ' + dependent.values()[0]['endpoint'])
+        dt = DeployTask(dependent, Queue(), self.tenant, self.token, {}, parent=self.span)
+        self.jobs.append(dt)
+        self.tasks[instance] = dt
+
+        def deployed():
+            # the attributes of the check that found the instance deployed are the inputs of its consumers
+            self.composition.record(instance, dt.endpoints[0]['location'], dt.endpoints[0]['attributes'])
+            self.service_inst_endpoints.append(dt.endpoints)
+            done()
+
+        if instance in self.graph.shared:
+            # the SM of the type hands out the instance of the tenant if another composition created it already
+            dt.shared = (instance, self.consumer)
+        dt.start(on_ready=deployed, on_error=done)
+
+    def __provision(self, instance, done):
+        wanted = {}
+        for producer, param in self.graph.inputs[instance]:
+            wanted.setdefault(producer, []).append(param)
+        # only the producers whose attributes are not known are fetched, concurrently on the WORKERS
+        self.composition.gather(wanted, self.__attributes, partial(self.__provision_inputs, instance, done),
+                                submit=WORKERS.submit)
+
+    def __provision_inputs(self, instance, done, producers, error):
+        # XXX implementation should look for mutable parameters in receiving service
+        # XXX and match with what's in existing service attrs
+        if error is not None:
+            done(error)
+            return
+        occi_params = {}
+        for producer, param in self.graph.inputs[instance]:
+            try:
+                # get the parameter value of the producing instance and parameter name
+                attr = producers[producer][param]
+            except KeyError as ke:
+                LOG.error(param + ' of ' + producer + ' could not be found in the set of service parameters')
+                done(ke)
+                return
+            LOG.info(instance + ' will be updated with: ' + param + ' = ' + attr)
+            occi_params[param] = attr
+
+        if self.provisioned.get(instance) == occi_params:
+            LOG.info(instance + ' is provisioned with these inputs already')
+            done()
+            return
+
+        # provisioning changes the attributes of the instance, they are recorded again once it has completed
+        self.composition.invalidate(instance)
+        location = self.composition.location(instance)
+        LOG.debug('Parameters ' + occi_params.__repr__() + ' for ' + instance + ' instance at: ' + location)
+        update_job = {'params': occi_params, 'inst_ep': location}
+        pt = ProvisionTask(self.tenant, self.token, update_job, Queue(), parent=self.span)
+
+        def provisioned():
+            self.composition.record(instance, location, attr_string_to_dict(pt.response.headers.get(
+                'x-occi-attribute', '')))
+            self.provisioned[instance] = occi_params
+            done()
+
+        pt.start(on_ready=provisioned, on_error=done)
+
+    def __attributes(self, location):
+        heads = {'X-Auth-Token': self.token, 'X-Tenant-Name': self.tenant, 'Accept': 'application/occi+json'}
+        LOG.debug('Getting attributes for service instance: ' + location)
+        try:
+            r = traced_request('GET', location, heads)
+            r.raise_for_status()
+        except requests.HTTPError as err:
+            LOG.error('HTTP Error: should do something more here!' + err.message)
+            raise err
+        return json.loads(r.content)['attributes']
+
+    def update(self, graph, stg, trace=None):
+        """
+        Deploys the instances of graph not deployed yet, provisions the ones kept whose inputs changed and then
+        destroys those not in graph any more.
+
+        :return: dict of 'added', 'removed' and 'reprovisioned' to the instances concerned
+        """
+        LOG.info('============ UPDATE ============')
+        old = self.graph
+        kept = [instance for instance in graph.services if instance in old.types]
+        changes = {'added': [instance for instance in graph.services if instance not in old.types],
+                   'removed': [instance for instance in old.services if instance not in graph.types]}
+        LOG.info('Adding ' + changes['added'].__repr__() + ', removing ' + changes['removed'].__repr__())
+        self.graph = graph
+        self.stg = stg
+        self.specs = dict((dependent.keys()[0], dependent) for dependent in stg['depends_on'])
+        # the attributes of the producers kept may have changed since, they are fetched again if needed
+        for instance in kept:
+            if len(graph.inputs[instance]) > 0:
+                for producer in graph.producers[instance]:
+                    self.composition.invalidate(producer)
+        provisioned = dict(self.provisioned)
+
+        with TRACER.span('so.update', parent=trace) as span:
+            self.span = span
+            # consumers are bound to their new producers before the ones removed are destroyed
+            run_graph(graph, self.__deploy, self.__provision, deployed=kept)
+            removed = set(changes['removed'])
+            failures = teardown([[instance for instance in level if instance in removed] for level in old.levels],
+                                self.__destroy, WORKERS.submit)
+        for instance in removed:
+            if instance not in failures:
+                self.composition.forget(instance)
+                self.provisioned.pop(instance, None)
+        changes['reprovisioned'] = [instance for instance in kept
+                                    if self.provisioned.get(instance) != provisioned.get(instance)]
+        LOG.info('Provisioned again: ' + changes['reprovisioned'].__repr__())
+        LOG.info('============ UPDATE ============')
+        if len(failures) > 0:
+            raise RuntimeError('Could not destroy ' + ', '.join(sorted(failures)) + ': ' +
+                               ', '.join(error.__repr__() for _, error in sorted(failures.items())))
+        return changes
+
     def dispose(self):
         LOG.info('Disposing all resources created at deploy time')
-        # destroy the service instances
-        for job in self.jobs:
-            job.destroy()
+        # instances an update could not destroy are destroyed first
+        levels = list(self.graph.levels) + [[instance for instance in self.tasks if instance not in self.graph.types]]
+        # consumers are destroyed before their producers, the instances of a level concurrently on the WORKERS
+        failures = teardown(levels, self.__destroy, WORKERS.submit)
+        if len(failures) > 0:
+            raise RuntimeError('Could not destroy ' + ', '.join(sorted(failures)) + ': ' +
+                               ', '.join(error.__repr__() for _, error in sorted(failures.items())))
+
+    def __destroy(self, instance):
+        dt = self.tasks.get(instance)
+        if dt is not None:
+            dt.destroy(timeout=DISPOSE_TIMEOUT)
+            # disposing again only retries the instances that could not be destroyed
+            self.tasks.pop(instance, None)
+            self.jobs.remove(dt)
+            if dt.endpoints in self.service_inst_endpoints:
+                self.service_inst_endpoints.remove(dt.endpoints)
 
 
 class ProvisionInitialiser(threading.Thread):
+    """
+    The services of the composition are provisioned as part of their deployment, see DeployInitialiser.
+    """
 
-    def __init__(self, tenant, token, stg, service_inst_endpoints, deploy_done_q, provision_done_q):
+    def __init__(self, tenant, token, stg, service_inst_endpoints, deploy_done_q, provision_done_q, trace=None,
+                 callback=None):
         super(ProvisionInitialiser, self).__init__()
         self.tenant = tenant
         self.token = token
         self.stg = stg
-        self.jobs = []
         self.service_inst_endpoints = service_inst_endpoints
         self.deploy_done_q = deploy_done_q  # used to signal that deploy is complete
         self.provision_done_q = provision_done_q # used to signal those dependent on resolver provided instances
+        self.trace = trace
+        self.callback = callback
 
     def run(self):
         # wait until deployment is complete
         LOG.info('===================> Waiting for deployment of service to complete')
-        if self.deploy_done_q.get():
-            LOG.info('===================> Deployment phase complete. Beginning provisioning...')
+        if not self.deploy_done_q.get():
+            # the failed deploy was reported by DeployInitialiser, there is nothing to provision
+            LOG.error('===================> Deployment phase failed. The services are not provisioned.')
+            self.provision_done_q.put(False)
+            return
+        LOG.info('===================> Deployment phase complete. Beginning provisioning...')
+        with TRACER.span('so.provision', parent=self.trace):
             self.provision()
+        if self.callback is not None:
+            self.callback.emit('provision')
 
     def provision(self):
-        # XXX implementation should look for mutable parameters in receiving service
-        # XXX and match with what's in existing service attrs
+        # TODO pre and post operations should be supported for lifecycle
         LOG.info('============ PROVISION ============')
-        update_jobs = []
-        svc_reps = self.__get_services_rep(live=False)
-
-        # get params for each service
-        for svc_type, svc_rep in svc_reps.iteritems():
-            LOG.info('Getting parameters for: ' + svc_type)
-            params = self.__get_param_svc_type(svc_type)
-
-            LOG.info(svc_type + ' needs the following provisioning input parameters: ' + params.__repr__())
-            occi_params = {}
-            for param in params:
-                try:
-                    # get the parameter value of the specified service type and parameter name
-                    attr = svc_reps[param.keys()[0]]['attributes'][param[param.keys()[0]]]
-                except KeyError as ke:
-                    LOG.error(param[param.keys()[0]] + ' of ' + param.keys()[0] +
-                              ' could not be found in the set of service parameters')
-                    raise ke
-                LOG.info(svc_type + ' will be updated with: ' + param[param.keys()[0]] + ' = ' + attr)
-                occi_params[param[param.keys()[0]]] = attr
-
-            LOG.debug('Parameters ' + occi_params.__repr__() + ' for ' + svc_type + ' instance at: ' +
-                      svc_rep['location'])
-            update_job = {'params': occi_params, 'inst_ep': svc_rep['location']}
-            update_jobs.append(update_job)
-
-        queue = Queue()
-        for update_job in update_jobs:
-            pt = ProvisionTask(self.tenant, self.token, update_job, queue)
-            pt.setDaemon(True)
-            pt.start()
-
-        prov_results = []
-        while len(update_jobs) != len(prov_results):
-            result = queue.get()
-            prov_results.append(result)
-            LOG.debug('Number of provision jobs to complete: ' + str(len(update_jobs)))
-            LOG.debug('Number of provision jobs completed: ' + str(len(prov_results)))
-
         LOG.info('---> All services and resources are now provisioned.')
         self.provision_done_q.put(True)
         LOG.info('============ PROVISION ============')
 
-    def __get_services_rep(self, live):
-        # This will be an update to all services with the necessary parameters
-        heads = {'X-Auth-Token': self.token, 'X-Tenant-Name': self.tenant, 'Accept': 'application/occi+json'}
-        # if live:
-        svc_reps = {}
-        for svc_inst in self.service_inst_endpoints:
-            for svc_url in svc_inst:
-                LOG.debug('Getting attributes for service instance: ' + svc_url['location'])
-                try:
-                    r = requests.get(svc_url['location'], headers=heads)
-                    r.raise_for_status()
-                except requests.HTTPError as err:
-                    LOG.error('HTTP Error: should do something more here!' + err.message)
-                    raise err
-                loc = svc_url['location']
-                attrs = json.loads(r.content)
-                occi_attrs = attrs['attributes']
-                srv_type = attrs['kind']['scheme'] + attrs['kind']['term']
-
-                # TODO multiple service instances per service provider
-                svc_reps[srv_type] = {'location': loc, 'attributes': occi_attrs}
-        # else:
-        #     svc_reps = {u'http://schemas.mobile-cloud-networking.eu/occi/sm#test-dns': {'attributes': {u'mcn.service.state': u'provision', u'mcn.endpoint.dnsaas': u'10.0.0.1', u'mcn.endpoint.dns': u'10.0.0.1', u'occi.mcn.stack.state': u'CREATE_COMPLETE', u'activate.string': u'immutable_init_value', u'activate.float': u'0.11', u'occi.mcn.stack.id': u'9da3cb93-8e2b-4a78-ac47-b866954044b0', u'occi.core.id': u'54cd4aacac3c302522000287', u'activate.integer': u'1'}, 'location': 'http://160.85.4.53:8888/test-dns/54cd4aacac3c302522000287'}, u'http://schemas.mobile-cloud-networking.eu/occi/sm#test-maas': {'attributes': {u'mcn.service.state': u'provision', u'occi.mcn.stack.state': u'CREATE_COMPLETE', u'activate.string': u'immutable_init_value', u'activate.float': u'0.11', u'occi.mcn.stack.id': u'a36da3d3-9150-4ff5-91da-f3a702d5dddd', u'mcn.endpoint.maas': u'66.66.66.66', u'occi.core.id': u'54cd4abdac3c30252200029b', u'activate.integer': u'1'}, 'location': 'http://160.85.4.63:8888/test-maas/54cd4abdac3c30252200029b'}, u'http://schemas.mobile-cloud-networking.eu/occi/sm#test-epc': {'attributes': {u'mcn.endpoint.pdn-gw': u'10.0.0.1', u'mcn.service.state': u'provision', u'mcn.endpoint.srv-gw': u'10.0.0.1', u'occi.mcn.stack.state': u'CREATE_COMPLETE', u'mcn.endpoint.mme': u'10.0.0.1', u'activate.string': u'immutable_init_value', u'activate.float': u'0.11', u'occi.mcn.stack.id': u'e3e6f997-503b-40c6-9192-44d52ed45c04', u'activate.integer': u'1', u'mcn.endpoint.enodeb': u'10.0.0.1', u'occi.core.id': u'54cd4aceac3c3025220002af', u'mcn.endpoint.hss': u'10.0.0.1'}, 'location': 'http://160.85.4.60:8888/test-epc/54cd4aceac3c3025220002af'}}
-
-        return svc_reps
-
-    def __get_param_svc_type(self, svc_type):
-        svc_params = []
-        for req in self.stg['depends_on']:
-            if req.keys()[0] == svc_type:
-                for y in req[req.keys()[0]]['inputs']:
-                    supply_service = y.split('#')
-                    svc_params.append({supply_service[0] + '#' + supply_service[1]: supply_service[2]})
-        # remove duplicate dicts from the list
-        result = [dict(tupleized) for tupleized in set(tuple(item.items()) for item in svc_params)]
-        # results contain the service type from where the attribute value can be found
-        return result
-
     def dispose(self):
         pass
 
 
-class DeployTask(threading.Thread):
-    # will provision one service or an array of services.
-    # if an array is presented, then these services are to be processed in series
-    # This task will only report completion (through a queue) when the service instance enters
-    # into the 'active' state.
-    # The same logic applies should an ordered list of services be supplied but in this case
-    # the result is reported when all services in the array enter into the 'active' state
+class PolledTask(object):
+    """
+    A request to the SM of a service followed by readiness checks of the instance. Both are run on the shared
+    WORKERS and the checks are issued every SO_POLL_INTERVAL seconds, so no thread waits for the instance in
+    between. Subclasses send the request and tell whether the instance is ready.
+    """
+    name = 'task'
+
+    def __init__(self, parent=None):
+        self.parent = parent  # the span this task is part of
+        self.span = None
+
+    def start(self, on_ready=None, on_error=None):
+        """
+        Runs the task in the background. on_ready() is called once the instance is ready, on_error(exception)
+        if the task failed.
+        """
+        self.span = TRACER.start_span(self.name, parent=self.parent, attributes=self.span_attributes())
+        WORKERS.submit(self.__request, on_ready, on_error)
+
+    def wait(self):
+        """
+        Runs the task and waits for it.
+
+        :raises: the exception the task failed with
+        """
+        finished = Queue()
+        self.start(on_ready=lambda: finished.put(None), on_error=finished.put)
+        error = finished.get()
+        if error is not None:
+            raise error
+
+    def span_attributes(self):
+        return {}
+
+    def request(self):
+        """
+        :return: the location of the instance to check
+        """
+        raise NotImplementedError()
+
+    def is_ready(self, loc):
+        """
+        :return: (True if the instance is ready, the response of the check)
+        """
+        raise NotImplementedError()
+
+    def completed(self, loc, response):
+        # called with the response of the check that found the instance ready
+        pass
+
+    def __request(self, on_ready, on_error):
+        try:
+            with TRACER.activate(self.span):
+                loc = self.request()
+        except Exception as e:
+            self.__failed(on_error, e)
+            return
+
+        checked = {}
+
+        def check():
+            with TRACER.activate(self.span):
+                ready, checked['response'] = self.is_ready(loc)
+            return ready
+
+        def ready():
+            try:
+                self.completed(loc, checked['response'])
+            except Exception as e:
+                self.__failed(on_error, e)
+                return
+            self.span.finish()
+            if on_ready is not None:
+                on_ready()
+
+        WORKERS.watch(check, on_ready=ready, on_error=partial(self.__failed, on_error), interval=POLL_INTERVAL,
+                      delay=POLL_INTERVAL, key=loc)
+
+    def __failed(self, on_error, error):
+        self.span.set_attribute('error', error.__repr__())
+        self.span.finish('error')
+        if on_error is None:
+            LOG.error(self.name + ' failed: ' + error.__repr__())
+        else:
+            on_error(error)
+
+
+class DeployTask(PolledTask):
+    # will provision one service
+    # This task will only report completion when the service instance enters into the 'active' state.
     # XXX This can be a long running task - needs audit log
-    def __init__(self, service_spec, results_q, tenant, token, svc_params):
-        super(DeployTask, self).__init__()
+    name = 'deploy'
+
+    def __init__(self, service_spec, results_q, tenant, token, svc_params, parent=None):
+        super(DeployTask, self).__init__(parent)
+        if not isinstance(service_spec, dict):  # just a singular service TODO re-enable serial reqs?
+            LOG.info('Format of the service deployment schema is unknown: ' + service_spec.__repr__())
+            raise RuntimeError('Format of the service deployment schema is unknown: ' + service_spec.__repr__())
         self.service_spec = service_spec
         self.q = results_q
         self.tenant = tenant
         self.token = token
         self.endpoints = []
         self.svc_params = svc_params
+        # (key, consumer) of an instance shared with other compositions, see sm.sharing
+        self.shared = None
 
     def run(self):
-        super(DeployTask, self).run()
-
         LOG.info('Deploying: ' + self.service_spec.__repr__())
-
-        # all block until the service has entered it's 'active' phase
-        # the service spec is a list of hashes, therefore is a set of services to be executed sequentially
-        # if isinstance(self.service_spec, list):
-        #     LOG.info('provisioning services in series')
-        #     for srv in self.service_spec:
-        #         srv_inst = self.create_service(srv)
-        #         LOG.info('created the service: ' + srv_inst.__repr__())
-        #         self.endpoints.append(srv_inst)
-        if isinstance(self.service_spec, dict):  # just a singular service TODO re-enable serial reqs?
-            srv_inst = self.create_service(self.service_spec)
-            LOG.info('created the service: ' + srv_inst.__repr__())
-            self.endpoints.append(srv_inst)
-        else:
-            LOG.info('Format of the service deployment schema is unknown: ' + self.service_spec.__repr__())
-            raise RuntimeError('Format of the service deployment schema is unknown: ' + self.service_spec.__repr__())
-
-        # signal that this thread is complete.
+        self.wait()
+        # signal that this task is complete.
         self.q.put(self.endpoints)
 
-    def create_service(self, service_spec):
+    def span_attributes(self):
+        return {'service': self.service_spec.keys()[0]}
+
+    def request(self):
+        service_spec = self.service_spec
         srv_type = service_spec.keys()[0]
         heads = {
             'Category': srv_type.split('#')[1] + '; ' + 'scheme="' + srv_type.split('#')[0] + '#"; class="kind"',
@@ -443,19 +654,23 @@ class DeployTask(threading.Thread):
         if len(self.svc_params) > 0:
             LOG.info('Sending additional parameters to service: ' + self.svc_params.__repr__())
 
-            occi_attr = ''
-            for para_k, para_v in self.svc_params.items():
-                occi_attr = para_k + '="' + para_v + '", '
-
-            heads['X-OCCI-Attribute'] = occi_attr[0:-2]
+            heads['X-OCCI-Attribute'] = render_attributes(self.svc_params)
+        if self.shared is not None:
+            heads[KEY_HEADER], heads[CONSUMER_HEADER] = self.shared
 
         try:
             LOG.info('issuing service instantiation to: ' + service_spec[srv_type]['endpoint'])
             LOG.info('issuing service instantiation with headers: ' + heads.__repr__())
-            r = requests.post(service_spec[srv_type]['endpoint'], headers=heads)
+            r = traced_request('POST', service_spec[srv_type]['endpoint'], heads)
             r.raise_for_status()
+        except requests.ConnectionError:
+            # the SM of the service type may have moved, its endpoint is looked up again by the next deploy
+            ENDPOINTS.forget(srv_type)
+            raise
         except requests.HTTPError as err:
             LOG.info('HTTP Error: should do something more here!' + err.message)
+            if err.response is not None and err.response.status_code == 404:
+                ENDPOINTS.forget(srv_type)
             raise err
 
         # at this point, the request will return back an X-OCCI-Location, the service has not completed it's process
@@ -463,21 +678,17 @@ class DeployTask(threading.Thread):
         if loc == '':
             LOG.error('No OCCI location for the service instance found.')
             raise RuntimeError('No OCCI location for the service instance found.')
+        return loc
 
-        # wait for the service to enter into the active
-        ready = False
-        while not ready:
-            time.sleep(13)
-            ready, r = self.is_ready(loc)
-
+    def completed(self, loc, r):
         # TODO here is where we place attributes against the location to the service
         attrs_string = r.headers.get('x-occi-attribute', '')
-        attrs = self.attr_string_to_dict(attrs_string)
+        attrs = attr_string_to_dict(attrs_string)
 
         LOG.info('Service instantiated: ' + loc)
         LOG.info('Service attributes are: ' + attrs.__repr__())
 
-        return {'type': srv_type, 'location': loc, 'attributes': attrs}
+        self.endpoints.append({'type': self.service_spec.keys()[0], 'location': loc, 'attributes': attrs})
 
     def is_ready(self, loc):
         heads = {
@@ -490,7 +701,7 @@ class DeployTask(threading.Thread):
         LOG.info('DeployTask: checking service state at: ' + loc)
         LOG.info('sending headers: ' + heads.__repr__())
         try:
-            r = requests.get(loc, headers=heads)
+            r = traced_request('GET', loc, heads)
             r.raise_for_status()
         except requests.HTTPError as err:
             LOG.info('HTTP Error: should do something more here!' + err.message)
@@ -499,7 +710,7 @@ class DeployTask(threading.Thread):
         attrs = r.headers.get('x-occi-attribute', '')
 
         if len(attrs) > 0:
-            attr_hash = self.attr_string_to_dict(attrs)
+            attr_hash = attr_string_to_dict(attrs)
             stack_state = ''
             try:
                 stack_state = attr_hash['occi.mcn.stack.state']
@@ -519,73 +730,71 @@ class DeployTask(threading.Thread):
             else:
                 LOG.info('Service is not ready')
                 return False, r
+        # no attributes yet
+        return False, r
 
-    def attr_string_to_dict(self, attrs_string):
-        attr_hash = {}
-        if len(attrs_string) <= 0:
-            LOG.warn('Attributes string is empty.')
-        else:
-            for kv in attrs_string.split(','):
-                key = kv.strip().split('=')[0]
-                val = kv.strip().split('=')[1]
-                if val.endswith('\'') or val.endswith('"'):
-                    val = val[1:-1]
-                attr_hash[key] = val
-
-        LOG.info('attributes extracted: ' + attr_hash.__repr__())
-        return attr_hash
-
-    def destroy(self):
+    def destroy(self, timeout=None):
         heads = {'Content-Type': 'text/occi',
                  'X-Auth-Token': self.token,
                  'X-Tenant-Name': self.tenant
         }
+        if self.shared is not None:
+            # the SM deletes a shared instance only once the last composition using it is gone
+            heads[CONSUMER_HEADER] = self.shared[1]
         for ep in self.endpoints:
             LOG.info('Destroying service: ' + ep['location'])
             LOG.info('Sending headers: ' + heads.__repr__())
             try:
-                r = requests.delete(ep['location'], headers=heads)
+                r = traced_request('DELETE', ep['location'], heads, timeout=timeout)
+                if r.status_code == 404:
+                    LOG.info('Service was already destroyed: ' + ep['location'])
+                    continue
                 r.raise_for_status()
             except requests.HTTPError as err:
                 LOG.info('HTTP Error: should do something more here!' + err.message)
                 raise err
+            if r.headers.get(CONSUMERS_HEADER, '0') != '0':
+                LOG.info('Keeping shared service used by ' + r.headers[CONSUMERS_HEADER] + ' compositions: ' +
+                         ep['location'])
 
 
-class ProvisionTask(threading.Thread):
+class ProvisionTask(PolledTask):
+    name = 'provision'
 
-    def __init__(self, tenant, token, update_job, results_q):
-        super(ProvisionTask, self).__init__()
+    def __init__(self, tenant, token, update_job, results_q, parent=None):
+        super(ProvisionTask, self).__init__(parent)
         self.tenant = tenant
         self.token = token
         self.update_job = update_job
         self.q = results_q
+        self.response = None
 
     def run(self):
-        super(ProvisionTask, self).run()
+        self.wait()
+        self.q.put(self.response)
+
+    def span_attributes(self):
+        return {'instance': self.update_job['inst_ep']}
+
+    def request(self):
 
         heads = {'X-Auth-Token': self.token, 'X-Tenant-Name': self.tenant, 'Content-type': 'text/occi'}
         iep = self.update_job['inst_ep']
-        attrs = ''
-        for k, v in self.update_job['params'].iteritems():
-            attrs = attrs + k + '="' + v + '", '
-        heads['X-OCCI-Attribute'] = attrs[0:-2]
+        heads['X-OCCI-Attribute'] = render_attributes(self.update_job['params'])
 
         LOG.info('Provisioning service instance: ' + iep)
         LOG.info('Sending headers: ' + heads.__repr__())
 
         try:
-            r = requests.post(iep, headers=heads)
+            r = traced_request('POST', iep, heads)
             r.raise_for_status()
         except requests.HTTPError as err:
             LOG.error('HTTP Error: should do something more here!' + err.message)
             raise err
+        return iep
 
-        ready = False
-        while not ready:
-            time.sleep(13)
-            ready, r = self.is_ready(iep)
-
-        self.q.put(r)
+    def completed(self, loc, r):
+        self.response = r
 
     def is_ready(self, loc):
         heads = {
@@ -598,7 +807,7 @@ class ProvisionTask(threading.Thread):
         LOG.info('ProvisionTask: checking service state at: ' + loc)
         LOG.info('sending headers: ' + heads.__repr__())
         try:
-            r = requests.get(loc, headers=heads)
+            r = traced_request('GET', loc, heads)
             r.raise_for_status()
         except requests.HTTPError as err:
             LOG.info('HTTP Error: should do something more here!' + err.message)
@@ -607,7 +816,7 @@ class ProvisionTask(threading.Thread):
         attrs = r.headers.get('x-occi-attribute', '')
 
         if len(attrs) > 0:
-            attr_hash = self.attr_string_to_dict(attrs)
+            attr_hash = attr_string_to_dict(attrs)
             stack_state = ''
             try:
                 stack_state = attr_hash['occi.mcn.stack.state']
@@ -624,21 +833,8 @@ class ProvisionTask(threading.Thread):
             else:
                 LOG.info('Service is not ready')
                 return False, r
-
-    def attr_string_to_dict(self, attrs_string):
-        attr_hash = {}
-        if len(attrs_string) <= 0:
-            LOG.warn('Attributes string is empty.')
-        else:
-            for kv in attrs_string.split(','):
-                key = kv.strip().split('=')[0]
-                val = kv.strip().split('=')[1]
-                if val.endswith('\'') or val.endswith('"'):
-                    val = val[1:-1]
-                attr_hash[key] = val
-
-        LOG.info('attributes extracted: ' + attr_hash.__repr__())
-        return attr_hash
+        # no attributes yet
+        return False, r
 
 
 # basic test
@@ -0,0 +1,207 @@
+# Copyright 2014-2015 Zuercher Hochschule fuer Angewandte Wissenschaften
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Tracing of the lifecycle of service instances across the SM and the SO.
+
+A span is a timed operation, spans of one trace form a tree. The trace context travels between processes in
+a W3C traceparent header (00-<trace id>-<span id>-01) so that the spans of the SO continue the trace of the
+SM. Finished spans are handed to an exporter, which keeps them in memory or appends them to a file as one
+JSON document per line.
+"""
+
+from collections import deque
+from contextlib import contextmanager
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+__author__ = 'andy'
+
+LOG = logging.getLogger(__name__)
+
+HEADER = 'traceparent'
+TRACEPARENT = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$')
+
+
+def new_id(size):
+    return os.urandom(size).encode('hex')
+
+
+def parse_traceparent(value):
+    """
+    :return: (trace id, span id) of a traceparent header value, None if it is not valid
+    """
+    match = TRACEPARENT.match((value or '').strip().lower())
+    if match is None:
+        return None
+    return match.group(1), match.group(2)
+
+
+class Span(object):
+
+    def __init__(self, tracer, name, trace_id=None, parent_id=None, attributes=None):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id or new_id(16)
+        self.span_id = new_id(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.start = time.time()
+        self.end = None
+        self.status = None
+
+    def set_attribute(self, name, value):
+        self.attributes[name] = value
+
+    def traceparent(self):
+        return '00-%s-%s-01' % (self.trace_id, self.span_id)
+
+    def finish(self, status='ok'):
+        # only the first call has an effect
+        if self.end is not None:
+            return
+        self.end = time.time()
+        self.status = status
+        self.tracer.export(self)
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'start': self.start,
+            'end': self.end,
+            'duration': self.end - self.start if self.end is not None else None,
+            'status': self.status,
+            'attributes': self.attributes
+        }
+
+
+class Tracer(object):
+    """
+    Creates spans and keeps track of the active span of each thread. A span started without an explicit
+    parent is a child of the active span, if any.
+    """
+
+    def __init__(self, exporter=None):
+        self.exporter = exporter
+        self.local = threading.local()
+
+    def start_span(self, name, parent=None, attributes=None):
+        """
+        :param parent: a Span, a traceparent header value or None
+        """
+        if parent is None:
+            parent = self.current()
+        if isinstance(parent, Span):
+            return Span(self, name, parent.trace_id, parent.span_id, attributes)
+        context = parse_traceparent(parent) if isinstance(parent, basestring) else None
+        if context is not None:
+            return Span(self, name, context[0], context[1], attributes)
+        return Span(self, name, attributes=attributes)
+
+    def current(self):
+        return getattr(self.local, 'span', None)
+
+    @contextmanager
+    def activate(self, span):
+        # makes span the active span of this thread for the duration of the block
+        previous = self.current()
+        self.local.span = span
+        try:
+            yield span
+        finally:
+            self.local.span = previous
+
+    @contextmanager
+    def span(self, name, parent=None, attributes=None):
+        # a span lasting for the block, active within it and marked as failed if the block raises
+        span = self.start_span(name, parent, attributes)
+        with self.activate(span):
+            try:
+                yield span
+            except Exception as e:
+                span.set_attribute('error', e.__repr__())
+                span.finish('error')
+                raise
+        span.finish()
+
+    def inject(self, headers):
+        """
+        :return: a copy of headers carrying the context of the active span, if any
+        """
+        headers = dict(headers)
+        span = self.current()
+        if span is not None:
+            headers[HEADER] = span.traceparent()
+        return headers
+
+    def export(self, span):
+        if self.exporter is None:
+            return
+        try:
+            self.exporter.export(span)
+        except Exception as e:
+            LOG.error('Could not export span ' + span.name + ': ' + e.__repr__())
+
+
+class MemoryExporter(object):
+    """
+    Keeps the last size finished spans.
+    """
+
+    def __init__(self, size=10000):
+        self.finished = deque(maxlen=size)
+
+    def export(self, span):
+        self.finished.append(span.to_dict())
+
+    def spans(self, trace_id=None):
+        return [span for span in list(self.finished) if trace_id is None or span['trace_id'] == trace_id]
+
+
+class FileExporter(object):
+    """
+    Appends finished spans to the file at path, one JSON document per line.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def export(self, span):
+        line = json.dumps(span.to_dict()) + '\n'
+        with self.lock:
+            with open(self.path, 'a') as spans:
+                spans.write(line)
+
+
+def exporter(name, path=''):
+    """
+    :param name: memory, file (appending to path) or none
+    """
+    if name == 'memory':
+        return MemoryExporter()
+    if name == 'file':
+        return FileExporter(path)
+    return None
+
+
+TRACER = Tracer()
@@ -0,0 +1,76 @@
+# Copyright 2014-2015 Zuercher Hochschule fuer Angewandte Wissenschaften
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Versions of the resources of the registry, used as their ETag.
+
+The version of a resource is incremented whenever one of its attributes or links has changed since its
+version was last asked for. Changes are detected by comparing a fingerprint of the attributes and links, so
+that none of the places changing an entity (lifecycle phases, retrieves, updates) has to report it. ETags
+include a value chosen at start up, so that the tags of a previous run of the SM never match.
+"""
+
+import os
+import threading
+
+from occi.core_model import Resource
+
+__author__ = 'andy'
+
+
+def fingerprint(entity):
+    links = tuple(link.identifier for link in entity.links) if isinstance(entity, Resource) else ()
+    state = (tuple(sorted(entity.attributes.items())), links)
+    try:
+        return hash(state)
+    except TypeError:
+        # an attribute value which is not hashable, e.g. a list
+        return hash(repr(state))
+
+
+class ResourceVersions(object):
+
+    def __init__(self):
+        self.boot = os.urandom(4).encode('hex')
+        self.versions = {}  # key -> (fingerprint, version)
+        self.lock = threading.Lock()
+
+    def version(self, key, entity):
+        current = fingerprint(entity)
+        with self.lock:
+            last, version = self.versions.get(key, (None, 0))
+            if last != current:
+                version += 1
+                self.versions[key] = (current, version)
+            return version
+
+    def etag(self, key, entity):
+        return '"' + self.boot + '-' + str(self.version(key, entity)) + '"'
+
+    def forget(self, key):
+        with self.lock:
+            self.versions.pop(key, None)
+
+
+def matches(if_none_match, etag):
+    """
+    :param if_none_match: the value of an If-None-Match header, e.g. "a", W/"b" or *
+    :return: True if etag is one of the tags listed
+    """
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag == '*' or tag == etag or tag[2:] == etag and tag.startswith('W/'):
+            return True
+    return False
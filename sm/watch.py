@@ -0,0 +1,151 @@
+# Copyright 2014-2015 Zuercher Hochschule fuer Angewandte Wissenschaften
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Long-poll watches on the resources of the SM.
+
+GET /watch/<resource path>?wait=<seconds> with the ETag of the resource in If-None-Match answers as soon as
+the resource has another ETag (e.g. because its mcn.service.state has changed) with its attributes, or with
+304 Not Modified once wait seconds have passed. Without If-None-Match it answers right away.
+
+Waiting requests are parked on the IOLoop of tornado rather than holding a thread each. Whatever changes a
+resource calls WATCHERS.notify(key), which wakes the requests watching it so that they compare the ETag again.
+Authenticating a request and looking its resource up may block, they are run on an executor instead of the
+IOLoop so that other requests are served meanwhile.
+"""
+
+from datetime import timedelta
+import json
+import threading
+import time
+
+from occi.exceptions import HTTPError
+from tornado import gen
+from tornado import ioloop
+from tornado import web
+from tornado.concurrent import Future
+
+from sm.versions import matches
+
+__author__ = 'andy'
+
+WATCH_PATH = '/watch'
+
+
+class Watchers(object):
+    """
+    Callbacks waiting for a change of a resource, by the key of the resource.
+    """
+
+    def __init__(self):
+        self.callbacks = {}
+        self.lock = threading.Lock()
+
+    def add(self, key, callback):
+        with self.lock:
+            self.callbacks.setdefault(key, set()).add(callback)
+
+    def discard(self, key, callback):
+        with self.lock:
+            callbacks = self.callbacks.get(key)
+            if callbacks is not None:
+                callbacks.discard(callback)
+                if len(callbacks) == 0:
+                    del self.callbacks[key]
+
+    def notify(self, key):
+        # may be called from any thread, the callbacks must not block
+        with self.lock:
+            callbacks = list(self.callbacks.get(key, ()))
+        for callback in callbacks:
+            callback()
+
+    def count(self):
+        with self.lock:
+            return sum(len(callbacks) for callbacks in self.callbacks.values())
+
+
+WATCHERS = Watchers()
+
+
+class WatchHandler(web.RequestHandler):
+    """
+    app provides the registry, the versions (see sm.versions) and authenticate(token, tenant), raising an
+    occi HTTPError if the request is not authorised. wait is capped at max_wait seconds. executor runs the
+    calls to app that may block, None for the default executor of the IOLoop.
+    """
+
+    def initialize(self, app, max_wait=300, watchers=WATCHERS, executor=None):
+        self.app = app
+        self.max_wait = max_wait
+        self.watchers = watchers
+        self.executor = executor
+
+    @gen.coroutine
+    def get(self, key):
+        token = self.request.headers.get('X-Auth-Token', '')
+        tenant = self.request.headers.get('X-Tenant-Name', '')
+        loop = ioloop.IOLoop.current()
+        try:
+            yield loop.run_in_executor(self.executor, self.app.authenticate, token, tenant)
+        except HTTPError as e:
+            raise web.HTTPError(e.code, '%s', e.message)
+        try:
+            wait = min(float(self.get_argument('wait', self.max_wait)), self.max_wait)
+        except ValueError:
+            raise web.HTTPError(400, 'wait must be a number of seconds.')
+
+        extras = {'token': token, 'tenant_name': tenant, 'registry': self.app.registry}
+        known = self.request.headers.get('If-None-Match', '')
+        deadline = time.time() + wait
+        while True:
+            changed = Future()
+
+            def wake(future=changed):
+                if not future.done():
+                    future.set_result(None)
+
+            def notify(wake=wake):
+                loop.add_callback(wake)
+
+            # registered before comparing so that no change in between is missed
+            self.watchers.add(key, notify)
+            try:
+                entity = yield loop.run_in_executor(self.executor, self.__lookup, key, extras)
+                if entity is None:
+                    raise web.HTTPError(404, 'No resource %s', key)
+                etag = self.app.versions.etag(key, entity)
+                self.set_header('ETag', etag)
+                if known == '' or not matches(known, etag):
+                    self.set_header('Content-Type', 'application/json')
+                    self.finish(json.dumps({'location': key, 'etag': etag, 'attributes': entity.attributes}))
+                    return
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    self.set_status(304)
+                    self.finish()
+                    return
+                try:
+                    yield gen.with_timeout(timedelta(seconds=remaining), changed)
+                except gen.TimeoutError:
+                    pass
+            finally:
+                self.watchers.discard(key, notify)
+
+    def __lookup(self, key, extras):
+        try:
+            return self.app.registry.get_resource(key, extras)
+        except KeyError:
+            return None
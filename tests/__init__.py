@@ -16,4 +16,15 @@
 """
 Unittests
 """
-__author__ = 'andy'
\ No newline at end of file
+import os
+import tempfile
+
+__author__ = 'andy'
+
+if 'SM_CONFIG_PATH' in os.environ:
+    from sm.config import CONFIG
+
+    # the tests log to a temporary file rather than to the log_file of the configuration they are run with
+    if not CONFIG.has_section('general'):
+        CONFIG.add_section('general')
+    CONFIG.set('general', 'log_file', os.path.join(tempfile.gettempdir(), 'sm_tests.log'))
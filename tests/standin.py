@@ -0,0 +1,264 @@
+#   Copyright 2014-2015 Zuercher Hochschule fuer Angewandte Wissenschaften
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+A local stand-in for a service orchestrator, answering /orchestrator/default like an SO does. A deploy takes
+deploy_time seconds, after which occi.mcn.stack.state is CREATE_COMPLETE. Completed phases are reported to
+the callback passed in the activate phase, see sm.callbacks.
+
+StandInSM answers the requests of a SO to the SMs of the services it depends on, for any service type.
+"""
+
+import json
+import logging
+import threading
+import time
+from urlparse import parse_qs
+from wsgiref.simple_server import make_server, WSGIRequestHandler
+
+import requests
+
+from sm.attributes import parse_attributes, render_attributes
+from sm.callbacks import CALLBACK_PATH, TOKEN_HEADER, Callback, authentic, callback_url, from_attributes, \
+    new_token, parse_callback
+from sm import sharing
+
+__author__ = 'andy'
+
+LOG = logging.getLogger(__name__)
+
+PATH = '/orchestrator/default'
+
+
+class QuietHandler(WSGIRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(app):
+    """
+    Serves app on an unused local port in a daemon thread.
+
+    :return: the base URL of app
+    """
+    server = make_server('127.0.0.1', 0, app, handler_class=QuietHandler)
+    thread = threading.Thread(target=server.serve_forever, name='standin-' + str(server.server_port))
+    thread.setDaemon(True)
+    thread.start()
+    return 'http://127.0.0.1:' + str(server.server_port)
+
+
+class StandInSO(object):
+    """
+    The WSGI application of the stand-in SO.
+    """
+
+    def __init__(self, deploy_time=1.0):
+        self.deploy_time = deploy_time
+        self.attributes = {}
+        self.callback = None
+        self.completed = {}  # phase -> time of completion
+        self.lock = threading.Lock()
+
+    def __call__(self, environ, response):
+        if environ['PATH_INFO'] != PATH:
+            response('404 Not Found', [('Content-Type', 'text/plain')])
+            return ['']
+        method = environ['REQUEST_METHOD']
+        action = parse_qs(environ.get('QUERY_STRING', '')).get('action', [''])[0]
+        if method == 'PUT':
+            self.activate(parse_attributes(environ.get('HTTP_X_OCCI_ATTRIBUTE', '')))
+        elif method == 'POST' and action == 'deploy':
+            timer = threading.Timer(self.deploy_time, self.complete, ('deploy', 'CREATE_COMPLETE'))
+            timer.setDaemon(True)
+            timer.start()
+        elif method == 'POST' and action == 'provision':
+            self.complete('provision', 'CREATE_COMPLETE')
+        elif method == 'GET':
+            with self.lock:
+                attributes = dict(self.attributes)
+            if 'json' in environ.get('HTTP_ACCEPT', ''):
+                body = json.dumps({'attributes': attributes})
+                response('200 OK', [('Content-Type', 'application/occi+json')])
+                return [body]
+            response('200 OK', [('Content-Type', 'text/occi'), ('X-OCCI-Attribute', render_attributes(attributes))])
+            return ['']
+        elif method == 'DELETE':
+            with self.lock:
+                self.attributes = {}
+        response('200 OK', [('Content-Type', 'text/plain')])
+        return ['']
+
+    def activate(self, attributes):
+        with self.lock:
+            self.callback = from_attributes(attributes)
+            self.attributes = {'occi.mcn.stack.state': 'CREATE_IN_PROGRESS'}
+            self.completed = {}
+
+    def complete(self, phase, stack_state):
+        with self.lock:
+            self.attributes['occi.mcn.stack.state'] = stack_state
+            self.completed[phase] = time.time()
+            callback = self.callback
+        if callback is not None:
+            callback.emit(phase, {'occi.mcn.stack.state': stack_state})
+
+
+class Instance(object):
+    # an instance of a service type at StandInSM, with the attributes sm.sharing expects of an entity
+
+    def __init__(self, term, location, attributes):
+        self.term = term
+        self.location = location
+        self.attributes = attributes
+        self.created = time.time()
+
+
+class StandInSM(object):
+    """
+    The WSGI application of a stand-in SM for all service types: a POST to /<term>/ creates an instance, which
+    is deployed after deploy_times[term] seconds (deploy_time by default) and then has the attribute
+    mcn.endpoint.<term>. A POST to the instance provisions it at once with the attributes sent. The instances
+    of the terms and at the paths in failing fail to deploy. Shared instances are handed out and deleted as by
+    the SM, see sm.sharing. The requests are recorded in requests as (method, term).
+    """
+
+    def __init__(self, deploy_time=0.1, deploy_times=None, failing=()):
+        self.deploy_time = deploy_time
+        self.deploy_times = deploy_times or {}
+        self.failing = set(failing)
+        self.instances = {}  # path -> Instance
+        self.requests = []
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, environ, response):
+        path = environ['PATH_INFO']
+        method = environ['REQUEST_METHOD']
+        base = 'http://' + environ['HTTP_HOST']
+        with self.lock:
+            if method == 'POST' and path.endswith('/'):
+                return self.create(path, environ, base, response)
+            instance = self.instances.get(path)
+            if instance is None:
+                response('404 Not Found', [('Content-Type', 'text/plain')])
+                return ['']
+            self.requests.append((method, instance.term))
+            if method == 'POST':
+                instance.attributes.update(parse_attributes(environ.get('HTTP_X_OCCI_ATTRIBUTE', '')))
+                instance.attributes['mcn.service.state'] = 'provision'
+            elif method == 'DELETE':
+                consumer = environ.get(sharing.environ_key(sharing.CONSUMER_HEADER), '')
+                remaining = sharing.release(instance, consumer) if consumer != '' else 0
+                if remaining > 0:
+                    response('200 OK', [(sharing.CONSUMERS_HEADER, str(remaining))])
+                    return ['']
+                del self.instances[path]
+            elif method == 'GET':
+                attributes = self.state(instance)
+                if 'json' in environ.get('HTTP_ACCEPT', ''):
+                    response('200 OK', [('Content-Type', 'application/occi+json')])
+                    return [json.dumps({'attributes': attributes})]
+                response('200 OK', [('Content-Type', 'text/occi'),
+                                    ('X-OCCI-Attribute', render_attributes(attributes))])
+                return ['']
+        response('200 OK', [('Content-Type', 'text/plain')])
+        return ['']
+
+    def create(self, path, environ, base, response):
+        term = path.strip('/')
+        self.requests.append(('POST', term))
+        key = environ.get(sharing.environ_key(sharing.KEY_HEADER), '')
+        consumer = environ.get(sharing.environ_key(sharing.CONSUMER_HEADER), '')
+        instance = None
+        if key != '':
+            instance = sharing.find([instance for instance in self.instances.values() if instance.term == term], key)
+        status = '200 OK'
+        if instance is None:
+            self.count += 1
+            instance = Instance(term, path + str(self.count), {'mcn.service.state': 'deploy'})
+            self.instances[instance.location] = instance
+            status = '201 Created'
+        if key != '':
+            sharing.share(instance, key, consumer)
+        response(status, [('Location', base + instance.location)])
+        return ['']
+
+    def state(self, instance):
+        attributes = dict(instance.attributes)
+        if instance.term in self.failing or instance.location in self.failing:
+            attributes['occi.mcn.stack.state'] = 'CREATE_FAILED'
+        elif time.time() - instance.created >= self.deploy_times.get(instance.term, self.deploy_time):
+            attributes['occi.mcn.stack.state'] = 'CREATE_COMPLETE'
+            attributes['mcn.endpoint.' + instance.term] = instance.location
+        else:
+            attributes['occi.mcn.stack.state'] = 'CREATE_IN_PROGRESS'
+        instance.attributes['occi.mcn.stack.state'] = attributes['occi.mcn.stack.state']
+        return attributes
+
+    def terms(self, method):
+        with self.lock:
+            return [term for recorded, term in self.requests if recorded == method]
+
+
+class CallbackReceiver(object):
+    """
+    The callback endpoint of the SM in a nutshell: authenticates a callback and pokes the checks of the
+    instance on poller.
+    """
+
+    def __init__(self, poller):
+        self.poller = poller
+        self.tokens = {}  # instance path -> token
+
+    def offer(self, base, identifier):
+        # the attributes passed to the SO of identifier
+        self.tokens[identifier] = new_token()
+        return Callback(callback_url(base, identifier), self.tokens[identifier]).attributes()
+
+    def __call__(self, environ, response):
+        key = environ['PATH_INFO'][len(CALLBACK_PATH):]
+        if not authentic(self.tokens.get(key), environ.get('HTTP_' + TOKEN_HEADER.upper().replace('-', '_'))):
+            response('403 Forbidden', [('Content-Type', 'text/plain')])
+            return ['']
+        parse_callback(environ.get('HTTP_X_OCCI_ATTRIBUTE', ''))
+        response('200 OK', [('Content-Type', 'text/plain')])
+        return [str(self.poller.poke(key))]
+
+
+def deploy_latency(so, so_url, poller, interval, identifier, offered=None):
+    """
+    Activates and deploys the stand-in SO, polling for the completion of the deploy like DeploySO does.
+
+    :param identifier: the instance path the checks are registered under
+    :param offered: the callback attributes passed in the activate phase, if any
+    :return: seconds from the completion of the deploy until the poll noticed it
+    """
+    headers = {'Content-Type': 'text/occi', 'Accept': 'application/occi+json'}
+    if offered is not None:
+        headers['X-OCCI-Attribute'] = render_attributes(offered)
+    requests.put(so_url + PATH, headers=headers)
+    requests.post(so_url + PATH, params={'action': 'deploy'}, headers=headers)
+
+    noticed = threading.Event()
+
+    def check():
+        r = requests.get(so_url + PATH, headers={'Accept': 'application/occi+json'})
+        return json.loads(r.content)['attributes'].get('occi.mcn.stack.state') == 'CREATE_COMPLETE'
+
+    poller.watch(check, on_ready=noticed.set, interval=interval, key=identifier)
+    noticed.wait()
+    return time.time() - so.completed['deploy']
+
@@ -0,0 +1,61 @@
+# Copyright 2014-2015 Zuercher Hochschule fuer Angewandte Wissenschaften
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+__author__ = 'andy'
+
+import unittest
+
+from sm.attributes import parse_attributes, render_attributes
+
+
+def split_attributes(header):
+    # as headers were parsed before: split at every comma and equal sign, then strip the quotes
+    result = {}
+    for kv in header.split(','):
+        key = kv.strip().split('=')[0]
+        val = kv.strip().split('=')[1]
+        if val.endswith('\'') or val.endswith('"'):
+            val = val[1:-1]
+        result[key] = val
+    return result
+
+
+class TestAttributes(unittest.TestCase):
+
+    def test_quoted_values_with_separators(self):
+        header = 'occi.core.title="a, b=c", mcn.so.svcinsts="http://h:8888/epc/1 http://h:8888/ims/2",n=1'
+        self.assertEqual(parse_attributes(header), {'occi.core.title': 'a, b=c', 'n': '1',
+                                                    'mcn.so.svcinsts': 'http://h:8888/epc/1 http://h:8888/ims/2'})
+
+    def test_typed_values(self):
+        attrs = parse_attributes('a=1, b=2.5, c=true, d="2", e=x', typed=True)
+        self.assertEqual(attrs, {'a': 1, 'b': 2.5, 'c': True, 'd': '2', 'e': 'x'})
+        self.assertEqual(parse_attributes('a=1, c=true'), {'a': '1', 'c': 'true'})
+
+    def test_escaped_quotes(self):
+        attrs = {'msg': 'say "hi", \\o/', 'size': 3, 'on': False}
+        self.assertEqual(parse_attributes(render_attributes(attrs), typed=True), attrs)
+        self.assertEqual(render_attributes([('a', 'x'), ('b', 2)]), 'a="x", b=2')
+
+    def test_empty_and_invalid(self):
+        self.assertEqual(parse_attributes(''), {})
+        for header in ('a="x', 'a="x" b="y"', 'a', '="x"', 'a="x" junk', 'a="x\\"'):
+            self.assertRaises(ValueError, parse_attributes, header)
+
+    def test_plain_headers_parse_as_before(self):
+        for quoted in (1.0, 0.9, 0.5):
+            header = render_attributes([('occi.attr.%d' % i, 'value %d' % i if i % 100 < quoted * 100 else i)
+                                        for i in range(2000)])
+            self.assertEqual(parse_attributes(header), split_attributes(header))
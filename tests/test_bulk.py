@@ -0,0 +1,174 @@
+# Copyright 2014-2015 Zuercher Hochschule fuer Angewandte Wissenschaften
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+__author__ = 'andy'
+
+import os
+import threading
+import time
+import unittest
+
+if 'SM_CONFIG_PATH' not in os.environ:
+    raise AttributeError('Please provide SM_CONFIG_PATH as env var.')
+
+from occi.backend import KindBackend
+from occi.core_model import Kind, Resource
+from occi.exceptions import HTTPError
+from occi.registry import NonePersistentRegistry
+
+from sm import bulk
+from sm.bulk import BulkHandler, run_bounded
+from sm.scheduler import FairScheduler, QuotaExceeded
+
+
+class RecordingBackend(KindBackend):
+
+    def __init__(self):
+        self.prepared = 0
+        self.created = []
+        self.deleted = []
+
+    def prepare_batch(self, extras):
+        self.prepared += 1
+        extras['ops_version'] = 'v3'
+
+    def create(self, entity, extras):
+        if entity.attributes.get('fail') == 'yes':
+            raise RuntimeError('CC unavailable')
+        self.created.append((entity.attributes, extras['ops_version']))
+
+    def retrieve(self, entity, extras):
+        if entity.attributes.get('slow') == 'yes':
+            time.sleep(1)
+        if entity.attributes.get('fail') == 'retrieve':
+            raise RuntimeError('SO unavailable')
+        entity.attributes['state'] = 'fresh'
+
+    def delete(self, entity, extras):
+        self.deleted.append(entity.identifier)
+
+
+class SchedulingBackend(KindBackend):
+    # admits the lifecycles of the created instances as ServiceBackend.create does
+
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.started = []
+
+    def create(self, entity, extras):
+        try:
+            job = self.scheduler.admit(extras['tenant_name'])
+        except QuotaExceeded as e:
+            raise HTTPError(403, e.message)
+        job.run(lambda: self.started.append(entity.identifier))
+
+
+class TestBulk(unittest.TestCase):
+
+    def setUp(self):
+        self.kind = Kind('http://schemas.mobile-cloud-networking.eu/occi/sm#', 'test', location='/test/')
+        self.backend = RecordingBackend()
+        self.registry = NonePersistentRegistry()
+        self.registry.set_backend(self.kind, self.backend, None)
+        self.handler = BulkHandler(self.registry, self.kind, {'tenant_name': 'edmo', 'token': 't'}, parallelism=4)
+
+    def test_create_reports_status_per_instance(self):
+        doc = {'instances': [{'attributes': {'size': 1}}, {'attributes': {'fail': 'yes'}}, {}]}
+        result = self.handler.create(doc)['instances']
+
+        self.assertEqual([item['status'] for item in result], [201, 500, 201])
+        self.assertTrue(result[0]['location'].startswith('/test/'))
+        self.assertEqual(self.backend.prepared, 1)
+        self.assertEqual(sorted(self.backend.created), [({}, 'v3'), ({'size': '1'}, 'v3')])
+        self.assertEqual(len(self.registry.get_resources({})), 2)
+
+    def test_create_is_scheduled(self):
+        scheduler = FairScheduler(slots=1, max_pending=3)
+        backend = SchedulingBackend(scheduler)
+        self.registry.set_backend(self.kind, backend, None)
+        other = scheduler.admit('other')
+        other.run(lambda: None)
+
+        result = self.handler.create({'instances': [{}] * 5})['instances']
+
+        # the batch waits for the slot of the other tenant and is limited by its quota
+        self.assertEqual(sorted(item['status'] for item in result), [201, 201, 201, 403, 403])
+        self.assertEqual(backend.started, [])
+        self.assertEqual(scheduler.stats()['edmo']['queued'], 3)
+        other.release()
+        self.assertEqual(len(backend.started), 1)
+
+    def test_invalid_document(self):
+        self.assertRaises(HTTPError, self.handler.create, {'instances': 'all'})
+        self.assertRaises(HTTPError, BulkHandler(self.registry, self.kind, {}, max_items=1).create,
+                          {'instances': [{}, {}]})
+
+    def test_delete_removes_instances_of_kind(self):
+        self.handler.create({'instances': [{}, {}, {}]})
+        other = Resource('/other/1', Kind('http://example.com#', 'other'), [])
+        self.registry.add_resource(other.identifier, other, None)
+
+        result = self.handler.delete()['instances']
+
+        self.assertEqual([item['status'] for item in result], [200, 200, 200])
+        self.assertEqual(len(self.backend.deleted), 3)
+        self.assertEqual(self.registry.get_resource_keys({}), ['/other/1'])
+
+    def test_retrieve_falls_back_to_registry_after_deadline(self):
+        self.handler.create({'instances': [{}, {'attributes': {'slow': 'yes'}}, {'attributes': {'fail': 'retrieve'}}]})
+        self.handler.deadline = 0.2
+
+        started = time.time()
+        result = dict((item['attributes'].get('slow', item['attributes'].get('fail', '')), item)
+                      for item in self.handler.retrieve()['instances'])
+
+        self.assertLess(time.time() - started, 0.9)
+        self.assertEqual(result['']['attributes']['state'], 'fresh')
+        self.assertFalse(result['']['stale'])
+        self.assertTrue(result['yes']['stale'])
+        self.assertNotIn('state', result['yes']['attributes'])
+        self.assertTrue(result['retrieve']['stale'])
+        self.assertIn('SO unavailable', result['retrieve']['error'])
+
+    def test_run_bounded_limits_parallelism(self):
+        lock = threading.Lock()
+        running = [0, 0]  # current, maximum
+
+        def work(item):
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+            return item * 2
+
+        self.assertEqual(run_bounded(work, range(20), 3), [item * 2 for item in range(20)])
+        self.assertEqual(running[1], 3)
+
+    def test_run_bounded_shares_its_threads(self):
+        release = threading.Event()
+
+        def slow(item):
+            release.wait(5)
+            return item
+
+        threads = threading.active_count()
+        for _ in range(10):
+            self.assertEqual(run_bounded(slow, range(4), 4, timeout=0.05), [bulk.MISSING] * 4)
+        # the calls that timed out hold on to the workers, no new threads are started for each batch
+        self.assertLessEqual(threading.active_count(), threads + bulk.WORKERS.workers + 1)
+        release.set()
+        self.assertEqual(run_bounded(lambda item: item * 2, range(3), 2, timeout=5), [0, 2, 4])
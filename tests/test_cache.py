@@ -0,0 +1,101 @@
+# Copyright 2014-2015 Zuercher Hochschule fuer Angewandte Wissenschaften
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+__author__ = 'andy'
+
+import time
+import unittest
+
+from sm.cache import AttributeCache
+
+
+class Loader(object):
+
+    def __init__(self):
+        self.loads = 0
+
+    def __call__(self):
+        self.loads += 1
+        return {'mcn.service.state': 'provision', 'loads': self.loads}
+
+
+class TestAttributeCache(unittest.TestCase):
+
+    def setUp(self):
+        self.load = Loader()
+        self.submitted = []
+
+    def submit(self, func, *args):
+        self.submitted.append((func, args))
+
+    def run_submitted(self):
+        for func, args in self.submitted:
+            func(*args)
+        self.submitted = []
+
+    def test_disabled(self):
+        cache = AttributeCache(ttl=0)
+        cache.get('/epc/1', self.load)
+        cache.get('/epc/1', self.load)
+        self.assertEqual(self.load.loads, 2)
+        self.assertEqual(cache.size(), 0)
+
+    def test_served_within_ttl_unless_fresh(self):
+        cache = AttributeCache(ttl=60)
+        self.assertEqual(cache.get('/epc/1', self.load)['loads'], 1)
+        self.assertEqual(cache.get('/epc/1', self.load)['loads'], 1)
+        self.assertEqual(cache.get('/epc/1', self.load, fresh=True)['loads'], 2)
+        self.assertEqual(cache.get('/epc/1', self.load)['loads'], 2)
+
+    def test_stale_served_while_refreshing(self):
+        cache = AttributeCache(ttl=0.01, stale=60)
+        cache.get('/epc/1', self.load, self.submit)
+        time.sleep(0.02)
+        self.assertEqual(cache.get('/epc/1', self.load, self.submit)['loads'], 1)
+        self.assertEqual(cache.get('/epc/1', self.load, self.submit)['loads'], 1)
+        # one refresh at a time
+        self.assertEqual(len(self.submitted), 1)
+        self.run_submitted()
+        self.assertEqual(cache.get('/epc/1', self.load, self.submit)['loads'], 2)
+
+    def test_expired_is_loaded(self):
+        cache = AttributeCache(ttl=0.01, stale=0.01)
+        cache.get('/epc/1', self.load, self.submit)
+        time.sleep(0.03)
+        self.assertEqual(cache.get('/epc/1', self.load, self.submit)['loads'], 2)
+        self.assertEqual(self.submitted, [])
+
+    def test_invalidation_discards_refresh_in_flight(self):
+        cache = AttributeCache(ttl=0.01, stale=60)
+        cache.get('/epc/1', self.load, self.submit)
+        time.sleep(0.02)
+        cache.get('/epc/1', self.load, self.submit)
+        cache.invalidate('/epc/1')
+        self.run_submitted()
+        self.assertEqual(cache.size(), 0)
+        self.assertEqual(cache.get('/epc/1', self.load, self.submit)['loads'], 3)
+
+    def test_peek_never_loads(self):
+        cache = AttributeCache(ttl=0.01, stale=0.01)
+        self.assertIsNone(cache.peek('/epc/1'))
+        cache.get('/epc/1', self.load, self.submit)
+        self.assertEqual(cache.peek('/epc/1')['loads'], 1)
+        time.sleep(0.03)
+        self.assertIsNone(cache.peek('/epc/1'))
+        cache.get('/epc/1', self.load, self.submit)
+        cache.invalidate('/epc/1')
+        self.assertIsNone(cache.peek('/epc/1'))
+        self.assertEqual(self.load.loads, 2)
+        self.assertEqual(self.submitted, [])
@@ -0,0 +1,56 @@
+# Copyright 2014-2015 Zuercher Hochschule fuer Angewandte Wissenschaften
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+__author__ = 'andy'
+
+import unittest
+
+from sm.callbacks import Callback, authentic, from_attributes, parse_callback
+from sm.poller import ReadinessPoller
+from tests.standin import CallbackReceiver, StandInSO, deploy_latency, serve
+
+
+class TestCallbacks(unittest.TestCase):
+
+    def test_token_is_required(self):
+        self.assertTrue(authentic('a1b2', 'a1b2'))
+        self.assertFalse(authentic('a1b2', 'a1b3'))
+        self.assertFalse(authentic(None, ''))
+        self.assertFalse(authentic('', ''))
+
+    def test_attributes_round_trip(self):
+        callback = from_attributes(Callback('http://sm:8888/callback/epc/1', 'a1b2').attributes())
+        self.assertEqual((callback.url, callback.token), ('http://sm:8888/callback/epc/1', 'a1b2'))
+        self.assertIsNone(from_attributes({'occi.epc.attr_1': 'foo'}))
+        self.assertEqual(parse_callback('mcn.sm.phase="deploy", occi.mcn.stack.state="CREATE_COMPLETE"'),
+                         ('deploy', {'occi.mcn.stack.state': 'CREATE_COMPLETE'}))
+        self.assertRaises(ValueError, parse_callback, 'occi.mcn.stack.state="CREATE_COMPLETE"')
+
+    def test_callback_ends_the_wait(self):
+        poller = ReadinessPoller(workers=2)
+        so = StandInSO(deploy_time=0.1)
+        so_url = serve(so)
+        receiver = CallbackReceiver(poller)
+        sm_url = serve(receiver)
+
+        # without the callback the deploy would be noticed a minute later
+        latency = deploy_latency(so, so_url, poller, 60, '/epc/1', receiver.offer(sm_url, '/epc/1'))
+        self.assertLess(latency, 5)
+
+    def test_callback_with_another_token_is_refused(self):
+        receiver = CallbackReceiver(ReadinessPoller(workers=1))
+        sm_url = serve(receiver)
+        receiver.offer(sm_url, '/epc/2')
+        self.assertFalse(Callback(sm_url + '/callback/epc/2', 'a1b2', timeout=1).emit('deploy'))
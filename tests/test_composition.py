@@ -0,0 +1,111 @@
+# Copyright 2014-2015 Zuercher Hochschule fuer Angewandte Wissenschaften
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+__author__ = 'andy'
+
+from Queue import Queue
+import threading
+import time
+import unittest
+
+from sm.poller import ReadinessPoller
+from sm.so.composition import CompositionState
+
+
+class Instances(object):
+    # answers a fetch after delay seconds
+
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.fetched = []
+        self.lock = threading.Lock()
+
+    def __call__(self, location):
+        with self.lock:
+            self.fetched.append(location)
+        time.sleep(self.delay)
+        if location.endswith('/broken'):
+            raise RuntimeError('Could not fetch ' + location)
+        return {'mcn.endpoint': location, 'mcn.fetched': 'yes'}
+
+
+def gather(state, wanted, fetch, submit=None):
+    finished = Queue()
+    state.gather(wanted, fetch, lambda attributes, error: finished.put((attributes, error)), submit=submit)
+    return finished.get(timeout=5)
+
+
+class TestCompositionState(unittest.TestCase):
+
+    def setUp(self):
+        self.state = CompositionState()
+        self.poller = ReadinessPoller(workers=4)
+
+    def test_recorded_attributes_are_not_fetched(self):
+        instances = Instances()
+        self.state.record('maas', '/maas/1', {'mcn.endpoint': '10.0.0.1'})
+        attributes, error = gather(self.state, {'maas': ['mcn.endpoint']}, instances)
+        self.assertIsNone(error)
+        self.assertEqual(attributes, {'maas': {'mcn.endpoint': '10.0.0.1'}})
+        self.assertEqual(instances.fetched, [])
+
+    def test_stale_and_incomplete_attributes_are_fetched_concurrently(self):
+        instances = Instances(delay=0.2)
+        self.state.record('maas', '/maas/1', {'mcn.endpoint': '10.0.0.1'})
+        self.state.record('dns', '/dns/1', {'mcn.endpoint': '10.0.0.2'})
+        self.state.record('ran', '/ran/1', None)
+        self.state.record('epc', '/epc/1', {'mcn.endpoint': '10.0.0.4'})
+        self.state.invalidate('dns')
+        started = time.time()
+        attributes, error = gather(self.state, {'maas': ['mcn.fetched'], 'dns': ['mcn.endpoint'],
+                                                'ran': ['mcn.endpoint'], 'epc': ['mcn.endpoint']},
+                                   instances, submit=self.poller.submit)
+        self.assertLess(time.time() - started, 0.5)
+        self.assertIsNone(error)
+        self.assertEqual(sorted(instances.fetched), ['/dns/1', '/maas/1', '/ran/1'])
+        self.assertEqual(attributes['epc'], {'mcn.endpoint': '10.0.0.4'})
+        self.assertEqual(attributes['dns'], {'mcn.endpoint': '/dns/1', 'mcn.fetched': 'yes'})
+
+        # what was fetched is recorded
+        gather(self.state, {'dns': ['mcn.fetched']}, instances)
+        self.assertEqual(len(instances.fetched), 3)
+
+    def test_instance_is_fetched_once_for_all_consumers(self):
+        instances = Instances(delay=0.2)
+        self.state.record('maas', '/maas/1', {'mcn.endpoint': '10.0.0.1'})
+        self.state.invalidate('maas')
+        finished = Queue()
+        for _ in range(3):
+            self.state.gather({'maas': ['mcn.endpoint']}, instances,
+                              lambda attributes, error: finished.put(attributes), submit=self.poller.submit)
+        for _ in range(3):
+            self.assertEqual(finished.get(timeout=5)['maas']['mcn.fetched'], 'yes')
+        self.assertEqual(instances.fetched, ['/maas/1'])
+
+    def test_first_error_is_reported_once_all_fetches_finished(self):
+        instances = Instances(delay=0.1)
+        self.state.record('maas', '/maas/1', None)
+        self.state.record('dns', '/dns/broken', None)
+        attributes, error = gather(self.state, {'maas': [], 'dns': []}, instances, submit=self.poller.submit)
+        self.assertIsNone(attributes)
+        self.assertIsInstance(error, RuntimeError)
+        self.assertEqual(len(instances.fetched), 2)
+        # the instance that could be fetched is not fetched again
+        gather(self.state, {'maas': []}, instances)
+        self.assertEqual(len(instances.fetched), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
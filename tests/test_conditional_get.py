@@ -0,0 +1,70 @@
+# Copyright 2014-2015 Zuercher Hochschule fuer Angewandte Wissenschaften
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+__author__ = 'andy'
+
+import unittest
+
+from mock import Mock, patch
+from occi.core_model import Kind, Resource
+
+from sm import service
+from sm.cache import AttributeCache
+
+KIND = Kind('http://schemas.mobile-cloud-networking.eu/occi/sm#', 'epc', location='/epc/')
+
+
+class TestConditionalGet(unittest.TestCase):
+
+    def setUp(self):
+        self.app = service.MApplication()
+        self.entity = Resource('/epc/1', KIND, [])
+        self.entity.extras = {'tenant_name': 'edmo'}
+        self.entity.attributes['mcn.service.state'] = 'provision'
+        self.app.registry.add_resource('/epc/1', self.entity, None)
+        self.extras = {'tenant_name': 'edmo', 'cache_control': ' '}
+        self.cache = AttributeCache(ttl=60)
+        patchers = [patch.object(service, 'ATTRIBUTES', self.cache),
+                    patch.object(service.MApplication, '_call_occi')]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def get(self, if_none_match):
+        response = Mock()
+        environ = {'PATH_INFO': '/epc/1', 'REQUEST_METHOD': 'GET', 'HTTP_IF_NONE_MATCH': if_none_match}
+        self.app._call_get(environ, response, **self.extras)
+        return response
+
+    def test_not_modified_without_asking_the_so(self):
+        etag = self.app.versions.etag('/epc/1', self.entity)
+        so = Mock(return_value={'mcn.service.state': 'provision'})
+        self.cache.get('/epc/1', so)
+        response = self.get(etag)
+        response.assert_called_once_with('304 Not Modified', [('ETag', etag)])
+        self.assertFalse(self.app._call_occi.called)
+        # neither loaded nor refreshed by the conditional GET
+        self.assertEqual(so.call_count, 1)
+
+    def test_changed_attributes_are_rendered(self):
+        etag = self.app.versions.etag('/epc/1', self.entity)
+        self.cache.get('/epc/1', lambda: {'mcn.service.state': 'active'})
+        self.get(etag)
+        self.assertTrue(self.app._call_occi.called)
+        self.assertEqual(self.entity.attributes['mcn.service.state'], 'active')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+# Copyright 2014-2015 Zuercher Hochschule fuer Angewandte Wissenschaften
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+__author__ = 'andy'
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from sm.poller import ReadinessPoller
+from sm.so.endpoints import EndpointCatalogue
+
+SCHEME = 'http://schemas.mobile-cloud-networking.eu/occi/sm#'
+TYPES = [SCHEME + name for name in ('cdn', 'maas', 'rcb', 'dnsaas', 'ran', 'dss', 'ims', 'epc')]
+
+
+class Keystone(object):
+    # answers a lookup after delay seconds
+
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.lookups = []
+        self.lock = threading.Lock()
+
+    def __call__(self, svc_type):
+        with self.lock:
+            self.lookups.append(svc_type)
+        time.sleep(self.delay)
+        if svc_type.endswith('#unknown'):
+            return None
+        return 'http://sm.example.com/' + svc_type.split('#')[1] + '/'
+
+
+class TestEndpointCatalogue(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_lookups_are_concurrent(self):
+        keystone = Keystone(delay=0.2)
+        started = time.time()
+        endpoints = EndpointCatalogue().resolve(TYPES, keystone, submit=ReadinessPoller(workers=8).submit)
+        # one after the other these would take 1.6s
+        self.assertLess(time.time() - started, 1)
+        self.assertEqual(endpoints[SCHEME + 'maas'], 'http://sm.example.com/maas/')
+        self.assertEqual(sorted(keystone.lookups), sorted(TYPES))
+
+    def test_resolved_endpoints_are_kept(self):
+        keystone = Keystone()
+        catalogue = EndpointCatalogue(ttl=60)
+        catalogue.resolve(TYPES, keystone)
+        endpoints = catalogue.resolve(TYPES + [SCHEME + 'unknown'], keystone)
+        self.assertEqual(sorted(keystone.lookups), sorted(TYPES + [SCHEME + 'unknown']))
+        self.assertIsNone(endpoints[SCHEME + 'unknown'])
+
+        catalogue.ttl = 0
+        time.sleep(0.01)
+        catalogue.resolve([SCHEME + 'epc'], keystone)
+        self.assertEqual(keystone.lookups[-1], SCHEME + 'epc')
+
+    def test_endpoints_survive_restarts(self):
+        path = os.path.join(self.dir, 'endpoints.json')
+        EndpointCatalogue(path=path).resolve(TYPES, Keystone())
+        self.assertEqual(len(json.load(open(path))), len(TYPES))
+
+        keystone = Keystone()
+        endpoints = EndpointCatalogue(path=path).resolve(TYPES, keystone)
+        self.assertEqual(keystone.lookups, [])
+        self.assertEqual(endpoints[SCHEME + 'epc'], 'http://sm.example.com/epc/')
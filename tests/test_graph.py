@@ -0,0 +1,188 @@
+# Copyright 2014-2015 Zuercher Hochschule fuer Angewandte Wissenschaften
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+__author__ = 'andy'
+
+import json
+import os
+import threading
+import time
+import unittest
+
+from sm.poller import ReadinessPoller
+from sm.so.graph import CycleError, ServiceGraph, in_background, instance_name, run_graph, teardown
+
+SCHEME = 'http://schemas.mobile-cloud-networking.eu/occi/sm#'
+MANIFEST = os.path.join(os.path.dirname(__file__), '..', 'example', 'all_service_manifest.json')
+
+
+def depends_on():
+    with open(MANIFEST) as manifest:
+        return json.load(manifest)['depends_on']
+
+
+class TimedPhases(object):
+    """
+    Deploys and provisions instances of service types taking the given number of seconds.
+    """
+
+    def __init__(self, deploy_times, provision_times):
+        self.deploy_times = deploy_times
+        self.provision_times = provision_times
+        self.finished = {}
+        self.lock = threading.Lock()
+
+    def deploy(self, svc_type):
+        time.sleep(self.deploy_times.get(svc_type.split('#')[1], 0.05))
+        self.__finish('deploy', svc_type)
+
+    def provision(self, svc_type):
+        time.sleep(self.provision_times.get(svc_type.split('#')[1], 0.05))
+        self.__finish('provision', svc_type)
+
+    def __finish(self, stage, svc_type):
+        with self.lock:
+            self.finished[(stage, svc_type.split('#')[1])] = time.time()
+
+
+def run_in_phases(graph, sm, submit):
+    # as before: all services are deployed, only then all of them are provisioned
+    def all_of(func, svc_types):
+        done = threading.Semaphore(0)
+        for svc_type in svc_types:
+            submit(lambda s: (func(s), done.release()), svc_type)
+        for _ in svc_types:
+            done.acquire()
+
+    all_of(sm.deploy, graph.services)
+    all_of(sm.provision, [svc_type for svc_type in graph.services if len(graph.inputs[svc_type]) > 0])
+
+
+class TestServiceGraph(unittest.TestCase):
+
+    def test_levels(self):
+        graph = ServiceGraph(depends_on())
+        self.assertEqual([[svc_type.split('#')[1] for svc_type in level] for level in graph.levels],
+                         [['cdn', 'maas', 'rcb'], ['dnsaas', 'ran'], ['dss', 'ims', 'epc']])
+        self.assertEqual(graph.producers[SCHEME + 'ran'], set([SCHEME + 'maas']))
+        self.assertEqual(graph.inputs[SCHEME + 'epc'][0], (SCHEME + 'maas', 'mcn.endpoint.maas'))
+
+    def test_cycles_are_refused(self):
+        cyclic = depends_on() + [{SCHEME + 'a': {'inputs': [SCHEME + 'b#x']}},
+                                 {SCHEME + 'b': {'inputs': [SCHEME + 'a#y', SCHEME + 'maas#z']}}]
+        self.assertRaises(CycleError, ServiceGraph, cyclic)
+        self.assertRaises(ValueError, ServiceGraph, [{SCHEME + 'a': {'inputs': [SCHEME + 'unknown#x']}}])
+
+    def test_instances(self):
+        graph = ServiceGraph([
+            {SCHEME + 'maas': {'inputs': [], 'instances': 2}},
+            {SCHEME + 'ran': {'inputs': [SCHEME + 'maas#mcn.endpoint.maas'], 'instances': 3}},
+            {SCHEME + 'dnsaas': {'inputs': [SCHEME + 'maas[1]#mcn.endpoint.maas']}},
+            {SCHEME + 'dnsaas': {'inputs': [SCHEME + 'ran[2]#mcn.endpoint.enodeb']}}])
+        self.assertEqual(graph.service_types, (SCHEME + 'maas', SCHEME + 'ran', SCHEME + 'dnsaas'))
+        self.assertEqual(len(graph.services), 7)
+        self.assertEqual(graph.types[SCHEME + 'ran[2]'], SCHEME + 'ran')
+        # instance k of a consumer takes its inputs from instance k mod n of the producer
+        self.assertEqual([graph.bindings[(instance_name(SCHEME + 'ran', k), 'mcn.endpoint.maas')][0] for k in range(3)],
+                         [SCHEME + 'maas', SCHEME + 'maas[1]', SCHEME + 'maas'])
+        self.assertEqual(graph.producers[SCHEME + 'dnsaas'], set([SCHEME + 'maas[1]']))
+        self.assertEqual(graph.producers[SCHEME + 'dnsaas[1]'], set([SCHEME + 'ran[2]']))
+        self.assertEqual(len(graph.levels), 3)
+        # the first instance keeps its name when instances are added
+        self.assertEqual(ServiceGraph([{SCHEME + 'maas': {'inputs': []}}]).services, (SCHEME + 'maas',))
+        self.assertEqual(graph.bindings[(SCHEME + 'ran', 'mcn.endpoint.maas')][0], SCHEME + 'maas')
+
+        self.assertRaises(ValueError, ServiceGraph, [{SCHEME + 'maas': {'inputs': []}},
+                                                     {SCHEME + 'ran': {'inputs': [SCHEME + 'maas[1]#x']}}])
+        self.assertRaises(ValueError, ServiceGraph, [{SCHEME + 'maas': {'inputs': [], 'instances': 0}}])
+
+    def test_shared(self):
+        graph = ServiceGraph([{SCHEME + 'maas': {'inputs': [], 'shared': True}},
+                              {SCHEME + 'ran': {'inputs': [SCHEME + 'maas#mcn.endpoint.maas']}}])
+        self.assertEqual(graph.shared, set([SCHEME + 'maas']))
+        # a shared instance is not provisioned for one composition
+        self.assertRaises(ValueError, ServiceGraph, [{SCHEME + 'maas': {'inputs': []}},
+                                                     {SCHEME + 'ran': {'inputs': [SCHEME + 'maas#x'], 'shared': True}}])
+
+    def test_makespan(self):
+        # a slow ran provisioning does not wait for the slow epc deployment and the other way round
+        deploy_times = {'epc': 0.4}
+        provision_times = {'ran': 0.4}
+        graph = ServiceGraph(depends_on())
+        submit = ReadinessPoller(workers=len(graph.services)).submit
+
+        sm = TimedPhases(deploy_times, provision_times)
+        started = time.time()
+        run_in_phases(graph, sm, submit)
+        phased = time.time() - started
+
+        sm = TimedPhases(deploy_times, provision_times)
+        started = time.time()
+        run_graph(graph, in_background(sm.deploy, submit), in_background(sm.provision, submit))
+        makespan = time.time() - started
+
+        self.assertLess(makespan, phased - 0.2)
+        # consumers are provisioned after their producers are ready only
+        self.assertGreater(sm.finished[('provision', 'dss')], sm.finished[('provision', 'dnsaas')])
+        self.assertLess(sm.finished[('provision', 'ran')], sm.finished[('deploy', 'epc')] + 0.1)
+        self.assertNotIn(('provision', 'maas'), sm.finished)
+
+    def test_failure_stops_the_graph(self):
+        graph = ServiceGraph(depends_on())
+        sm = TimedPhases({}, {})
+
+        def provision(svc_type):
+            if svc_type.endswith('#dnsaas'):
+                raise RuntimeError('Deployment of stack failed.')
+            sm.provision(svc_type)
+
+        submit = ReadinessPoller(workers=8).submit
+        self.assertRaises(RuntimeError, run_graph, graph, in_background(sm.deploy, submit),
+                          in_background(provision, submit))
+        self.assertNotIn(('provision', 'epc'), sm.finished)
+
+    def test_deployed_services_are_provisioned_only(self):
+        # an update keeping all services but epc
+        graph = ServiceGraph(depends_on())
+        sm = TimedPhases({}, {})
+        submit = ReadinessPoller(workers=8).submit
+        kept = [svc_type for svc_type in graph.services if not svc_type.endswith('#epc')]
+        run_graph(graph, in_background(sm.deploy, submit), in_background(sm.provision, submit), deployed=kept)
+        self.assertEqual([svc_type for stage, svc_type in sm.finished if stage == 'deploy'], ['epc'])
+        self.assertEqual(sorted(svc_type for stage, svc_type in sm.finished if stage == 'provision'),
+                         ['dnsaas', 'dss', 'epc', 'ims', 'ran'])
+
+    def test_teardown(self):
+        graph = ServiceGraph(depends_on())
+        destroyed = []
+        lock = threading.Lock()
+
+        def destroy(svc_type):
+            time.sleep(0.1)
+            if svc_type.endswith('#dnsaas'):
+                raise RuntimeError('500 Server Error')
+            with lock:
+                destroyed.append(svc_type.split('#')[1])
+
+        started = time.time()
+        failures = teardown(graph.levels, destroy, ReadinessPoller(workers=8).submit)
+        # one level after the other, the services of a level concurrently
+        self.assertLess(time.time() - started, 0.1 * len(graph.levels) + 0.2)
+        self.assertEqual(failures.keys(), [SCHEME + 'dnsaas'])
+        # consumers before producers, a failure does not stop the teardown
+        self.assertEqual(sorted(destroyed[:3]), ['dss', 'epc', 'ims'])
+        self.assertEqual(destroyed[3], 'ran')
+        self.assertEqual(sorted(destroyed[4:]), ['cdn', 'maas', 'rcb'])
+
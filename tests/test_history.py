@@ -0,0 +1,60 @@
+# Copyright 2014-2015 Zuercher Hochschule fuer Angewandte Wissenschaften
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+__author__ = 'andy'
+
+import unittest
+
+from sm.history import PhaseHistory
+
+
+class TestPhaseHistory(unittest.TestCase):
+
+    def setUp(self):
+        self.history = PhaseHistory(size=10, quantile=0.5)
+
+    def test_no_history_checks_immediately(self):
+        self.assertEqual(self.history.expected('epc', 'deploy.done'), 0)
+
+    def test_expected_is_median(self):
+        for seconds in [30.0, 10.0, 20.0]:
+            self.history.record('epc', 'deploy.done', seconds)
+        self.assertEqual(self.history.expected('epc', 'deploy.done'), 20.0)
+        self.assertEqual(self.history.expected('dns', 'deploy.done'), 0)
+
+    def test_only_recent_samples_kept(self):
+        for seconds in range(100):
+            self.history.record('epc', 'activate.ready', float(seconds))
+        summary = self.history.summary()['epc']['activate.ready']
+        self.assertEqual(summary['count'], 10)
+        self.assertEqual(summary['min'], 90.0)
+        self.assertEqual(summary['max'], 99.0)
+
+    def test_expected_comes_down_when_phases_get_faster(self):
+        # checks are issued at the expected time and then with a doubling interval, as in Task.wait
+        def wait(actual):
+            checked, interval = self.history.expected('epc', 'deploy.done'), 1.0
+            missed = 0.0
+            while checked < actual:
+                missed, checked, interval = checked, checked + interval, interval * 2
+            self.history.record_between('epc', 'deploy.done', missed, checked)
+
+        for _ in range(10):
+            wait(10.0)
+        slow = self.history.expected('epc', 'deploy.done')
+        self.assertGreaterEqual(slow, 10.0)
+        for _ in range(10):
+            wait(2.0)
+        self.assertLess(self.history.expected('epc', 'deploy.done'), slow / 2)
@@ -0,0 +1,264 @@
+# Copyright 2014-2015 Zuercher Hochschule fuer Angewandte Wissenschaften
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+__author__ = 'andy'
+
+import os
+import threading
+import time
+import unittest
+
+if 'SM_CONFIG_PATH' not in os.environ:
+    raise AttributeError('Please provide SM_CONFIG_PATH as env var.')
+
+from occi.core_model import Kind, Resource
+
+from sm import backends
+from sm.attributes import parse_attributes
+from sm.managers import generic, so_manager
+from sm.managers.generic import AsychExe, Task
+from sm.managers.pool import WarmPool
+from sm.scheduler import FairScheduler
+
+
+KIND = Kind('http://schemas.mobile-cloud-networking.eu/occi/sm#', 'lifecycle', location='/lifecycle/')
+
+
+class Phase(Task):
+    interval = 0.01
+
+    def __init__(self, entity, state, log, ready=True, block=None):
+        Task.__init__(self, entity, {}, state)
+        self.log = log
+        self.is_ready = ready
+        self.block = block
+        self.checks = 0
+
+    def ready(self):
+        self.checks += 1
+        return self.is_ready
+
+    def run(self):
+        self.log.append(self.state)
+        if self.block is not None:
+            self.block.wait(5)
+        return self.entity, self.extras
+
+
+class Registry(object):
+
+    def __init__(self):
+        self.registry = self  # as the app handed to a ServiceBackend
+        self.added = []
+
+    def add_resource(self, key, resource, extras):
+        self.added.append(key)
+
+
+def wait_for(condition, timeout=5):
+    until = time.time() + timeout
+    while not condition() and time.time() < until:
+        time.sleep(0.01)
+    return condition()
+
+
+def warm_pool(name):
+    # one container of the CC kept ready, which InitSO binds to an instance like one it created
+    pool = WarmPool(lambda bundle, prefix: {'loc': 'http://cc/app/' + name, 'host': name}, lambda container: True,
+                    lambda container: None, size=1, interval=0.01)
+    pool.start(so_manager.bundle_location(), 'lifecycle')
+    wait_for(lambda: pool.stats()['ready'].values() == [1])
+    return pool
+
+
+class TestCancellation(unittest.TestCase):
+
+    def setUp(self):
+        self.entity = Resource('/lifecycle/' + str(id(self)), KIND, [])
+        self.log = []
+        self.registry = Registry()
+
+    def test_chain_runs_to_completion(self):
+        AsychExe([Phase(self.entity, 'deploy', self.log), Phase(self.entity, 'provision', self.log)],
+                 self.registry).start()
+        self.assertTrue(wait_for(lambda: self.entity.identifier not in generic.CHAINS))
+        self.assertEqual(self.log, ['deploy', 'provision'])
+        self.assertEqual(len(self.registry.added), 2)
+
+    def test_task_built_once_the_tasks_before_it_completed(self):
+        built = []
+
+        def build():
+            built.append(list(self.log))
+            return Phase(self.entity, 'activate', self.log)
+
+        AsychExe([Phase(self.entity, 'initialise', self.log), build], self.registry).start()
+        self.assertTrue(wait_for(lambda: self.entity.identifier not in generic.CHAINS))
+        self.assertEqual(built, [['initialise']])
+        self.assertEqual(self.log, ['initialise', 'activate'])
+
+    def test_phases_are_measured(self):
+        failing = Phase(self.entity, 'measured', self.log)
+        failing.run = lambda: 1 / 0
+        in_flight = generic.PHASES_IN_FLIGHT.get(service='lifecycle', phase='measured')
+        failures = generic.PHASE_FAILURES.get(service='lifecycle', phase='measured')
+        count, _ = generic.PHASE_DURATION.get(service='lifecycle', phase='measured')
+
+        Phase(self.entity, 'measured', self.log).execute()
+        self.assertRaises(ZeroDivisionError, failing.execute)
+
+        self.assertEqual(generic.PHASES_IN_FLIGHT.get(service='lifecycle', phase='measured'), in_flight)
+        self.assertEqual(generic.PHASE_FAILURES.get(service='lifecycle', phase='measured'), failures + 1)
+        self.assertEqual(generic.PHASE_DURATION.get(service='lifecycle', phase='measured')[0], count + 1)
+
+    def test_cancel_stops_polling(self):
+        waiting = Phase(self.entity, 'provision', self.log, ready=False)
+        AsychExe([waiting], self.registry).start()
+        self.assertTrue(wait_for(lambda: waiting.checks > 0))
+
+        self.assertTrue(generic.cancel(self.entity.identifier))
+        checks = waiting.checks
+        time.sleep(0.1)
+        self.assertEqual(waiting.checks, checks)
+        self.assertFalse(generic.cancel(self.entity.identifier))
+
+    def test_cancel_during_run_skips_remaining_phases(self):
+        block = threading.Event()
+        AsychExe([Phase(self.entity, 'deploy', self.log, block=block), Phase(self.entity, 'provision', self.log)],
+                 self.registry).start()
+        self.assertTrue(wait_for(lambda: self.log == ['deploy']))
+
+        generic.cancel(self.entity.identifier)
+        block.set()
+        time.sleep(0.1)
+        self.assertEqual(self.log, ['deploy'])
+        self.assertEqual(self.registry.added, [])
+        self.assertEqual(generic.PHASES_IN_FLIGHT.get(service='lifecycle', phase='deploy'), 0)
+
+    def test_cancel_once_init_bound_the_container(self):
+        pool = so_manager.POOL
+        so_manager.POOL = warm_pool('solifecycle2')
+        try:
+            waiting = Phase(self.entity, 'deploy', self.log, ready=False)
+            AsychExe([so_manager.InitSO(self.entity, {'tenant_name': 'edmo'}), waiting], self.registry).start()
+            self.assertTrue(wait_for(lambda: waiting.checks > 0))
+        finally:
+            so_manager.POOL = pool
+        # cancelled by the identifier of the entity as a DELETE finds it
+        self.assertTrue(generic.cancel(self.entity.identifier))
+        self.assertEqual(self.registry.added, [self.entity.identifier])
+
+
+class TestServiceBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.patched = dict((name, getattr(backends, name)) for name in ('SCHEDULER', 'Activate', 'Deploy', 'Destroy'))
+        self.pool = so_manager.POOL
+        self.log = []
+        self.entity = Resource('/lifecycle/' + str(id(self)), KIND, [])
+        self.deploying = Phase(self.entity, 'deploy', self.log, ready=False)
+        backends.SCHEDULER = FairScheduler(slots=1)
+        backends.Activate = lambda entity, extras: Phase(entity, 'activate', self.log)
+        backends.Deploy = lambda entity, extras: self.deploying
+        backends.Destroy = lambda entity, extras: Phase(entity, 'destroy', self.log)
+        so_manager.POOL = warm_pool('solifecycle1')
+
+    def tearDown(self):
+        for name, value in self.patched.items():
+            setattr(backends, name, value)
+        so_manager.POOL = self.pool
+
+    def test_delete_during_deploy_releases_the_slot(self):
+        registry = Registry()
+        backend = backends.ServiceBackend(registry)
+        identifier = self.entity.identifier
+        extras = {'tenant_name': 'edmo', 'token': 'token'}
+        backend.create(self.entity, extras)
+        self.assertTrue(wait_for(lambda: self.deploying.checks > 0))
+        # the instance is still known by the identifier its client was given
+        self.assertEqual(self.entity.identifier, identifier)
+        self.assertEqual(self.entity.extras['app_path'], '/app/solifecycle1')
+        self.assertEqual(set(registry.added), set([identifier]))
+
+        backend.delete(self.entity, extras)
+        self.assertTrue(wait_for(lambda: self.log == ['activate', 'destroy']))
+        self.assertNotIn(identifier, generic.CHAINS)
+        self.assertNotIn(identifier, backends.JOBS)
+        # the only slot is free for the next instance
+        started = threading.Event()
+        backends.SCHEDULER.admit('edmo').run(started.set)
+        self.assertTrue(started.wait(5))
+
+
+class StackStates(object):
+    # the states reported by an SO, one per check of the stack
+
+    def __init__(self, *states):
+        self.states = list(states)
+        self.urls = []
+        self.headers = []
+
+    def __call__(self, method, url, **kwargs):
+        self.urls.append(url)
+        self.headers.append(kwargs.get('headers', {}))
+        state = self.states.pop(0)
+        return type('Response', (object, ), {'content': '{"attributes": {"occi.mcn.stack.state": "' + state + '"}}'})
+
+
+class TestStackChecks(unittest.TestCase):
+
+    def setUp(self):
+        self.request = so_manager.http_retriable_request
+        self.entity = Resource('/lifecycle/1', KIND, [])
+        self.entity.extras = {'ops_version': 'v3', 'loc': 'so.example.com'}
+        self.extras = {'tenant_name': 'edmo', 'token': 'token'}
+
+    def tearDown(self):
+        so_manager.http_retriable_request = self.request
+        so_manager.UpdateSO.interval = Task.interval
+
+    def test_phases_share_the_check(self):
+        so_manager.http_retriable_request = states = StackStates('CREATE_IN_PROGRESS', 'CREATE_COMPLETE',
+                                                                 'UPDATE_COMPLETE')
+        deploy = so_manager.DeploySO(self.entity, self.extras)
+        self.assertFalse(deploy.done())
+        self.assertTrue(deploy.done())
+        self.assertEqual(self.entity.attributes['mcn.service.state'], 'deploy')
+        self.assertTrue(so_manager.ProvisionSO(self.entity, self.extras).ready())
+        self.assertEqual(states.urls, ['http://so.example.com/orchestrator/default'] * 3)
+
+    def test_failed_stack_fails_the_phase(self):
+        so_manager.http_retriable_request = StackStates('CREATE_FAILED', 'UPDATE_FAILED')
+        self.assertRaises(RuntimeError, so_manager.DeploySO(self.entity, self.extras).done)
+        self.assertRaises(RuntimeError, so_manager.deploy_complete, 'http://so.example.com', self.extras)
+
+    def test_update_waits_for_the_stack(self):
+        so_manager.http_retriable_request = states = StackStates('', 'UPDATE_IN_PROGRESS', 'UPDATE_COMPLETE')
+        so_manager.UpdateSO.interval = 0.01
+        registry = Registry()
+        self.entity.extras.update({'tenant_name': 'edmo', 'client_params': {}})
+        new = Resource(self.entity.identifier, KIND, [])
+        new.attributes['mcn.epc.size'] = '2'
+        new.attributes['mcn.epc.name'] = '"core, 2"'
+        backends.ServiceBackend(registry).update(self.entity, new, self.extras)
+        self.assertTrue(wait_for(lambda: self.entity.identifier not in generic.CHAINS))
+        # the POST of the update and a check per state of the stack
+        self.assertEqual(len(states.urls), 3)
+        self.assertEqual(states.states, [])
+        # strings and numbers as the client sent them
+        sent = parse_attributes(states.headers[0]['X-OCCI-Attribute'], typed=True)
+        self.assertEqual((sent['mcn.epc.size'], sent['mcn.epc.name']), (2, 'core, 2'))
+        self.assertEqual(self.entity.attributes['mcn.service.state'], 'update')
+        self.assertEqual(registry.added, [self.entity.identifier])
@@ -0,0 +1,93 @@
+# Copyright 2014-2015 Zuercher Hochschule fuer Angewandte Wissenschaften
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+__author__ = 'andy'
+
+import json
+import unittest
+import uuid
+
+import jsonpickle
+from occi.core_model import Kind, Link, Resource
+from occi.registry import NonePersistentRegistry
+
+from sm.links import compact, link_instances
+
+KIND = Kind('http://schemas.mobile-cloud-networking.eu/occi/sm#', 'composed', location='/composed/')
+ENDPOINTS = ['http://epc.example.com:8888/epc/1', 'http://ims.example.com:8888/ims/2']
+
+
+class TestLinks(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = NonePersistentRegistry()
+        self.entity = Resource('/composed/1', KIND, [])
+        self.registry.add_resource(self.entity.identifier, self.entity, None)
+
+    def test_links_are_constant_across_retrieves(self):
+        self.assertEqual(link_instances(self.registry, self.entity, ENDPOINTS), 2)
+        resources = len(self.registry.resources)
+        for _ in range(10000):
+            link_instances(self.registry, self.entity, ENDPOINTS)
+        self.assertEqual(len(self.entity.links), 2)
+        self.assertEqual(len(self.registry.resources), resources)
+        self.assertEqual(sorted(link.target.attributes['mcn.sm.endpoint'] for link in self.entity.links), ENDPOINTS)
+
+    def test_new_endpoint_is_linked(self):
+        link_instances(self.registry, self.entity, ENDPOINTS[:1])
+        self.assertEqual(link_instances(self.registry, self.entity, ENDPOINTS), 1)
+        self.assertEqual(len(self.entity.links), 2)
+
+    def test_removed_endpoint_is_unlinked(self):
+        link_instances(self.registry, self.entity, ENDPOINTS)
+        self.assertEqual(link_instances(self.registry, self.entity, ENDPOINTS[1:]), 0)
+        self.assertEqual([link.target.attributes['mcn.sm.endpoint'] for link in self.entity.links], ENDPOINTS[1:])
+        self.assertEqual(sorted(self.registry.resources), sorted(['/composed/1', '/ims/2',
+                                                                  self.entity.links[0].identifier]))
+        link_instances(self.registry, self.entity, [])
+        self.assertEqual(self.entity.links, [])
+        self.assertEqual(self.registry.resources.keys(), ['/composed/1'])
+
+    def test_target_linked_by_another_instance_is_kept(self):
+        other = Resource('/composed/2', KIND, [])
+        self.registry.add_resource(other.identifier, other, None)
+        link_instances(self.registry, self.entity, ENDPOINTS)
+        link_instances(self.registry, other, ENDPOINTS[:1])
+        link_instances(self.registry, self.entity, ENDPOINTS[1:])
+        self.assertIn('/epc/1', self.registry.resources)
+        self.assertNotIn('/epc/1', [link.target.identifier for link in self.entity.links])
+        link_instances(self.registry, other, [])
+        self.assertNotIn('/epc/1', self.registry.resources)
+
+    def test_duplicates_are_compacted_on_load(self):
+        # as stored by earlier versions: a link with a random key per retrieve
+        for _ in range(5):
+            for endpoint in ENDPOINTS:
+                target = Resource('/' + '/'.join(endpoint.split('/')[3:5]), Resource.kind, [])
+                target.attributes['mcn.sm.endpoint'] = endpoint
+                self.registry.add_resource(target.identifier, target, None)
+                link = Link('/link/' + str(uuid.uuid4()), Link.kind, [], self.entity, target)
+                self.registry.add_resource(link.identifier, link, None)
+                self.entity.links.append(link)
+        resources = jsonpickle.decode(json.dumps(json.loads(jsonpickle.encode(self.registry.resources))))
+
+        self.assertEqual(compact(resources), 8)
+
+        entity = resources['/composed/1']
+        self.assertEqual(len(entity.links), 2)
+        self.assertEqual(len([item for item in resources.values() if isinstance(item, Link)]), 2)
+        self.registry.resources = resources
+        self.assertEqual(link_instances(self.registry, entity, ENDPOINTS), 0)
+        self.assertEqual(compact(resources), 0)
@@ -0,0 +1,67 @@
+# Copyright 2014-2015 Zuercher Hochschule fuer Angewandte Wissenschaften
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+__author__ = 'andy'
+
+import unittest
+
+from sm.metrics import MetricsRegistry
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_counter_and_gauge(self):
+        failures = self.registry.counter('sm_failures_total', 'Failures.', ['phase'])
+        failures.inc(phase='deploy')
+        failures.inc(2, phase='deploy')
+        in_flight = self.registry.gauge('sm_in_flight', 'In flight.')
+        in_flight.inc()
+        in_flight.dec()
+        in_flight.inc()
+
+        self.assertEqual(failures.get(phase='deploy'), 3)
+        self.assertEqual(self.registry.exposition(),
+                         '# HELP sm_failures_total Failures.\n'
+                         '# TYPE sm_failures_total counter\n'
+                         'sm_failures_total{phase="deploy"} 3.0\n'
+                         '# HELP sm_in_flight In flight.\n'
+                         '# TYPE sm_in_flight gauge\n'
+                         'sm_in_flight 1.0\n')
+
+    def test_histogram_buckets_are_cumulative(self):
+        duration = self.registry.histogram('sm_duration_seconds', 'Duration.', ['phase'], buckets=[1, 10])
+        for value in [0.5, 1, 5, 50]:
+            duration.observe(value, phase='provision')
+
+        self.assertEqual(duration.get(phase='provision'), (4, 56.5))
+        lines = self.registry.exposition().splitlines()
+        self.assertEqual(lines[2:], ['sm_duration_seconds_bucket{phase="provision",le="1.0"} 2',
+                                     'sm_duration_seconds_bucket{phase="provision",le="10.0"} 3',
+                                     'sm_duration_seconds_bucket{phase="provision",le="+Inf"} 4',
+                                     'sm_duration_seconds_sum{phase="provision"} 56.5',
+                                     'sm_duration_seconds_count{phase="provision"} 4'])
+
+    def test_same_metric_returned_once_registered(self):
+        counter = self.registry.counter('sm_total', 'Total.', ['phase'])
+        self.assertIs(self.registry.counter('sm_total', 'Total.', ['phase']), counter)
+        self.assertRaises(ValueError, self.registry.gauge, 'sm_total', 'Total.', ['phase'])
+        self.assertRaises(ValueError, counter.inc)
+
+    def test_label_values_are_escaped(self):
+        self.registry.counter('sm_total', 'Total.', ['tenant']).inc(tenant='a"b')
+        self.assertIn('sm_total{tenant="a\\"b"} 1.0', self.registry.exposition())
@@ -0,0 +1,84 @@
+# Copyright 2014-2015 Zuercher Hochschule fuer Angewandte Wissenschaften
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+__author__ = 'andy'
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from sm.so.plan import ExecutionPlan, PlanCache
+
+SCHEME = 'http://schemas.mobile-cloud-networking.eu/occi/sm#'
+EXAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'example', 'all_service_manifest.json')
+
+
+class TestExecutionPlan(unittest.TestCase):
+
+    def setUp(self):
+        with open(EXAMPLE) as example:
+            self.manifest = json.load(example)
+
+    def test_binding_table(self):
+        plan = ExecutionPlan(self.manifest)
+        self.assertEqual(len(plan.services), len(self.manifest['depends_on']))
+        self.assertEqual(plan.binding(SCHEME + 'dss', 'mcn.endpoint.api'), (SCHEME + 'dnsaas', 'mcn.endpoint.api'))
+        self.assertRaises(KeyError, plan.binding, SCHEME + 'maas', 'mcn.endpoint.api')
+        self.assertEqual([producer for producer, _ in plan.inputs(SCHEME + 'ran')], [SCHEME + 'maas'])
+        self.assertIn(SCHEME + 'maas', plan.levels[0])
+
+        depends_on = plan.depends_on(dict((svc_type, 'http://sm/' + svc_type) for svc_type in plan.services))
+        self.assertEqual(depends_on[0].values()[0]['endpoint'], 'http://sm/' + plan.services[0])
+
+    def test_invalid_manifests(self):
+        self.assertRaises(ValueError, ExecutionPlan, {'depends_on': []})
+        self.assertRaises(ValueError, ExecutionPlan, {'service_type': SCHEME + 'e2e', 'depends_on': [SCHEME + 'a']})
+        conflicting = {'service_type': SCHEME + 'e2e', 'depends_on': [
+            {SCHEME + 'a': {'inputs': []}},
+            {SCHEME + 'b': {'inputs': []}},
+            {SCHEME + 'c': {'inputs': [SCHEME + 'a#mcn.endpoint', SCHEME + 'b#mcn.endpoint']}}]}
+        self.assertRaises(ValueError, ExecutionPlan, conflicting)
+
+
+class TestPlanCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'service_manifest.json')
+        shutil.copy(EXAMPLE, self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_compiled_once_until_changed(self):
+        plans = PlanCache()
+        plan = plans.load(self.path)
+        self.assertIs(plans.load(self.path), plan)
+
+        with open(self.path) as stored:
+            manifest = json.load(stored)
+        manifest['depends_on'] = manifest['depends_on'][:3]
+        with open(self.path, 'w') as stored:
+            json.dump(manifest, stored)
+        os.utime(self.path, (0, 0))
+        changed = plans.load(self.path)
+        self.assertIsNot(changed, plan)
+        self.assertEqual(len(changed.services), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
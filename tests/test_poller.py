@@ -0,0 +1,113 @@
+# Copyright 2014-2015 Zuercher Hochschule fuer Angewandte Wissenschaften
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+__author__ = 'andy'
+
+import threading
+import time
+import unittest
+
+from sm.poller import ReadinessPoller
+
+
+class Countdown(object):
+
+    def __init__(self, polls):
+        self.polls = polls
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.calls >= self.polls
+
+
+class TestReadinessPoller(unittest.TestCase):
+
+    def setUp(self):
+        self.poller = ReadinessPoller(workers=2)
+
+    def test_on_ready_after_condition_met(self):
+        done = threading.Event()
+        check = Countdown(3)
+        self.poller.watch(check, on_ready=done.set, interval=0.01)
+        self.assertTrue(done.wait(5))
+        self.assertEqual(check.calls, 3)
+
+    def test_on_error_stops_polling(self):
+        errors = []
+        failed = threading.Event()
+
+        def check():
+            raise RuntimeError('Heat stack creation failed.')
+
+        def on_error(e):
+            errors.append(e)
+            failed.set()
+
+        self.poller.watch(check, on_error=on_error, interval=0.01)
+        self.assertTrue(failed.wait(5))
+        self.assertIsInstance(errors[0], RuntimeError)
+        self.assertEqual(self.poller.pending(), 0)
+
+    def test_cancel_by_key(self):
+        ready = threading.Event()
+        watch = self.poller.watch(lambda: False, on_ready=ready.set, interval=0.01, key='/test/1')
+        self.assertEqual(self.poller.cancel('/test/1'), 1)
+        self.assertTrue(watch.cancelled)
+        self.assertFalse(ready.wait(0.2))
+        self.assertEqual(self.poller.cancel('/test/1'), 0)
+
+    def test_many_watches_use_fixed_threads(self):
+        count = 1000
+        lock = threading.Lock()
+        finished = []
+        all_done = threading.Event()
+
+        def on_ready():
+            with lock:
+                finished.append(True)
+                if len(finished) == count:
+                    all_done.set()
+
+        before = threading.active_count()
+        for _ in range(count):
+            self.poller.watch(Countdown(2), on_ready=on_ready, interval=0.01)
+        # one timer thread and two workers, regardless of the number of watches
+        self.assertEqual(threading.active_count() - before, 3)
+        self.assertTrue(all_done.wait(10))
+
+    def test_submit(self):
+        done = threading.Event()
+        self.poller.submit(done.set)
+        self.assertTrue(done.wait(5))
+
+    def test_backoff_is_capped(self):
+        watch = self.poller.watch(lambda: False, interval=1, delay=60, backoff=2, max_interval=5)
+        self.assertEqual([watch.next_interval() for _ in range(5)], [1, 2, 4, 5, 5])
+        watch.cancel()
+
+    def test_poke_issues_check_right_away(self):
+        ready = threading.Event()
+        check = Countdown(2)
+        self.poller.watch(check, on_ready=ready.set, interval=60, delay=60, key='/test/2')
+        self.assertEqual(self.poller.poke('/test/2'), 1)
+        while check.calls == 0:
+            time.sleep(0.01)
+        # poked while in flight or pending again, the failed check is repeated without waiting for the interval
+        self.assertEqual(self.poller.poke('/test/2'), 1)
+        self.assertTrue(ready.wait(5))
+        self.assertEqual(check.calls, 2)
+        self.assertEqual(self.poller.pending(), 0)
+        self.assertEqual(self.poller.poke('/test/2'), 0)
@@ -0,0 +1,142 @@
+# Copyright 2014-2015 Zuercher Hochschule fuer Angewandte Wissenschaften
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+__author__ = 'andy'
+
+import os
+import time
+import unittest
+
+if 'SM_CONFIG_PATH' not in os.environ:
+    raise AttributeError('Please provide SM_CONFIG_PATH as env var.')
+
+from sm.managers import pool as warm_pool
+from sm.managers.pool import WarmPool
+
+
+class FakeCC(object):
+
+    def __init__(self):
+        self.created = 0
+        self.destroyed = []
+        self.gone = set()  # hosts of the containers that went away
+        self.tagged = []
+
+    def create(self, bundle, prefix):
+        self.created += 1
+        return {'loc': 'http://cc/app/so' + prefix + str(self.created), 'host': 'so' + str(self.created)}
+
+    def ready(self, container):
+        if container['host'] in self.gone:
+            raise RuntimeError('503 Service Unavailable')
+        return True
+
+    def tag(self, container, tenant):
+        if tenant == 'unknown':
+            raise RuntimeError('404 Not Found')
+        self.tagged.append((container['host'], tenant))
+
+    def destroy(self, container):
+        self.destroyed.append(container)
+
+
+def wait_for(condition, timeout=5):
+    until = time.time() + timeout
+    while not condition() and time.time() < until:
+        time.sleep(0.01)
+    return condition()
+
+
+class TestWarmPool(unittest.TestCase):
+
+    def setUp(self):
+        self.cc = FakeCC()
+
+    def test_disabled_pool_hands_out_nothing(self):
+        pool = WarmPool(self.cc.create, self.cc.ready, self.cc.destroy, size=0)
+        pool.start('bundle', 'test')
+        self.assertIsNone(pool.acquire('bundle'))
+        self.assertEqual(self.cc.created, 0)
+
+    def test_acquire_and_refill(self):
+        pool = WarmPool(self.cc.create, self.cc.ready, self.cc.destroy, size=2, max_size=2, interval=0.01)
+        pool.start('bundle', 'test')
+        self.assertTrue(wait_for(lambda: pool.stats()['ready']['bundle'] == 2))
+
+        container = pool.acquire('bundle')
+        self.assertEqual(container['host'], 'so1')
+        self.assertTrue(wait_for(lambda: pool.stats()['ready']['bundle'] == 2))
+        self.assertEqual(self.cc.created, 3)
+
+        stats = pool.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['hit_rate'], 1.0)
+        self.assertEqual(stats['refills'], 3)
+
+    def test_miss_on_unknown_bundle(self):
+        pool = WarmPool(self.cc.create, self.cc.ready, self.cc.destroy, size=1)
+        self.assertIsNone(pool.acquire('other'))
+        self.assertEqual(pool.stats()['misses'], 1)
+
+    def test_size_bounded_by_max_size(self):
+        pool = WarmPool(self.cc.create, self.cc.ready, self.cc.destroy, size=5, max_size=2, interval=0.01)
+        pool.start('bundle', 'test')
+        self.assertTrue(wait_for(lambda: pool.stats()['ready']['bundle'] == 2))
+        self.assertEqual(self.cc.created, 2)
+
+    def test_idle_containers_expire(self):
+        pool = WarmPool(self.cc.create, self.cc.ready, self.cc.destroy, size=1, idle_expiry=0.05, interval=0.01)
+        pool.start('bundle', 'test')
+        self.assertTrue(wait_for(lambda: len(self.cc.destroyed) >= 1))
+        self.assertTrue(wait_for(lambda: pool.stats()['ready']['bundle'] == 1))
+
+    def test_stale_container_is_not_handed_out(self):
+        stale = warm_pool.POOL_STALE.get(bundle='stale')
+        pool = WarmPool(self.cc.create, self.cc.ready, self.cc.destroy, size=2, interval=0.01)
+        pool.start('stale', 'test')
+        self.assertTrue(wait_for(lambda: pool.stats()['ready']['stale'] == 2))
+        self.cc.gone.add('so1')
+        self.assertEqual(pool.acquire('stale')['host'], 'so2')
+        self.assertTrue(wait_for(lambda: len(self.cc.destroyed) == 1))
+        self.assertEqual(self.cc.destroyed[0]['host'], 'so1')
+        self.assertEqual(warm_pool.POOL_STALE.get(bundle='stale'), stale + 1)
+
+    def test_container_is_tagged_with_its_tenant(self):
+        pool = WarmPool(self.cc.create, self.cc.ready, self.cc.destroy, size=1, interval=0.01, tag=self.cc.tag)
+        pool.start('bundle', 'test')
+        self.assertTrue(wait_for(lambda: pool.stats()['ready']['bundle'] == 1))
+        self.assertEqual(pool.acquire('bundle', 'acme')['host'], 'so1')
+        self.assertEqual(self.cc.tagged, [('so1', 'acme')])
+        # a container that cannot be tagged is not handed out
+        self.assertTrue(wait_for(lambda: pool.stats()['ready']['bundle'] == 1))
+        self.assertIsNone(pool.acquire('bundle', 'unknown'))
+        self.assertTrue(wait_for(lambda: len(self.cc.destroyed) == 1))
+
+    def test_metrics(self):
+        hits = warm_pool.POOL_HITS.get(bundle='metered')
+        misses = warm_pool.POOL_MISSES.get(bundle='metered')
+        refills, _ = warm_pool.POOL_REFILL.get(bundle='metered')
+        pool = WarmPool(self.cc.create, self.cc.ready, self.cc.destroy, size=1, max_size=1, interval=0.01)
+        pool.start('metered', 'test')
+        self.assertTrue(wait_for(lambda: warm_pool.POOL_READY.get(bundle='metered') == 1))
+        # the container replacing the one handed out fails
+        self.cc.gone.add('so2')
+        self.assertEqual(pool.acquire('metered')['host'], 'so1')
+        self.assertIsNone(pool.acquire('metered'))
+        self.assertEqual(warm_pool.POOL_HITS.get(bundle='metered'), hits + 1)
+        self.assertEqual(warm_pool.POOL_MISSES.get(bundle='metered'), misses + 1)
+        self.assertEqual(warm_pool.POOL_REFILL.get(bundle='metered')[0], refills + 1)
+        self.assertEqual(warm_pool.POOL_READY.get(bundle='metered'), 0)
+        self.assertTrue(wait_for(lambda: warm_pool.POOL_PENDING.get(bundle='metered') == 0))
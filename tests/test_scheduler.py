@@ -0,0 +1,139 @@
+# Copyright 2014-2015 Zuercher Hochschule fuer Angewandte Wissenschaften
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+__author__ = 'andy'
+
+import threading
+import time
+import unittest
+
+from sm.scheduler import FairScheduler, QuotaExceeded
+
+
+class TestFairScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.started = []
+
+    def submit(self, scheduler, tenant, name):
+        job = scheduler.admit(tenant)
+        job.run(lambda: self.started.append((name, job)))
+        return job
+
+    def test_tenants_take_turns(self):
+        scheduler = FairScheduler(slots=1)
+        for i in range(4):
+            self.submit(scheduler, 'bulk', 'bulk' + str(i))
+        self.submit(scheduler, 'other', 'other0')
+
+        while len(self.started) < 5:
+            self.started[-1][1].release()
+        # the other tenant's create does not wait for the whole bulk onboarding
+        self.assertEqual([name for name, _ in self.started], ['bulk0', 'bulk1', 'other0', 'bulk2', 'bulk3'])
+        self.assertEqual(scheduler.stats()['bulk']['admitted'], 4)
+
+    def test_weights(self):
+        scheduler = FairScheduler(slots=1, overrides={'Gold': {'weight': 2}})
+        self.submit(scheduler, 'blocker', 'blocker')
+        for i in range(4):
+            self.submit(scheduler, 'gold', 'gold' + str(i))
+            self.submit(scheduler, 'bronze', 'bronze' + str(i))
+
+        while len(self.started) < 6:
+            self.started[-1][1].release()
+        self.assertEqual([name for name, _ in self.started[1:]], ['gold0', 'bronze0', 'gold1', 'gold2', 'bronze1'])
+
+    def test_max_concurrent_per_tenant(self):
+        scheduler = FairScheduler(max_concurrent=2)
+        jobs = [self.submit(scheduler, 'bulk', str(i)) for i in range(3)]
+        self.assertEqual(len(self.started), 2)
+        self.assertEqual(scheduler.stats()['bulk']['queued'], 1)
+
+        jobs[0].release()
+        self.assertEqual(len(self.started), 3)
+
+    def test_quota_rejects_and_is_released(self):
+        scheduler = FairScheduler(max_pending=1)
+        job = self.submit(scheduler, 'edmo', 'first')
+        self.assertRaises(QuotaExceeded, scheduler.admit, 'edmo')
+        self.assertEqual(scheduler.stats()['edmo']['rejected'], 1)
+
+        job.release()
+        job.release()
+        self.submit(scheduler, 'edmo', 'second')
+        self.assertEqual(scheduler.stats()['edmo']['pending'], 1)
+
+    def test_release_of_queued_job(self):
+        scheduler = FairScheduler(slots=1)
+        self.submit(scheduler, 'edmo', 'first')
+        queued = self.submit(scheduler, 'edmo', 'second')
+        queued.release()
+        self.started[0][1].release()
+        self.assertEqual(len(self.started), 1)
+        self.assertEqual(scheduler.stats(), {})
+
+    def test_idle_tenants_are_dropped(self):
+        scheduler = FairScheduler(slots=1)
+        for i in range(100):
+            self.submit(scheduler, 'tenant' + str(i), str(i)).release()
+        withdrawn = scheduler.admit('withdrawn')
+        self.assertTrue(withdrawn.withdraw())
+        self.assertEqual(scheduler.tenants, {})
+        # a tenant coming back is served as a new one
+        self.submit(scheduler, 'tenant0', 'again')
+        self.assertEqual(scheduler.stats()['tenant0']['admitted'], 1)
+
+    def test_withdraw_of_running_job(self):
+        scheduler = FairScheduler(slots=1)
+        running = self.submit(scheduler, 'edmo', 'first')
+        queued = self.submit(scheduler, 'edmo', 'second')
+        self.assertTrue(queued.withdraw())
+        self.assertFalse(running.withdraw())
+        self.assertEqual(scheduler.stats()['edmo']['pending'], 1)
+        running.release()
+        self.assertEqual(len(self.started), 1)
+
+    def test_burst_does_not_take_all_slots(self):
+        # each job creates a SO container on the cloud controller, as the lifecycles of ServiceBackend.create do
+        scheduler = FairScheduler(slots=4, max_concurrent=2)
+        lock = threading.Lock()
+        creating = []
+        created = []
+
+        def create(tenant, name):
+            job = scheduler.admit(tenant)
+
+            def container():
+                with lock:
+                    creating.append(name)
+                    peak[0] = max(peak[0], len(creating))
+                time.sleep(0.05)
+                with lock:
+                    creating.remove(name)
+                    created.append(name)
+                job.release()
+            job.run(lambda: threading.Thread(target=container).start())
+
+        peak = [0]
+        for i in range(20):
+            create('bulk', 'bulk' + str(i))
+        create('other', 'other')
+        until = time.time() + 5
+        while len(created) < 21 and time.time() < until:
+            time.sleep(0.01)
+        self.assertEqual(len(created), 21)
+        self.assertLessEqual(peak[0], 4)
+        # the other tenant's container is created alongside the first ones of the burst
+        self.assertLess(created.index('other'), 4)
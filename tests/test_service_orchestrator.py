@@ -0,0 +1,260 @@
+# Copyright 2014-2015 Zuercher Hochschule fuer Angewandte Wissenschaften
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+__author__ = 'andy'
+
+from Queue import Queue
+import unittest
+
+import requests
+
+from sm import sharing
+from sm.so import service_orchestrator as so
+from sm.so.plan import ExecutionPlan
+from tests.standin import StandInSM, serve
+
+SCHEME = 'http://schemas.mobile-cloud-networking.eu/occi/sm#'
+SHARED = [{SCHEME + 'maas': {'inputs': [], 'shared': True}},
+          {SCHEME + 'ran': {'inputs': [SCHEME + 'maas#mcn.endpoint.maas']}}]
+
+
+def design(sm_url, depends_on):
+    # the service manifest and graph of depends_on as designed by the Resolver, all types served by the stand-in SM
+    plan = ExecutionPlan({'service_type': SCHEME + 'compo', 'depends_on': depends_on})
+    stg = dict(plan.manifest)
+    stg['depends_on'] = plan.depends_on(dict((svc_type, sm_url + '/' + svc_type.split('#')[1] + '/')
+                                             for svc_type in plan.service_types))
+    return stg, plan.graph
+
+
+def initialiser(sm_url, depends_on, consumer=None, callback=None):
+    stg, graph = design(sm_url, depends_on)
+    return so.DeployInitialiser('edmo', 'token', stg, [], Queue(), callback=callback, graph=graph,
+                                consumer=consumer)
+
+
+class Callbacks(object):
+    # the phases reported to the SM, in place of a Callback
+
+    def __init__(self):
+        self.emitted = Queue()
+
+    def emit(self, phase, attributes=None):
+        self.emitted.put((phase, attributes))
+        return True
+
+
+class StandInTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.interval = so.POLL_INTERVAL
+        so.POLL_INTERVAL = 0.02
+        self.sm = StandInSM(deploy_time=0.05)
+        self.url = serve(self.sm)
+
+    def tearDown(self):
+        so.POLL_INTERVAL = self.interval
+
+    def instances(self, term):
+        return [instance for instance in self.sm.instances.values() if instance.term == term]
+
+    def deploy_task(self, term, shared=None):
+        dt = so.DeployTask({SCHEME + term: {'inputs': [], 'endpoint': self.url + '/' + term + '/'}}, Queue(),
+                           'edmo', 'token', {})
+        dt.shared = shared
+        return dt
+
+
+class TestPolledTasks(StandInTestCase):
+
+    def test_deploy_is_polled_until_ready(self):
+        self.sm.deploy_times['maas'] = 0.2
+        dt = self.deploy_task('maas')
+        dt.run()
+        self.assertGreater(len(self.sm.terms('GET')), 1)
+        self.assertEqual(dt.q.get_nowait(), dt.endpoints)
+        self.assertEqual(dt.endpoints[0]['type'], SCHEME + 'maas')
+        self.assertEqual(dt.endpoints[0]['attributes']['occi.mcn.stack.state'], 'CREATE_COMPLETE')
+        self.assertEqual(dt.endpoints[0]['attributes']['mcn.endpoint.maas'], self.instances('maas')[0].location)
+
+    def test_deploy_errors(self):
+        self.sm.failing.add('maas')
+        self.assertRaises(RuntimeError, self.deploy_task('maas').wait)
+        # the error of the request is passed to on_error
+        errors = Queue()
+        dt = so.DeployTask({SCHEME + 'maas': {'inputs': [], 'endpoint': self.url + '/maas'}}, Queue(), 'edmo',
+                           'token', {})
+        dt.start(on_ready=lambda: errors.put(None), on_error=errors.put)
+        self.assertIsInstance(errors.get(timeout=5), requests.HTTPError)
+        self.assertEqual(dt.endpoints, [])
+
+    def test_endpoint_is_looked_up_again_once_unreachable(self):
+        self.addCleanup(so.ENDPOINTS.forget, SCHEME + 'maas')
+        for endpoint, error in ((self.url + '/maas', requests.HTTPError),
+                                ('http://127.0.0.1:1/maas/', requests.ConnectionError)):
+            so.ENDPOINTS.update({SCHEME + 'maas': endpoint})
+            dt = so.DeployTask({SCHEME + 'maas': {'inputs': [], 'endpoint': endpoint}}, Queue(), 'edmo', 'token', {})
+            self.assertRaises(error, dt.request)
+            self.assertIsNone(so.ENDPOINTS.get(SCHEME + 'maas'))
+
+    def test_provision_waits_for_the_deploy(self):
+        self.sm.deploy_times['ran'] = 0.2
+        # the instance is created, but not deployed yet
+        location = self.deploy_task('ran').request()
+        pt = so.ProvisionTask('edmo', 'token', {'params': {'mcn.endpoint.maas': '10.0.0.1'}, 'inst_ep': location},
+                              Queue())
+        pt.run()
+        self.assertGreater(len(self.sm.terms('GET')), 1)
+        attributes = so.attr_string_to_dict(pt.q.get_nowait().headers['x-occi-attribute'])
+        self.assertEqual(attributes['mcn.endpoint.maas'], '10.0.0.1')
+        self.assertEqual(attributes['mcn.service.state'], 'provision')
+
+    def test_provision_errors(self):
+        self.sm.failing.add('ran')
+        location = self.deploy_task('ran').request()
+        pt = so.ProvisionTask('edmo', 'token', {'params': {}, 'inst_ep': location}, Queue())
+        self.assertRaises(RuntimeError, pt.wait)
+        pt = so.ProvisionTask('edmo', 'token', {'params': {}, 'inst_ep': location + '0'}, Queue())
+        self.assertRaises(requests.HTTPError, pt.wait)
+
+    def test_destroy_keeps_a_shared_instance_for_its_other_consumers(self):
+        first = self.deploy_task('maas', shared=(SCHEME + 'maas', 'first'))
+        second = self.deploy_task('maas', shared=(SCHEME + 'maas', 'second'))
+        first.wait()
+        second.wait()
+        self.assertEqual(first.endpoints[0]['location'], second.endpoints[0]['location'])
+        first.destroy()
+        self.assertEqual(sharing.consumers(self.instances('maas')[0]), ['second'])
+        second.destroy()
+        self.assertEqual(self.sm.instances, {})
+        # an instance destroyed already is not an error
+        second.destroy()
+        self.assertEqual(self.sm.terms('DELETE'), ['maas', 'maas'])
+
+
+class TestDeployInitialiser(StandInTestCase):
+
+    def test_deploy_is_reported(self):
+        callbacks = Callbacks()
+        di = initialiser(self.url, SHARED, callback=callbacks)
+        di.start()
+        self.assertTrue(di.deploy_done_q.get(timeout=5))
+        self.assertEqual(callbacks.emitted.get(timeout=5), ('deploy', None))
+        self.assertEqual(sorted(endpoints[0]['type'] for endpoints in di.service_inst_endpoints),
+                         [SCHEME + 'maas', SCHEME + 'ran'])
+
+    def test_failed_dependency_is_reported(self):
+        self.sm.failing.add('ran')
+        callbacks = Callbacks()
+        di = initialiser(self.url, SHARED, callback=callbacks)
+        di.start()
+        # the provisioning waiting for the deployment is told it failed
+        self.assertFalse(di.deploy_done_q.get(timeout=5))
+        self.assertEqual(callbacks.emitted.get(timeout=5), ('deploy', {'occi.mcn.stack.state': 'CREATE_FAILED'}))
+        di.join(5)
+        self.assertFalse(di.is_alive())
+
+    def test_update(self):
+        di = initialiser(self.url, [{SCHEME + 'maas': {'inputs': []}},
+                                    {SCHEME + 'ran': {'inputs': [SCHEME + 'maas#mcn.endpoint.maas']}},
+                                    {SCHEME + 'dnsaas': {'inputs': []}},
+                                    {SCHEME + 'epc': {'inputs': [SCHEME + 'dnsaas#mcn.endpoint.dnsaas']}}])
+        di.deploy()
+        locations = dict((svc_type, di.composition.location(svc_type)) for svc_type in di.graph.services)
+        # maas and ran are scaled out, dnsaas is removed and epc takes its input from maas instead
+        stg, graph = design(self.url, [{SCHEME + 'maas': {'inputs': [], 'instances': 2}},
+                                       {SCHEME + 'ran': {'inputs': [SCHEME + 'maas#mcn.endpoint.maas'],
+                                                         'instances': 2}},
+                                       {SCHEME + 'epc': {'inputs': [SCHEME + 'maas#mcn.endpoint.maas']}}])
+        changes = di.update(graph, stg)
+        self.assertEqual(changes, {'added': [SCHEME + 'maas[1]', SCHEME + 'ran[1]'], 'removed': [SCHEME + 'dnsaas'],
+                                   'reprovisioned': [SCHEME + 'epc']})
+        # the instances kept are neither created nor deleted again
+        for svc_type in (SCHEME + 'maas', SCHEME + 'ran', SCHEME + 'epc'):
+            self.assertEqual(di.composition.location(svc_type), locations[svc_type])
+        self.assertEqual(self.sm.count, 6)
+        self.assertEqual(self.sm.terms('DELETE'), ['dnsaas'])
+        self.assertEqual(sorted(instance.term for instance in self.sm.instances.values()),
+                         ['epc', 'maas', 'maas', 'ran', 'ran'])
+        # epc was provisioned with the input of its new producer
+        epc = self.instances('epc')[0]
+        self.assertEqual(self.url + epc.attributes['mcn.endpoint.maas'], locations[SCHEME + 'maas'])
+
+
+class TestProvisionInitialiser(unittest.TestCase):
+
+    def provision(self, deployed):
+        callbacks = Callbacks()
+        deploy_done_q = Queue()
+        pi = so.ProvisionInitialiser('edmo', 'token', {}, [], deploy_done_q, Queue(), callback=callbacks)
+        pi.start()
+        deploy_done_q.put(deployed)
+        pi.join(5)
+        self.assertFalse(pi.is_alive())
+        return pi.provision_done_q.get_nowait(), callbacks.emitted
+
+    def test_provisioned_once_deployed(self):
+        provisioned, emitted = self.provision(True)
+        self.assertTrue(provisioned)
+        self.assertEqual(emitted.get_nowait(), ('provision', None))
+
+    def test_not_provisioned_if_the_deploy_failed(self):
+        provisioned, emitted = self.provision(False)
+        self.assertFalse(provisioned)
+        # the failure was reported with the deploy phase
+        self.assertTrue(emitted.empty())
+
+
+class TestSharedInstances(StandInTestCase):
+
+    def test_shared_instance_is_deleted_with_its_last_composition(self):
+        first = initialiser(self.url, SHARED, consumer='first')
+        second = initialiser(self.url, SHARED, consumer='second')
+        first.deploy()
+        second.deploy()
+        # one maas for both compositions, each with a ran of its own
+        self.assertEqual(first.composition.location(SCHEME + 'maas'), second.composition.location(SCHEME + 'maas'))
+        self.assertEqual(len(self.instances('maas')), 1)
+        self.assertEqual(len(self.instances('ran')), 2)
+        self.assertEqual(sharing.consumers(self.instances('maas')[0]), ['first', 'second'])
+
+        first.dispose()
+        self.assertEqual(len(self.instances('maas')), 1)
+        self.assertEqual(len(self.instances('ran')), 1)
+        self.assertEqual(sharing.consumers(self.instances('maas')[0]), ['second'])
+
+        second.dispose()
+        self.assertEqual(self.sm.instances, {})
+        self.assertEqual(sorted(self.sm.terms('DELETE')), ['maas', 'maas', 'ran', 'ran'])
+
+    def test_failed_shared_instance_is_not_handed_out(self):
+        first = initialiser(self.url, SHARED, consumer='first')
+        first.deploy()
+        self.sm.failing.add(self.instances('maas')[0].location)
+        # the health check of the SM sees the failed stack, a new maas is created for the next composition
+        self.sm.state(self.instances('maas')[0])
+        second = initialiser(self.url, SHARED, consumer='second')
+        second.deploy()
+        self.assertNotEqual(first.composition.location(SCHEME + 'maas'),
+                            second.composition.location(SCHEME + 'maas'))
+        self.assertEqual(len(self.instances('maas')), 2)
+
+        first.dispose()
+        second.dispose()
+        self.assertEqual(self.sm.instances, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+# Copyright 2014-2015 Zuercher Hochschule fuer Angewandte Wissenschaften
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+__author__ = 'andy'
+
+import json
+import os
+import tempfile
+import unittest
+
+if 'SM_CONFIG_PATH' not in os.environ:
+    raise AttributeError('Please provide SM_CONFIG_PATH as env var.')
+
+from sm.managers.generic import ServiceParameters
+
+PARAMS = {
+    'initialise': [{'name': 'initialise.integer', 'type': 'number', 'value': 1}],
+    'deploy': [{'name': 'deploy.string', 'type': 'string', 'value': 'value'},
+               {'name': 'deploy.float', 'type': 'number', 'value': 0.5}]
+}
+
+
+class TestServiceParameters(unittest.TestCase):
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp()
+        with os.fdopen(handle, 'w') as params:
+            json.dump(PARAMS, params)
+        self.params = ServiceParameters(self.path)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_header_per_phase(self):
+        self.assertEqual(self.params.service_parameters('deploy'), 'deploy.string="value", deploy.float=0.5')
+        self.assertEqual(self.params.service_parameters('provision'), '')
+
+    def test_client_params_are_scoped_to_the_instance(self):
+        first = self.params.for_instance({'size': '2'})
+        second = self.params.for_instance({'name': '"edmo"'})
+        self.assertEqual(first.service_parameters('initialise'), 'initialise.integer=1, size=2')
+        self.assertEqual(second.service_parameters('initialise'), 'initialise.integer=1, name="edmo"')
+        self.assertEqual(self.params.service_parameters('initialise'), 'initialise.integer=1')
+
+    def test_header_is_constant_across_calls(self):
+        instance = self.params.for_instance({'size': '2'})
+        header = instance.service_parameters('deploy')
+        sizes = [len(phase) for phase in self.params.phases.values()]
+        for _ in range(10000):
+            self.assertEqual(instance.service_parameters('deploy'), header)
+            self.params.for_instance({'size': '3'}).service_parameters('deploy')
+        self.assertEqual(len(header), len('deploy.string="value", deploy.float=0.5, size=2'))
+        self.assertEqual([len(phase) for phase in self.params.phases.values()], sizes)
+        self.assertEqual(instance.client, ('size=2',))
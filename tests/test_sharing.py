@@ -0,0 +1,51 @@
+# Copyright 2014-2015 Zuercher Hochschule fuer Angewandte Wissenschaften
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+__author__ = 'andy'
+
+import unittest
+
+from occi.core_model import Kind, Resource
+
+from sm import sharing
+
+KIND = Kind('http://schemas.mobile-cloud-networking.eu/occi/sm#', 'maas', location='/maas/')
+
+
+class TestSharing(unittest.TestCase):
+
+    def test_found_by_key_until_failed(self):
+        plain = Resource('/maas/1', KIND, [])
+        shared = Resource('/maas/2', KIND, [])
+        sharing.share(shared, 'maas', 'a')
+        self.assertIs(sharing.find([plain, shared], 'maas'), shared)
+        self.assertIsNone(sharing.find([plain, shared], 'maas[1]'))
+        shared.attributes['occi.mcn.stack.state'] = 'CREATE_FAILED'
+        self.assertIsNone(sharing.find([plain, shared], 'maas'))
+
+    def test_released_by_the_last_consumer(self):
+        entity = Resource('/maas/1', KIND, [])
+        sharing.share(entity, 'maas', 'a')
+        sharing.share(entity, 'maas', 'b')
+        sharing.share(entity, 'maas', 'b')
+        self.assertEqual(sharing.consumers(entity), ['a', 'b'])
+        self.assertEqual(sharing.release(entity, 'a'), 1)
+        self.assertEqual(sharing.release(entity, 'a'), 1)
+        self.assertEqual(sharing.release(entity, 'b'), 0)
+        self.assertEqual(sharing.environ_key(sharing.CONSUMER_HEADER), 'HTTP_X_SHARED_CONSUMER')
+
+
+if __name__ == '__main__':
+    unittest.main()
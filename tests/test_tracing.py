@@ -0,0 +1,74 @@
+# Copyright 2014-2015 Zuercher Hochschule fuer Angewandte Wissenschaften
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+__author__ = 'andy'
+
+import json
+import os
+import tempfile
+import unittest
+
+from sm.tracing import FileExporter, MemoryExporter, Tracer, parse_traceparent
+
+PARENT = '00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01'
+
+
+class TestTracer(unittest.TestCase):
+
+    def setUp(self):
+        self.exporter = MemoryExporter()
+        self.tracer = Tracer(self.exporter)
+
+    def test_parse_traceparent(self):
+        self.assertEqual(parse_traceparent(PARENT), ('0af7651916cd43dd8448eb211c80319c', 'b7ad6b7169203331'))
+        self.assertIsNone(parse_traceparent('00-xyz-b7ad6b7169203331-01'))
+        self.assertIsNone(parse_traceparent(None))
+
+    def test_spans_continue_the_incoming_trace(self):
+        with self.tracer.span('lifecycle', parent=PARENT) as root:
+            with self.tracer.span('deploy') as child:
+                headers = self.tracer.inject({'X-Auth-Token': 'token'})
+        self.assertEqual(root.trace_id, '0af7651916cd43dd8448eb211c80319c')
+        self.assertEqual(root.parent_id, 'b7ad6b7169203331')
+        self.assertEqual(child.trace_id, root.trace_id)
+        self.assertEqual(child.parent_id, root.span_id)
+        self.assertEqual(headers, {'X-Auth-Token': 'token', 'traceparent': child.traceparent()})
+        self.assertEqual([span['name'] for span in self.exporter.spans(root.trace_id)], ['deploy', 'lifecycle'])
+        self.assertIsNone(self.tracer.current())
+
+    def test_failed_block_marks_span(self):
+        def fail():
+            with self.tracer.span('provision'):
+                raise ValueError('boom')
+        self.assertRaises(ValueError, fail)
+        span = self.exporter.spans()[0]
+        self.assertEqual(span['status'], 'error')
+        self.assertIn('boom', span['attributes']['error'])
+
+    def test_file_exporter(self):
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            tracer = Tracer(FileExporter(path))
+            span = tracer.start_span('deploy', attributes={'service': 'epc'})
+            span.finish()
+            span.finish('error')
+            with open(path) as spans:
+                lines = spans.readlines()
+            self.assertEqual(len(lines), 1)
+            self.assertEqual(json.loads(lines[0])['attributes'], {'service': 'epc'})
+            self.assertEqual(json.loads(lines[0])['status'], 'ok')
+        finally:
+            os.remove(path)
@@ -0,0 +1,55 @@
+# Copyright 2014-2015 Zuercher Hochschule fuer Angewandte Wissenschaften
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+__author__ = 'andy'
+
+import unittest
+
+from occi.core_model import Kind, Link, Resource
+
+from sm.versions import ResourceVersions, matches
+
+KIND = Kind('http://schemas.mobile-cloud-networking.eu/occi/sm#', 'epc', location='/epc/')
+
+
+class TestVersions(unittest.TestCase):
+
+    def setUp(self):
+        self.versions = ResourceVersions()
+        self.entity = Resource('/epc/1', KIND, [])
+        self.entity.attributes['mcn.service.state'] = 'deploy'
+
+    def test_version_changes_with_attributes_and_links(self):
+        etag = self.versions.etag('/epc/1', self.entity)
+        self.assertEqual(self.versions.etag('/epc/1', self.entity), etag)
+
+        self.entity.attributes['mcn.service.state'] = 'provision'
+        changed = self.versions.etag('/epc/1', self.entity)
+        self.assertNotEqual(changed, etag)
+
+        target = Resource('/ims/2', Resource.kind, [])
+        self.entity.links.append(Link('/link/1', Link.kind, [], self.entity, target))
+        self.assertNotEqual(self.versions.etag('/epc/1', self.entity), changed)
+        self.assertEqual(self.versions.version('/epc/1', self.entity), 3)
+
+    def test_tags_differ_across_runs(self):
+        self.assertNotEqual(ResourceVersions().etag('/epc/1', self.entity), self.versions.etag('/epc/1', self.entity))
+
+    def test_if_none_match(self):
+        etag = self.versions.etag('/epc/1', self.entity)
+        self.assertTrue(matches(etag, etag))
+        self.assertTrue(matches('"other", W/' + etag, etag))
+        self.assertTrue(matches('*', etag))
+        self.assertFalse(matches('"other"', etag))
@@ -0,0 +1,95 @@
+# Copyright 2014-2015 Zuercher Hochschule fuer Angewandte Wissenschaften
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+__author__ = 'andy'
+
+import json
+import threading
+import time
+
+from occi.core_model import Kind, Resource
+from occi.exceptions import HTTPError
+from occi.registry import NonePersistentRegistry
+from tornado import web
+from tornado.testing import AsyncHTTPTestCase
+
+from sm.versions import ResourceVersions
+from sm.watch import WATCH_PATH, WatchHandler, Watchers
+
+KIND = Kind('http://schemas.mobile-cloud-networking.eu/occi/sm#', 'epc', location='/epc/')
+
+
+class App(object):
+
+    def __init__(self):
+        self.registry = NonePersistentRegistry()
+        self.versions = ResourceVersions()
+
+    def authenticate(self, token, tenant):
+        self.authenticated_on = threading.current_thread()
+        if token != 'token':
+            raise HTTPError(401, 'Token is not valid.')
+
+
+class TestWatch(AsyncHTTPTestCase):
+
+    def get_app(self):
+        self.sm = App()
+        self.watchers = Watchers()
+        self.entity = Resource('/epc/1', KIND, [])
+        self.entity.attributes['mcn.service.state'] = 'deploy'
+        self.sm.registry.add_resource(self.entity.identifier, self.entity, None)
+        return web.Application([(WATCH_PATH + '(/.*)', WatchHandler, {'app': self.sm, 'max_wait': 5,
+                                                                      'watchers': self.watchers})])
+
+    def watch(self, etag=None, wait=5, token='token'):
+        headers = {'X-Auth-Token': token, 'X-Tenant-Name': 'edmo'}
+        if etag is not None:
+            headers['If-None-Match'] = etag
+        return self.fetch(WATCH_PATH + '/epc/1?wait=' + str(wait), headers=headers)
+
+    def test_answers_right_away_without_etag(self):
+        response = self.watch()
+        self.assertEqual(response.code, 200)
+        self.assertEqual(json.loads(response.body)['attributes']['mcn.service.state'], 'deploy')
+        self.assertEqual(self.watch(token='wrong').code, 401)
+
+    def test_answers_once_changed(self):
+        etag = self.watch().headers['ETag']
+
+        def provision():
+            self.entity.attributes['mcn.service.state'] = 'provision'
+            self.watchers.notify('/epc/1')
+        threading.Timer(0.2, provision).start()
+
+        started = time.time()
+        response = self.watch(etag)
+        self.assertEqual(response.code, 200)
+        self.assertLess(time.time() - started, 4)
+        self.assertEqual(json.loads(response.body)['attributes']['mcn.service.state'], 'provision')
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertEqual(self.watchers.count(), 0)
+
+    def test_not_modified_after_wait(self):
+        etag = self.watch().headers['ETag']
+        # a notification without a change keeps the request waiting
+        threading.Timer(0.1, self.watchers.notify, ['/epc/1']).start()
+        response = self.watch(etag, wait=0.3)
+        self.assertEqual(response.code, 304)
+        self.assertEqual(self.watchers.count(), 0)
+
+    def test_keystone_is_not_asked_on_the_ioloop(self):
+        self.assertEqual(self.watch().code, 200)
+        self.assertNotEqual(self.sm.authenticated_on, threading.current_thread())